@@ -0,0 +1,269 @@
+# Copyright 2018 PayTrace, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Throughput benchmarks for computing case keys
+
+Run from the project root (with the package installed, e.g. via
+``pip install -r Development``)::
+    
+    python bench/hashing.py                 # compare against the baseline
+    python bench/hashing.py --save-baseline # record a new baseline
+
+Each benchmark hashes a set of synthetic test cases (see
+:func:`synthetic_cases`) and reports cases per second and, from a separate
+pass traced by :mod:`tracemalloc`, the memory allocated per case (see
+:func:`measure`).  Results are compared with those stored in the baseline
+file (``bench/baseline.json`` by default), which is specific to the
+machine on which it was recorded and so is not committed;
+a benchmark more than ``--tolerance`` slower than its baseline is reported
+as a regression and makes the script exit with a non-zero status.
+
+``--write-golden PATH`` writes golden key vectors (the fields, their DER
+encoding from the :mod:`pyasn1` reference encoder, and the keys in each
+case key scheme) for validating alternative encoders; the vectors in
+``test/golden_case_keys.json`` were produced this way.
+"""
+
+import argparse
+import json
+import os.path
+import random
+import string
+import sys
+import time
+import tracemalloc
+from intercom_test import cases, framework
+from intercom_test.json_asn1 import convert
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# Shapes of synthetic request bodies: (name, depth, width, string size, numeric types)
+SHAPES = [
+    ('flat-small', 1, 4, 8, ('int',)),
+    ('flat-wide', 1, 64, 16, ('int', 'float')),
+    ('nested', 4, 4, 16, ('int', 'float', 'bool')),
+    ('long-strings', 2, 4, 1024, ('int',)),
+    ('float-heavy', 2, 16, 4, ('float',)),
+]
+
+class HTTPBenchAugmenter(framework.CaseAugmenter):
+    CASE_PRIMARY_KEYS = framework.HTTPCaseAugmenter.CASE_PRIMARY_KEYS
+
+def synthetic_value(rng, depth, width, string_size, numeric_types):
+    """Generate a JSON-ic value of the given shape"""
+    if depth <= 0:
+        kind = rng.choice(('str', 'null') + tuple(numeric_types))
+        if kind == 'str':
+            return ''.join(rng.choice(string.ascii_letters) for _ in range(string_size))
+        elif kind == 'int':
+            return rng.randint(-10 ** 9, 10 ** 9)
+        elif kind == 'float':
+            return round(rng.uniform(-1e6, 1e6), rng.randint(0, 6))
+        elif kind == 'bool':
+            return rng.random() < 0.5
+        return None
+    
+    if rng.random() < 0.25:
+        return [
+            synthetic_value(rng, depth - 1, width, string_size, numeric_types)
+            for _ in range(width)
+        ]
+    return dict(
+        (
+            'field{}'.format(i),
+            synthetic_value(rng, depth - 1, width, string_size, numeric_types),
+        )
+        for i in range(width)
+    )
+
+def synthetic_cases(count, depth, width, string_size, numeric_types, *, seed=0):
+    """Generate *count* HTTP test cases with request bodies of the given shape"""
+    rng = random.Random(seed)
+    return [
+        {
+            'url': '/widgets/{}'.format(i),
+            'method': rng.choice(('get', 'post', 'put')),
+            'request body': synthetic_value(rng, depth, width, string_size, numeric_types),
+            'response status': 200,
+        }
+        for i in range(count)
+    ]
+
+def key_fields_of(test_case):
+    return dict(
+        (k, v) for k, v in test_case.items()
+        if k in HTTPBenchAugmenter.CASE_PRIMARY_KEYS
+    )
+
+BENCHMARKS = {
+    'asn1_der': lambda test_case: convert.asn1_der(key_fields_of(test_case)),
+    'hash_from_fields': lambda test_case: cases.hash_from_fields(key_fields_of(test_case)),
+    'hash_from_fields[blake2b-json]': lambda test_case: cases.hash_from_fields(
+        key_fields_of(test_case),
+        scheme=cases.BLAKE2_JSON_KEY_SCHEME,
+    ),
+    'key_of_case': HTTPBenchAugmenter.key_of_case,
+}
+
+def measure(fn, test_cases, *, min_time):
+    """Measure the throughput and traced memory of *fn* over *test_cases*
+    
+    :returns:
+        :class:`dict` with ``cases_per_sec`` and ``bytes_per_case``, the
+        mean over the cases of the peak memory traced while hashing each
+        case (above that traced before it)
+    """
+    for test_case in test_cases[:10]:
+        fn(test_case)
+    
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        for test_case in test_cases:
+            fn(test_case)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+    
+    allocated = 0
+    tracemalloc.start()
+    try:
+        for test_case in test_cases:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            fn(test_case)
+            allocated += tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    
+    return {
+        'cases_per_sec': rounds * len(test_cases) / elapsed,
+        'bytes_per_case': allocated / len(test_cases),
+    }
+
+def run_benchmarks(*, count, min_time, selected=None):
+    results = {}
+    for shape_name, depth, width, string_size, numeric_types in SHAPES:
+        test_cases = synthetic_cases(count, depth, width, string_size, numeric_types)
+        for bench_name, fn in BENCHMARKS.items():
+            name = '{}/{}'.format(bench_name, shape_name)
+            if selected and not any(s in name for s in selected):
+                continue
+            results[name] = measure(fn, test_cases, min_time=min_time)
+    return results
+
+def report(results, baseline, *, tolerance):
+    """Print *results* compared with *baseline*; return names of regressions"""
+    regressions = []
+    print("{:48} {:>12} {:>10} {:>12}".format("benchmark", "cases/sec", "vs. base", "B/case"))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            change = ''
+        else:
+            ratio = result['cases_per_sec'] / base['cases_per_sec']
+            change = "{:+.1%}".format(ratio - 1)
+            if ratio < 1 - tolerance:
+                regressions.append(name)
+                change += ' !'
+        print("{:48} {:12.0f} {:>10} {:12.0f}".format(
+            name,
+            result['cases_per_sec'],
+            change,
+            result['bytes_per_case'],
+        ))
+    return regressions
+
+def golden_vectors(*, seed=20181021):
+    """Build golden key vectors with the :mod:`pyasn1` reference encoder"""
+    fixed = [
+        {},
+        {'url': '/foo', 'method': 'get'},
+        {'url': '/widgets', 'method': 'post', 'request body': {
+            'name': 'sprocket', 'count': 3, 'price': 1.25, 'tags': ['a', 'b'],
+            'active': True, 'owner': None, 'ratio': 2.0, 'offset': -0.001,
+        }},
+        {'url': '/unicode', 'method': 'put', 'request body': 'café ☃'},
+        {'url': '/long', 'method': 'post', 'request body': 'x' * 300},
+        # Numbers written differently by Python and ECMAScript (RFC 8785)
+        {'url': '/numbers', 'method': 'post', 'request body': [
+            1e-7, 1.5e-6, 1e-27, 0.002, 4.5, 333333333.3333333,
+            1.2345678901234568e+20, 1e21, 1e30, 1.5e300, 5e-324,
+            2 ** 53, -2 ** 53, 2.0 ** 60,
+        ]},
+        # Keys sorted differently by UTF-16 code units and code points
+        {'url': '/keys', 'method': 'post', 'request body': {
+            '\u20ac': 'Euro Sign', '\r': 'Carriage Return',
+            '\ufb33': 'Hebrew Letter Dalet With Dagesh', '1': 'One',
+            '\U0001f600': 'Emoji: Grinning Face', '\u0080': 'Control',
+            '\u00f6': 'Latin Small Letter O With Diaeresis',
+        }},
+    ]
+    generated = [
+        key_fields_of(test_case)
+        for shape_name, depth, width, string_size, numeric_types in SHAPES
+        for test_case in synthetic_cases(2, depth, min(width, 8), min(string_size, 32), numeric_types, seed=seed)
+    ]
+    vectors = []
+    for fields in fixed + generated:
+        der = convert.pyasn1_der(fields)
+        vectors.append({
+            'fields': fields,
+            'der': der.hex(),
+            'keys': {
+                cases.JSON_ASN1_KEY_SCHEME: cases.hash_from_der(der),
+                cases.BLAKE2_JSON_KEY_SCHEME: cases.hash_from_canonical_json(fields),
+            },
+        })
+    return vectors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=200, help="cases per shape")
+    parser.add_argument('--min-time', type=float, default=0.5, help="minimum seconds per benchmark")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed fractional slowdown")
+    parser.add_argument('--write-golden', metavar='PATH', help="write golden key vectors to PATH and exit")
+    parser.add_argument('selected', nargs='*', help="only run benchmarks with names containing these")
+    args = parser.parse_args(argv)
+    
+    if args.write_golden:
+        with open(args.write_golden, 'w') as outfile:
+            json.dump(golden_vectors(), outfile, indent=1, ensure_ascii=False)
+            outfile.write("\n")
+        return 0
+    
+    try:
+        with open(args.baseline) as infile:
+            baseline = json.load(infile)
+    except FileNotFoundError:
+        baseline = {}
+    
+    results = run_benchmarks(count=args.count, min_time=args.min_time, selected=args.selected)
+    regressions = report(results, baseline, tolerance=args.tolerance)
+    
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as outfile:
+            json.dump(baseline, outfile, indent=2, sort_keys=True)
+            outfile.write("\n")
+    elif regressions:
+        print("\n{} benchmark(s) slower than baseline".format(len(regressions)), file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
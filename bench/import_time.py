@@ -0,0 +1,68 @@
+# Copyright 2018 PayTrace, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Import time benchmark for the package and its main modules
+
+Run from the project root (with the package installed, e.g. via
+``pip install -r Development``)::
+    
+    python bench/import_time.py
+    python bench/import_time.py -r 21 intercom_test intercom_test.framework
+
+Each module is imported in a fresh interpreter with ``python -X importtime``
+(after one import to make sure its bytecode is cached), and the median of
+the cumulative import times reported for the module over the runs is
+printed.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = (
+    'intercom_test',
+    'intercom_test.framework',
+    'intercom_test.http_best_matches',
+)
+
+def import_time_us(module_name):
+    """Get the cumulative time (in microseconds) to import *module_name*"""
+    report = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+    for line in report.splitlines():
+        fields = line.split('|')
+        if len(fields) == 3 and fields[2].strip() == module_name:
+            return int(fields[1])
+    raise ValueError("no import time reported for {}".format(module_name))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-r', '--runs', type=int, default=11, help="imports of each module")
+    parser.add_argument('modules', nargs='*', default=MODULES, help="modules to import")
+    args = parser.parse_args(argv)
+    
+    print("{:40} {:>14}".format("module", "median µs"))
+    for module_name in args.modules:
+        subprocess.run([sys.executable, '-c', 'import ' + module_name], check=True)
+        times = [import_time_us(module_name) for _ in range(args.runs)]
+        print("{:40} {:14,d}".format(module_name, int(statistics.median(times))))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
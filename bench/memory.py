@@ -0,0 +1,123 @@
+# Copyright 2018 PayTrace, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Memory benchmark for pooling the strings of loaded test cases
+
+Run from the project root (with the package installed, e.g. via
+``pip install -r Development``)::
+    
+    python bench/memory.py              # 100,000 synthetic cases
+    python bench/memory.py -n 10000
+
+A synthetic corpus of HTTP test cases (see :func:`synthetic_corpus`) is
+built with each case decoded separately, so that -- as when loaded from
+YAML -- no strings are shared between cases.  The memory traced (by
+:mod:`tracemalloc`) for the corpus and the number of memory blocks
+allocated for it (by Python's object allocator; see
+:func:`sys.getallocatedblocks`), in total and per case, are reported before
+and after its strings are deduplicated with a
+:class:`intercom_test.utils.StringPool`, including the memory of the pool
+itself.
+"""
+
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from intercom_test.utils import StringPool
+
+METHODS = ('get', 'post', 'put', 'delete')
+HEADERS = ('Accept', 'Content-Type', 'Authorization', 'X-Request-Id')
+RESOURCES = ('widgets', 'gadgets', 'sprockets', 'customers', 'orders')
+
+def synthetic_case(rng, i):
+    resource = rng.choice(RESOURCES)
+    return {
+        'description': "{} of {} {}".format(rng.choice(('Listing', 'Creating', 'Updating')), resource, i),
+        'url': '/{}/{}'.format(resource, rng.randrange(200)),
+        'method': rng.choice(METHODS),
+        'request headers': dict((name, 'application/json') for name in HEADERS[:rng.randint(1, 4)]),
+        'request type': 'json',
+        'request body': {
+            'name': resource[:-1],
+            'count': rng.randrange(10),
+            'active': rng.random() < 0.5,
+            'tags': rng.sample(RESOURCES, 2),
+        },
+        'response status': rng.choice((200, 201, 404)),
+        'response type': 'json',
+        'response body': [
+            {'id': rng.randrange(1000), 'name': resource[:-1], 'status': 'active'}
+            for _ in range(rng.randint(0, 3))
+        ],
+    }
+
+def synthetic_corpus(count, *, seed=0):
+    """Generate *count* HTTP test cases sharing no :class:`str` objects"""
+    rng = random.Random(seed)
+    return [
+        json.loads(json.dumps(synthetic_case(rng, i)))
+        for i in range(count)
+    ]
+
+def allocation():
+    """Get the traced size and the number of allocated blocks of live memory"""
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0], sys.getallocatedblocks()
+
+def allocation_since(start):
+    return tuple(now - then for now, then in zip(allocation(), start))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--count', type=int, default=100000, help="number of cases")
+    parser.add_argument('--max-length', type=int, help="longest string to pool")
+    args = parser.parse_args(argv)
+    
+    tracemalloc.start()
+    try:
+        start = allocation()
+        corpus = synthetic_corpus(args.count)
+        loaded = allocation_since(start)
+        
+        pool = StringPool(max_length=args.max_length)
+        start_time = time.perf_counter()
+        for test_case in corpus:
+            pool.intern_strings(test_case)
+        elapsed = time.perf_counter() - start_time
+        pooled = allocation_since(start)
+    finally:
+        tracemalloc.stop()
+    
+    print("{:24} {:>14} {:>12} {:>12} {:>12}".format("", "traced bytes", "bytes/case", "blocks", "blocks/case"))
+    for name, (size, blocks) in (("loaded", loaded), ("pooled (with pool)", pooled)):
+        print("{:24} {:14,d} {:12.0f} {:12,d} {:12.1f}".format(
+            name,
+            size,
+            size / args.count,
+            blocks,
+            blocks / args.count,
+        ))
+    print("\n{:.1%} reduction; {:,d} distinct strings pooled in {:.2f} s (traced)".format(
+        1 - pooled[0] / loaded[0],
+        len(pool),
+        elapsed,
+    ))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,13 +23,35 @@ imported into the base namespace of this package for ease of use.
 
 For cross-language compatibility, the ASN1 source for encoding JSON values is
 available from this module as :const:`JSON_ASN1_SOURCE`.
+
+The names imported from other modules are loaded on first access, so that
+importing this package (e.g. for :mod:`.foreign` or the ``icy-test``
+command) does not import :mod:`.framework` and its dependencies until they
+are needed.
 """
 
-from .framework import (
-    InterfaceCaseProvider,
-    CaseAugmenter,
-    HTTPCaseAugmenter,
-    RPCCaseAugmenter,
-)
-from .json_asn1.types import ASN1_SOURCE as JSON_ASN1_SOURCE
-from .version import __version__
+import importlib
+
+# Public name -> (module relative to this package, attribute name)
+_LAZY_ATTRIBUTES = {
+    '__version__': ('.version', '__version__'),
+    'InterfaceCaseProvider': ('.framework', 'InterfaceCaseProvider'),
+    'CaseAugmenter': ('.framework', 'CaseAugmenter'),
+    'HTTPCaseAugmenter': ('.framework', 'HTTPCaseAugmenter'),
+    'RPCCaseAugmenter': ('.framework', 'RPCCaseAugmenter'),
+    'JSON_ASN1_SOURCE': ('.json_asn1.types', 'ASN1_SOURCE'),
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+def __getattr__(name):
+    try:
+        module_name, attr_name = _LAZY_ATTRIBUTES[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name)) from None
+    value = getattr(importlib.import_module(module_name, __name__), attr_name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES))
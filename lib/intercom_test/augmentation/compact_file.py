@@ -16,17 +16,30 @@ import enum
 from io import StringIO
 import itertools
 import json
+import mmap
 import os.path
+import re
 import yaml
-from ..cases import hash_from_fields as _hash_from_fields
+from ..cases import (
+    JSON_ASN1_KEY_SCHEME,
+    hash_from_fields as _hash_from_fields,
+)
 from ..exceptions import DataParseError
 from ..utils import def_enum
 from ..yaml_tools import (
     content_events as _yaml_content_events,
+    file_positions as _file_positions,
     value_from_event_stream as _yaml_value_from_events,
     get_load_fn as _get_yaml_loader,
+    node_events as _yaml_node_events,
+    parse as _yaml_parse,
 )
 
+# A comment line starting with this prefix in the leading comments of a compact
+# file names the case key scheme (see cases.KEY_SCHEMES) of the file; files
+# without one use cases.JSON_ASN1_KEY_SCHEME
+KEY_SCHEME_HEADER_PREFIX = '# intercom_test case-key-scheme: '
+
 class CaseIndexer:
     """Collector of case keys and their "jump indexes" in a compact file
     
@@ -109,7 +122,7 @@ class DataValueReader:
         if safe_loading is not None and safe_loading is not self.safe_loading:
             self.safe_loading = safe_loading
         stream.seek(start_byte)
-        self._events = yaml.parse(stream)
+        self._events = _yaml_parse(stream)
         next(self._events) # should be yaml.StreamStartEvent
         next(self._events) # should be yaml.DocumentStartEvent
         assert isinstance(next(self._events), yaml.MappingStartEvent)
@@ -148,14 +161,181 @@ class DataValueReader:
             if depth >= 0:
                 yield event
 
-def case_keys(data_file):
-    reader = CaseIndexer()
+def read_entries(stream, case_keys, *, start_byte=0, safe_loading=True):
+    """Read the augmentation data of many cases in one parse of a compact file
+    
+    :param stream: text stream of a compact file
+    :param case_keys: keys of the cases whose entries are to be read
+    :keyword start_byte:
+        byte offset of an entry in *stream* at or before the first entry to
+        read (as from :func:`case_keys`)
+    :returns:
+        generator of ``(case_key, data)`` pairs in file order, where *data*
+        is a :class:`dict` of the augmentation data of the case
+    
+    Entries for other cases are skipped without being constructed, and
+    parsing stops once the entries for all of *case_keys* have been read.
+    """
+    pending = set(case_keys)
+    stream.seek(start_byte)
+    events = _yaml_parse(stream)
+    for event in events:
+        if isinstance(event, yaml.MappingStartEvent):
+            break
+    else:
+        return
+    while pending:
+        key_event = next(events)
+        if isinstance(key_event, yaml.MappingEndEvent):
+            break
+        value_events = _yaml_node_events(events)
+        if key_event.value in pending:
+            pending.discard(key_event.value)
+            yield key_event.value, _yaml_value_from_events(value_events, safe_loading=safe_loading)
+
+# Kind of data (see disk_cache.CaseKeyStore) under which the case keys and
+# offsets of compact files are stored
+INDEX_KIND = 'compact-index'
+
+def case_keys(data_file, *, case_key_store=None):
+    """Get the case keys and their starting (byte) offsets in compact *data_file*
     
+    :returns: :class:`list` of (case key, offset) pairs
+    
+    If a :class:`.disk_cache.CaseKeyStore` is given as *case_key_store*, the
+    index is loaded from it while *data_file* is unchanged; otherwise, the
+    index is built from *data_file* (with a :class:`CaseIndexer`) and saved
+    to *case_key_store*.
+    """
+    if case_key_store is not None:
+        entries = case_key_store.load(data_file, INDEX_KIND, ())
+        if entries is not None:
+            return [tuple(entry) for entry in entries]
+    return reindex(data_file, case_key_store=case_key_store)
+
+def reindex(data_file, *, case_key_store=None):
+    """Build the index of case keys and offsets of compact *data_file*
+    
+    This is like :func:`case_keys`, but always builds the index from
+    *data_file*, replacing any index stored in *case_key_store*.
+    """
+    if case_key_store is not None:
+        identity = case_key_store.file_identity(data_file)
+    
+    result = scanned_case_keys(data_file)
+    if result is None:
+        reader = CaseIndexer()
+        with open(data_file) as stream:
+            for event in _yaml_parse(stream):
+                reader.read(event)
+        result = list(zip(
+            (case_key for case_key, _ in reader.case_keys),
+            _file_positions(data_file, (offset for _, offset in reader.case_keys)),
+        ))
+    
+    if case_key_store is not None:
+        case_key_store.save(data_file, INDEX_KIND, (), result, identity)
+    return result
+
+def scanned_case_keys(data_file):
+    """Index compact *data_file* by scanning its lines, if it is canonical
+    
+    :returns:
+        :class:`list` of (case key, offset) pairs, or ``None`` if the file
+        is not in the canonical form written by this package
+    
+    In canonical form -- ASCII text holding a single block mapping, as
+    emitted by :meth:`.framework.CaseAugmenter.update_compact_files` -- each
+    case key is a plain scalar at the start of a line, and every other line
+    that does not start with whitespace is a comment or an item of a block
+    sequence (which PyYAML emits unindented).  Only these lines are
+    examined, so this is much faster than parsing the file, but the
+    augmentation data itself is not validated.
+    """
+    with open(data_file, 'rb') as stream:
+        if os.fstat(stream.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as content:
+            if _NON_ASCII_BYTE.search(content):
+                return None
+            
+            result = []
+            for line in _UNINDENTED_LINE.finditer(content):
+                if _BLOCK_SEQUENCE_ITEM.match(line.group()):
+                    if not result:
+                        return None
+                    continue
+                key = _PLAIN_CASE_KEY_LINE.match(line.group())
+                if key is None:
+                    return None
+                result.append((key.group(1).decode('ascii'), line.start()))
+            return result
+
+_NON_ASCII_BYTE = re.compile(rb'[^\x00-\x7f]')
+_UNINDENTED_LINE = re.compile(rb'^[^ #\r\n][^\r\n]*', re.MULTILINE)
+_BLOCK_SEQUENCE_ITEM = re.compile(rb'-(?: |$)')
+_PLAIN_CASE_KEY_LINE = re.compile(rb'([A-Za-z0-9+/_][A-Za-z0-9+/_=-]*):(?: |$)')
+
+def key_scheme(data_file):
+    """Get the case key scheme named in the header of compact *data_file*"""
     with open(data_file) as stream:
-        for event in yaml.parse(stream):
-            reader.read(event)
+        for line in stream:
+            if not line.startswith('#'):
+                break
+            if line.startswith(KEY_SCHEME_HEADER_PREFIX):
+                return line[len(KEY_SCHEME_HEADER_PREFIX):].strip()
+    return JSON_ASN1_KEY_SCHEME
+
+def key_scheme_header(scheme):
+    """Get the header text naming case key *scheme* for a compact file
     
-    return reader.case_keys
+    The header for :const:`.cases.JSON_ASN1_KEY_SCHEME` is empty, so files
+    using that scheme are unchanged from earlier versions of this package.
+    """
+    if scheme in (None, JSON_ASN1_KEY_SCHEME):
+        return ''
+    return KEY_SCHEME_HEADER_PREFIX + scheme + "\n"
+
+def rekeyed_events(events, new_keys):
+    """Replace the case keys in the YAML events of a compact file
+    
+    :param events: iterable of YAML events, as from :func:`yaml.parse`
+    :param new_keys:
+        :class:`dict` (or similar by duck-type) mapping existing case keys to
+        their replacements; case keys not in *new_keys* are left unchanged
+    :returns: a generator of the resulting events
+    """
+    depth = 0
+    expecting_key = False
+    for event in events:
+        if isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+        if depth == 1 and expecting_key:
+            if not isinstance(event, yaml.ScalarEvent):
+                raise DataParseError(
+                    "{} where ScalarEvent expected"
+                    " in line {} while reading case key".format(
+                        type(event).__name__,
+                        event.start_mark.line,
+                    )
+                )
+            yield yaml.ScalarEvent(
+                event.anchor,
+                event.tag,
+                event.implicit,
+                new_keys.get(event.value, event.value),
+                style=event.style,
+            )
+            expecting_key = False
+            continue
+        
+        yield event
+        if isinstance(event, yaml.CollectionStartEvent):
+            depth += 1
+            expecting_key = depth == 1
+        elif depth == 1 and isinstance(event, (yaml.NodeEvent, yaml.CollectionEndEvent)):
+            # Just completed a case data value
+            expecting_key = True
 
 def augment_dict_from(d, file_ref, case_key, *, safe_loading=True):
     file, start_byte = file_ref
@@ -167,43 +347,176 @@ def augment_dict_from(d, file_ref, case_key, *, safe_loading=True):
         else:
             DataValueReader(stream, start_byte, case_key, safe_loading=safe_loading).augment(d)
 
+class MappedFile:
+    """Memory map of a compact file, shared by the augmenters reading it
+    
+    The file is mapped when text is first requested and stays mapped until
+    :meth:`close` (after which it is mapped again if needed).  Before each
+    use, the identity of the file (inode, size and modification time) is
+    checked against that of the mapping, and the file is mapped again if
+    it was replaced or modified.  Offsets into the file are only meaningful
+    for the content it had when this object was created; :meth:`text`
+    returns ``None`` once that content has changed.
+    
+    .. automethod:: __init__
+    """
+    def __init__(self, file_path):
+        """
+        :param file_path: path to the compact file
+        """
+        super().__init__()
+        self.file_path = file_path
+        self._indexed_identity = _file_identity(file_path)
+        self._content = None
+        self._identity = None
+    
+    @property
+    def mapped(self):
+        """Whether the file is currently mapped"""
+        return self._content is not None
+    
+    @property
+    def changed(self):
+        """Whether the file has changed since this object was created"""
+        return _file_identity(self.file_path) != self._indexed_identity
+    
+    def text(self, start, end=None):
+        """Get the text of the file from byte offset *start* to *end*
+        
+        The bytes are decoded (and so copied) from the mapping.
+        
+        :returns:
+            the text, or ``None`` if the file has changed since this object
+            was created (so the offsets may no longer locate an entry)
+        """
+        content = self._mapped_content()
+        if self._identity != self._indexed_identity:
+            return None
+        return content[start:end].decode('utf-8')
+    
+    def close(self, ):
+        """Release the mapping of the file"""
+        if self._content is not None and not isinstance(self._content, bytes):
+            self._content.close()
+        self._content = None
+        self._identity = None
+    
+    def _mapped_content(self, ):
+        if self._content is not None and _file_identity(self.file_path) != self._identity:
+            self.close()
+        if self._content is None:
+            with open(self.file_path, 'rb') as stream:
+                stat = os.fstat(stream.fileno())
+                if stat.st_size == 0:
+                    content = b''
+                else:
+                    content = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            self._identity = _stat_identity(stat)
+            self._content = content
+        return self._content
+
+def _file_identity(file_path):
+    try:
+        return _stat_identity(os.stat(file_path))
+    except FileNotFoundError:
+        return None
+
+def _stat_identity(stat):
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
 class TestCaseAugmenter:
-    """Callable to augment a test case from a compact entry"""
+    """Callable to augment a test case from a compact entry
+    
+    If a :class:`MappedFile` is given as *mapped_file*, the case's entry is
+    parsed from the mapped text between its *offset* and *end_offset* (the
+    offset of the next entry, or ``None`` for the end of the file) instead
+    of from a newly opened stream.
+    """
     
     # Set this to False to allow arbitrary object instantiation and code
     # execution from loaded YAML
     safe_loading = True
     
-    def __init__(self, file_path, offset, case_key, *, safe_loading=None):
+    def __init__(self, file_path, offset, case_key, *, safe_loading=None, end_offset=None, mapped_file=None):
         super().__init__()
         if safe_loading is not None and safe_loading is not self.safe_loading:
             self.safe_loading = safe_loading
         self.file_path = file_path
         self.offset = offset
         self.case_key = case_key
+        self.end_offset = end_offset
+        self.mapped_file = mapped_file
     
     def __call__(self, d):
-        with open(self.file_path) as stream:
-            if self.offset is None:
+        stream, start = self._entry_stream()
+        with stream:
+            if start is None:
                 for k, v in self._load_yaml(stream)[self.case_key].items():
                     d.setdefault(k, v)
             else:
-                DataValueReader(stream, self.offset, self.case_key, safe_loading=self.safe_loading).augment(d)
+                DataValueReader(stream, start, self.case_key, safe_loading=self.safe_loading).augment(d)
+    
+    @classmethod
+    def read_many(cls, augmenters):
+        """Read the augmentation data of several entries of one file in one parse
+        
+        :param augmenters: objects of this class for entries of the same file
+        :returns:
+            generator of ``(augmenter, data)`` pairs in file order, where
+            *data* is a :class:`dict` of the augmentation data of the entry
+        
+        See :func:`read_entries`; parsing starts at the first of the entries
+        if all of them can be jumped to and the file is unchanged since it
+        was indexed.
+        """
+        pending = {augmenter.case_key: augmenter for augmenter in augmenters}
+        if not pending:
+            return
+        first = next(iter(pending.values()))
+        offsets = [augmenter.offset for augmenter in pending.values()]
+        mapped_file = first.mapped_file
+        if None in offsets or (mapped_file is not None and mapped_file.changed):
+            start_byte = 0
+        else:
+            start_byte = min(offsets)
+        with open(first.file_path) as stream:
+            for case_key, data in read_entries(
+                stream,
+                pending,
+                start_byte=start_byte,
+                safe_loading=first.safe_loading,
+            ):
+                yield pending[case_key], data
     
     def case_data_events(self, ):
-        with open(self.file_path) as stream:
-            if self.offset is None:
+        stream, start = self._entry_stream()
+        with stream:
+            if start is None:
                 augmentation_data = self._load_yaml(stream)[self.case_key]
                 events = list(_yaml_content_events(augmentation_data))[1:-1]
                 yield from events
             else:
                 yield from DataValueReader(
                     stream,
-                    self.offset,
+                    start,
                     self.case_key,
                     safe_loading=self.safe_loading,
                 ).augmentation_data_events()
     
+    def _entry_stream(self, ):
+        """Get a stream containing the entry and the entry's offset in it
+        
+        The offset is ``None`` if the entry must be found by its key.
+        """
+        offset = self.offset
+        if offset is not None and self.mapped_file is not None:
+            text = self.mapped_file.text(offset, self.end_offset)
+            if text is not None:
+                return StringIO(text), 0
+            # The file changed after it was indexed
+            offset = None
+        return open(self.file_path), offset
+    
     def _load_yaml(self, stream):
         load_yaml = _get_yaml_loader(safe=self.safe_loading)
         return load_yaml(stream)
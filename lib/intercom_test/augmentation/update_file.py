@@ -24,15 +24,25 @@ import math
 import os.path
 import re
 import yaml
-from ..cases import hash_from_fields as _hash_from_fields
-from ..exceptions import DataParseError
-from ..json_asn1.convert import asn1_der
+from ..cases import (
+    JSON_ASN1_KEY_SCHEME,
+    hash_from_der as _hash_from_der,
+    hash_from_fields as _hash_from_fields,
+)
+from ..exceptions import DataParseError, MultipleAugmentationEntriesError
+from ..json_asn1.convert import kvp_der, object_der
 from ..utils import def_enum
 from ..yaml_tools import (
     YAML_EXT,
     content_events as _yaml_content_events,
+    der_from_event_stream as _der_from_events,
+    file_positions as _file_positions,
     value_from_event_stream as _value_from_events,
     get_load_fn as _get_yaml_loader,
+    is_self_contained as _is_self_contained,
+    node_events as _node_events,
+    parse as _yaml_parse,
+    sequence_item_events as _sequence_item_events,
 )
 
 class Indexer:
@@ -56,15 +66,20 @@ class Indexer:
     
     safe_loading = True
     
+    # Set this to another of cases.KEY_SCHEMES to compute case keys with it
+    key_scheme = JSON_ASN1_KEY_SCHEME
+    
     @def_enum
     def State():
         return "header top_sequence case_mapping case_data_key_collection case_data_value case_data_value_collection tail"
     
-    def __init__(self, key_fields, *, safe_loading=None):
+    def __init__(self, key_fields, *, safe_loading=None, key_scheme=None):
         super().__init__()
         # instance init code
         if safe_loading is not None and safe_loading is not self.safe_loading:
             self.safe_loading = safe_loading
+        if key_scheme is not None and key_scheme != self.key_scheme:
+            self.key_scheme = key_scheme
         self.key_fields = frozenset(key_fields)
         self._state = self.State.header
         self._index = {}
@@ -127,13 +142,18 @@ class Indexer:
             self._case_data_key = _value_from_events(self._case_data_key, safe_loading=self.safe_loading)
     
     def _read_from_case_data_value(self, event):
+        # Only the values of key fields are needed (in DER form for the
+        # json_asn1 key scheme)
+        if self._case_data_key in self.key_fields:
+            self._case_data_value = [event]
+        else:
+            self._case_data_value = None
+        
         if isinstance(event, yaml.CollectionStartEvent):
             self._state = self.State.case_data_value_collection
             self._depth = 0
-            self._case_data_value = [event]
         else:
             self._expect(yaml.ScalarEvent)
-            self._case_data_value = _value_from_events((event,), safe_loading=self.safe_loading)
             self._state = self.State.case_mapping
             self._capture_case_item()
     
@@ -142,11 +162,11 @@ class Indexer:
             self._depth += 1
         elif isinstance(event, yaml.CollectionEndEvent):
             self._depth -= 1
-        self._case_data_value.append(event)
+        if self._case_data_value is not None:
+            self._case_data_value.append(event)
         
         if self._depth < 0:
             self._state = self.State.case_mapping
-            self._case_data_value = _value_from_events(self._case_data_value, safe_loading=self.safe_loading)
             self._capture_case_item()
     
     def _read_from_tail(self, event):
@@ -156,14 +176,29 @@ class Indexer:
             self._state = self.State.header
     
     def _capture_case_item(self, ):
-        if self._case_data_key in self.key_fields:
-            self._case_id[self._case_data_key] = self._case_data_value
+        if self._case_data_value is None:
+            pass
+        elif self.key_scheme == JSON_ASN1_KEY_SCHEME:
+            self._case_id[self._case_data_key] = _der_from_events(
+                self._case_data_value,
+                safe_loading=self.safe_loading,
+            )
+        else:
+            self._case_id[self._case_data_key] = _value_from_events(
+                self._case_data_value,
+                safe_loading=self.safe_loading,
+            )
         
         del self._case_data_key
         del self._case_data_value
     
     def _capture_case(self, ):
-        case_key = _hash_from_fields(self._case_id)
+        if self.key_scheme == JSON_ASN1_KEY_SCHEME:
+            case_key = _hash_from_der(object_der(
+                kvp_der(k, v) for k, v in self._case_id.items()
+            ))
+        else:
+            case_key = _hash_from_fields(self._case_id, scheme=self.key_scheme)
         if self._jumpable and self._case_atomic:
             result = (case_key, self._case_data_start)
         else:
@@ -185,28 +220,75 @@ class Indexer:
             )
         )
 
-def index(paths, key_fields, *, safe_loading=True):
+def index(paths, key_fields, *, safe_loading=True, case_key_store=None, key_scheme=None):
+    """Index the cases in the update files at *paths*
+    
+    :returns: :class:`dict` of case key to :class:`TestCaseAugmenter`
+    
+    The case keys are computed with *key_scheme*, one of
+    :const:`.cases.KEY_SCHEMES` (by default,
+    :const:`.cases.JSON_ASN1_KEY_SCHEME`).
+    
+    If a :class:`.disk_cache.CaseKeyStore` is given as *case_key_store*, the
+    keys and offsets of the cases in each file are stored in it, and files
+    that have not changed since are not parsed again.
+    """
     result = {}
-    indexer = Indexer(key_fields, safe_loading=safe_loading)
+    indexer = Indexer(key_fields, safe_loading=safe_loading, key_scheme=key_scheme)
     for path in paths:
-        case_index = itertools.count(0)
-        with open(path) as instream:
-            for event in yaml.parse(instream):
-                entry = indexer.read(event)
-                if entry is not None:
-                    case_key, offset = entry
-                    new_augmenter = TestCaseAugmenter(path, offset, key_fields, case_index=next(case_index), safe_loading=safe_loading)
-                    new_augmenter.safe_loading = safe_loading
-                    if case_key in result and result[case_key].file_path != path:
-                        raise MultipleAugmentationEntriesError(
-                            "case {} conflicts with case {}".format(
-                                new_augmenter.case_reference,
-                                result[case_key].case_reference,
-                            )
-                        )
-                    result[case_key] = new_augmenter
+        for case_index, (case_key, offset) in enumerate(
+            index_entries(path, indexer, case_key_store=case_key_store)
+        ):
+            new_augmenter = TestCaseAugmenter(path, offset, key_fields, case_index=case_index, safe_loading=safe_loading)
+            new_augmenter.safe_loading = safe_loading
+            if case_key in result and result[case_key].file_path != path:
+                raise MultipleAugmentationEntriesError(
+                    "case {} conflicts with case {}".format(
+                        new_augmenter.case_reference,
+                        result[case_key].case_reference,
+                    )
+                )
+            result[case_key] = new_augmenter
     return result
 
+def index_entries(path, indexer, *, case_key_store=None, kind='update-index'):
+    """Index the cases in the file at *path* with *indexer*
+    
+    :param indexer: an :class:`Indexer`
+    :returns:
+        :class:`list` of ``(case_key, offset)`` for the cases in the file, in
+        order; *offset* is the byte offset of the case in the file, or
+        ``None`` for cases that cannot be read independently of the rest of
+        the file
+    
+    If a :class:`.disk_cache.CaseKeyStore` is given as *case_key_store*,
+    the entries are stored in it as *kind* of data
+    (qualified by the key scheme of *indexer*) and reused while the file is
+    unchanged.
+    """
+    if indexer.key_scheme != JSON_ASN1_KEY_SCHEME:
+        kind += ':' + indexer.key_scheme
+    if case_key_store is not None:
+        entries = case_key_store.load(path, kind, indexer.key_fields)
+        if entries is not None:
+            return entries
+        identity = case_key_store.file_identity(path)
+    
+    entries = []
+    with open(path) as instream:
+        for event in _yaml_parse(instream):
+            entry = indexer.read(event)
+            if entry is not None:
+                entries.append(entry)
+    entries = list(zip(
+        (case_key for case_key, _ in entries),
+        _file_positions(path, (offset for _, offset in entries)),
+    ))
+    
+    if case_key_store is not None:
+        case_key_store.save(path, kind, indexer.key_fields, entries, identity)
+    return entries
+
 class CaseReader:
     """Given a file and a starting point, reads the case data
     
@@ -227,7 +309,7 @@ class CaseReader:
             self.safe_loading = safe_loading
         self.key_fields = frozenset(key_fields)
         stream.seek(start_byte)
-        self._events = yaml.parse(stream)
+        self._events = _yaml_parse(stream)
         self._key = None
         self._value = None
         next(self._events) # should be yaml.StreamStartEvent
@@ -285,6 +367,19 @@ class CaseReader:
                     self._key = []
         self._events = ()
 
+def _entry_item_events(events):
+    # As _sequence_item_events, but parsing may start (as for CaseReader) at
+    # the mapping of an entry written below its "-" line; such a start is
+    # not within the sequence, so only that entry can be read
+    events = iter(events)
+    next(events) # should be yaml.StreamStartEvent
+    document_start = next(events) # should be yaml.DocumentStartEvent
+    root = next(events)
+    if isinstance(root, yaml.MappingStartEvent):
+        yield _node_events(itertools.chain((root,), events))
+        return
+    yield from _sequence_item_events(itertools.chain((document_start, root), events))
+
 class TestCaseAugmenter:
     """Callable to augment a test case from an update file entry"""
     
@@ -309,6 +404,53 @@ class TestCaseAugmenter:
             else:
                 CaseReader(stream, self.offset, self.key_fields, safe_loading=self.safe_loading).augment(d)
     
+    @classmethod
+    def read_many(cls, augmenters):
+        """Read the augmentation data of several entries of one file in one parse
+        
+        :param augmenters: objects of this class for entries of the same file
+        :returns:
+            generator of ``(augmenter, data)`` pairs in file order, where
+            *data* is a :class:`dict` of the augmentation data of the entry
+        
+        Parsing starts at the first of the entries (if it can be jumped to)
+        and stops after the last; the other entries in between are parsed
+        but not constructed.  Entries with aliases to other entries are read
+        by calling their augmenters.  If the first entry is written below
+        its ``-`` line, only it can be parsed from its offset, so no other
+        entries are generated; callers must read any entries not generated
+        individually.
+        """
+        pending = {augmenter.case_index: augmenter for augmenter in augmenters}
+        if not pending:
+            return
+        first = pending[min(pending)]
+        start_byte, first_index = (0, 0) if first.offset is None else (first.offset, first.case_index)
+        with open(first.file_path) as stream:
+            stream.seek(start_byte)
+            items = _entry_item_events(_yaml_parse(stream))
+            for case_index, item_events in enumerate(items, first_index):
+                augmenter = pending.pop(case_index, None)
+                if augmenter is None:
+                    continue
+                data = {}
+                if _is_self_contained(item_events):
+                    augmenter._augment_from_events(item_events, data)
+                else:
+                    augmenter(data)
+                yield augmenter, data
+                if not pending:
+                    break
+    
+    def _augment_from_events(self, item_events, d):
+        for event in item_events:
+            if isinstance(event, yaml.ScalarEvent) and event.style == '|':
+                event.value = CaseReader.TRAILING_WS.sub("\n", event.value)
+        case = _value_from_events(item_events, safe_loading=self.safe_loading)
+        for k, v in case.items():
+            if k not in self.key_fields:
+                d.setdefault(k, v)
+    
     @property
     def case_reference(self):
         if self.case_index is None:
@@ -14,34 +14,564 @@
 
 from base64 import b64encode
 from codecs import ascii_decode
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import hashlib
 import itertools
+from json.encoder import encode_basestring as _json_string
+import math
+import os
+import pickle
+import threading
 import yaml
 from .exceptions import DataParseError
 from .json_asn1.convert import asn1_der
 from .utils import def_enum
-from .yaml_tools import value_from_event_stream as _value_from_events
+from .yaml_tools import (
+    der_from_event_stream as _der_from_events,
+    value_from_event_stream as _value_from_events,
+)
 
-def hash_from_fields(test_case):
+# Names of the schemes for computing case keys; JSON_ASN1_KEY_SCHEME is the
+# original scheme and the default
+JSON_ASN1_KEY_SCHEME = 'json_asn1'
+BLAKE2_JSON_KEY_SCHEME = 'blake2b-json'
+KEY_SCHEMES = (JSON_ASN1_KEY_SCHEME, BLAKE2_JSON_KEY_SCHEME)
+
+def hash_from_fields(test_case, *, cross_check=False, subtree_memo=None, scheme=None):
     """Compute a string hash from any acyclic, JSON-ic :class:`dict`
     
     :param dict test_case: test case data to be hashed
+    :keyword bool cross_check:
+        verify the DER encoding against the :mod:`pyasn1` encoder
+    :keyword subtree_memo:
+        *optional* :class:`.json_asn1.convert.SubtreeMemo` of encodings of
+        containers shared between test cases
+    :keyword str scheme:
+        one of :const:`KEY_SCHEMES`; defaults to :const:`JSON_ASN1_KEY_SCHEME`
     :returns: a repeatably generatable hash of *test_case*
     :rtype: str
     
-    The hash is computed by encoding *test_case* in ASN1 DER (see
-    :const:`.json_asn1.types.ASN1_SOURCE` for the ASN1 syntax of the data
-    format), then hashing with SHA-256, and finally Base64 encoding to get the
-    result.
+    In the default scheme, the hash is computed by encoding *test_case* in
+    ASN1 DER (see :const:`.json_asn1.types.ASN1_SOURCE` for the ASN1 syntax of
+    the data format), then hashing with SHA-256, and finally Base64 encoding
+    to get the result.  The DER encoding is written directly from the Python
+    values (see :func:`.json_asn1.convert.direct_der`); with *cross_check*, it
+    is also produced through :mod:`pyasn1` and the two are required to match.
+    
+    With :const:`BLAKE2_JSON_KEY_SCHEME`, the hash is computed by
+    :func:`hash_from_canonical_json` instead, and *cross_check* and
+    *subtree_memo* are not used.
     
     Note that this function hashes **all** key/value pairs of *test_case*.
     """
     key = test_case if isinstance(test_case, dict) else dict(test_case)
-    key = asn1_der(key)
-    key = hashlib.sha256(key).digest()
+    if scheme == BLAKE2_JSON_KEY_SCHEME:
+        return hash_from_canonical_json(key)
+    elif scheme not in (None, JSON_ASN1_KEY_SCHEME):
+        raise ValueError("Unknown case key scheme {!r}".format(scheme))
+    return hash_from_der(asn1_der(key, cross_check=cross_check, subtree_memo=subtree_memo))
+
+def hash_from_der(encoded_fields):
+    """Compute the string hash of test case fields already encoded in DER
+    
+    :param bytes encoded_fields: DER encoding of the test case fields
+    :returns: the hash :func:`hash_from_fields` would return for the fields
+    :rtype: str
+    """
+    key = hashlib.sha256(encoded_fields).digest()
     key = ascii_decode(b64encode(key))[0]
     return key
 
+def hash_from_canonical_json(test_case):
+    """Compute the :const:`BLAKE2_JSON_KEY_SCHEME` hash of JSON-ic *test_case*
+    
+    :returns: Base64 encoding of the 32-byte BLAKE2b digest of :func:`canonical_json`
+    :rtype: str
+    """
+    key = hashlib.blake2b(canonical_json(test_case), digest_size=32).digest()
+    return ascii_decode(b64encode(key))[0]
+
+def canonical_json(value):
+    """Encode JSON-ic *value* as canonical JSON, in UTF-8
+    
+    The canonical form is that of the JSON Canonicalization Scheme (RFC 8785):
+    no insignificant whitespace, non-ASCII characters unescaped, mapping
+    entries sorted by the UTF-16 code units of their keys, and numbers
+    written as ECMAScript writes IEEE 754 doubles (e.g. ``1e-7``, ``1.5e+300``
+    and ``2``, for ``2.0``; integers of magnitude above 2**53 are rounded to
+    the nearest double).  Non-string mapping keys are replaced by their
+    canonical encoding (e.g. ``1`` becomes ``"1"`` and ``None`` becomes
+    ``"null"``).
+    
+    :raises ValueError:
+        if *value* contains a NaN or infinite float, or an integer too large
+        for a double
+    :raises TypeError: if *value* contains a non-JSON-ic value
+    """
+    parts = []
+    _write_canonical_json(value, parts)
+    return ''.join(parts).encode('utf-8')
+
+# Integers of at most this magnitude are exactly representable as doubles
+_MAX_SAFE_INTEGER = 2 ** 53
+
+def _write_canonical_json(value, parts):
+    if isinstance(value, str):
+        parts.append(_json_string(value))
+    elif value is None:
+        parts.append('null')
+    elif value is True:
+        parts.append('true')
+    elif value is False:
+        parts.append('false')
+    elif isinstance(value, (int, float)):
+        parts.append(_canonical_number(value))
+    elif callable(getattr(value, 'items', None)):
+        entries = sorted(
+            (
+                (k if isinstance(k, str) else canonical_json(k).decode('utf-8'), v)
+                for k, v in value.items()
+            ),
+            key=lambda entry: entry[0].encode('utf-16-be'),
+        )
+        parts.append('{')
+        for i, (k, v) in enumerate(entries):
+            if i:
+                parts.append(',')
+            parts.append(_json_string(k))
+            parts.append(':')
+            _write_canonical_json(v, parts)
+        parts.append('}')
+    elif isinstance(value, (list, tuple)):
+        parts.append('[')
+        for i, item in enumerate(value):
+            if i:
+                parts.append(',')
+            _write_canonical_json(item, parts)
+        parts.append(']')
+    else:
+        raise TypeError("{!r} is not JSON serializable".format(value))
+
+def _canonical_number(value):
+    # ECMAScript Number::toString, as required by RFC 8785
+    if isinstance(value, int) and -_MAX_SAFE_INTEGER <= value <= _MAX_SAFE_INTEGER:
+        return str(value)
+    try:
+        value = float(value)
+    except OverflowError:
+        raise ValueError("{!r} is too large for canonical JSON".format(value))
+    if value != value or value in (math.inf, -math.inf):
+        raise ValueError("{!r} is not allowed in canonical JSON".format(value))
+    if value == 0:
+        return '0'
+    sign = '-' if value < 0 else ''
+    
+    # repr() gives the shortest digits that round-trip, as does ECMAScript
+    mantissa, _, exponent = repr(abs(value)).partition('e')
+    int_part, _, fraction = mantissa.partition('.')
+    digits = int_part + fraction
+    # The value is 0.DIGITS x 10**n
+    n = len(int_part) + int(exponent or 0) - (len(digits) - len(digits.lstrip('0')))
+    digits = digits.strip('0')
+    k = len(digits)
+    
+    if k <= n <= 21:
+        return sign + digits + '0' * (n - k)
+    elif 0 < n <= 21:
+        return sign + digits[:n] + '.' + digits[n:]
+    elif -6 < n <= 0:
+        return sign + '0.' + '0' * -n + digits
+    return '{}{}{}e{:+d}'.format(
+        sign,
+        digits[0],
+        '.' + digits[1:] if k > 1 else '',
+        n - 1,
+    )
+
+def hash_many(test_cases, key_fields=None, *, workers=None, chunk_size=1000, scheme=None):
+    """Compute :func:`hash_from_fields` for many test cases, possibly in parallel
+    
+    :param test_cases: iterable of test case :class:`dict` objects
+    :param key_fields:
+        *optional* field names to hash from each case; all fields are hashed
+        if not given
+    :keyword int workers:
+        number of worker processes to use; defaults to :func:`os.cpu_count`
+    :keyword int chunk_size: number of cases sent to a worker at a time
+    :keyword str scheme: case key scheme, as for :func:`hash_from_fields`
+    :returns: case keys in the same order as *test_cases*
+    :rtype: list
+    
+    The cases are divided into chunks of *chunk_size* and hashed in a
+    :class:`concurrent.futures.ProcessPoolExecutor`, so they must be
+    picklable.  If there is no more than one chunk or one worker, the cases are
+    hashed in the current process.
+    """
+    if key_fields is not None:
+        key_fields = frozenset(key_fields)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    test_cases = list(test_cases)
+    chunks = [
+        test_cases[i:i + chunk_size]
+        for i in range(0, len(test_cases), chunk_size)
+    ]
+    if workers <= 1 or len(chunks) <= 1:
+        return _hash_chunk(test_cases, key_fields, scheme)
+    
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as executor:
+        return list(itertools.chain.from_iterable(executor.map(
+            _hash_chunk,
+            chunks,
+            itertools.repeat(key_fields),
+            itertools.repeat(scheme),
+        )))
+
+def _hash_chunk(test_cases, key_fields, scheme=None):
+    if key_fields is None:
+        return [hash_from_fields(test_case, scheme=scheme) for test_case in test_cases]
+    return [
+        hash_from_fields(
+            ((k, v) for k, v in test_case.items() if k in key_fields),
+            scheme=scheme,
+        )
+        for test_case in test_cases
+    ]
+
+class CaseKeyCache:
+    """Size-bounded LRU cache of case keys computed by :func:`hash_from_fields`
+    
+    Entries are looked up by a structural fingerprint of the hashed fields
+    (the values converted to nested tuples and frozensets), which
+    is much cheaper to compute than the DER encoding and SHA-256 hash it
+    replaces on a hit.  The least recently used entries are evicted once
+    *max_entries* is exceeded.
+    
+    A single instance may be shared (and used concurrently from multiple
+    threads) by :class:`.framework.InterfaceCaseProvider`,
+    :class:`.framework.CaseAugmenter` and
+    :class:`.http_best_matches.Database` objects, since the key depends only
+    on the fields passed in (and the key scheme).
+    """
+    def __init__(self, max_entries=10000):
+        super().__init__()
+        if max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+    
+    @property
+    def hits(self):
+        """Number of lookups answered from the cache"""
+        return self._hits
+    
+    @property
+    def misses(self):
+        """Number of lookups that required computing the key"""
+        return self._misses
+    
+    def __len__(self, ):
+        return len(self._keys)
+    
+    def key_of(self, fields, *, subtree_memo=None, scheme=None):
+        """Get the :func:`hash_from_fields` value of *fields*, caching it"""
+        fields = fields if isinstance(fields, dict) else dict(fields)
+        hash_options = dict(subtree_memo=subtree_memo, scheme=scheme)
+        fingerprint = self._fingerprint(fields, scheme)
+        if fingerprint is None:
+            # Unhashable leaf value: not cacheable
+            return hash_from_fields(fields, **hash_options)
+        
+        with self._lock:
+            key = self._lookup(fingerprint)
+            if key is not None:
+                return key
+        
+        key = hash_from_fields(fields, **hash_options)
+        
+        with self._lock:
+            self._store(fingerprint, key)
+        return key
+    
+    def keys_of_many(self, fields_list, *, scheme=None, **hash_many_options):
+        """Get the :func:`hash_from_fields` values of many *fields*, caching them
+        
+        :param fields_list: iterable of :class:`dict` objects of fields to hash
+        :returns: the keys, in the same order as *fields_list*
+        :rtype: list
+        
+        The keys not found in the cache are computed together by
+        :func:`hash_many` (which is passed *hash_many_options*).
+        """
+        fields_list = [
+            fields if isinstance(fields, dict) else dict(fields)
+            for fields in fields_list
+        ]
+        fingerprints = [self._fingerprint(fields, scheme) for fields in fields_list]
+        keys = [None] * len(fields_list)
+        with self._lock:
+            for i, fingerprint in enumerate(fingerprints):
+                if fingerprint is not None:
+                    keys[i] = self._lookup(fingerprint)
+        
+        missing = [i for i, key in enumerate(keys) if key is None]
+        if missing:
+            computed = hash_many(
+                (fields_list[i] for i in missing),
+                scheme=scheme,
+                **hash_many_options
+            )
+            with self._lock:
+                for i, key in zip(missing, computed):
+                    keys[i] = key
+                    if fingerprints[i] is not None:
+                        self._store(fingerprints[i], key)
+        return keys
+    
+    @staticmethod
+    def _fingerprint(fields, scheme):
+        try:
+            return (scheme or JSON_ASN1_KEY_SCHEME, _fingerprint(
+                fields,
+                distinct_bools=scheme == BLAKE2_JSON_KEY_SCHEME,
+            ))
+        except TypeError:
+            return None
+    
+    def _lookup(self, fingerprint):
+        # Call with self._lock held; counts a hit or a miss
+        key = self._keys.get(fingerprint)
+        if key is not None:
+            self._keys.move_to_end(fingerprint)
+            self._hits += 1
+        else:
+            self._misses += 1
+        return key
+    
+    def _store(self, fingerprint, key):
+        # Call with self._lock held
+        self._keys[fingerprint] = key
+        self._keys.move_to_end(fingerprint)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+    
+    def clear(self, ):
+        """Remove all entries and reset the hit and miss counters"""
+        with self._lock:
+            self._keys.clear()
+            self._hits = self._misses = 0
+
+class _PickledValueCache:
+    # Common implementation of the LRU caches below, which hold their values
+    # pickled (so each load returns a new copy) along with the identity of
+    # the file from which each value was read
+    max_entries = None
+    
+    def __init__(self, *, max_bytes, max_entries=None):
+        super().__init__()
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        if max_entries is not None and max_entries < 1:
+            raise ValueError("max_entries must be positive")
+        self.max_bytes = max_bytes
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+    
+    @property
+    def hits(self):
+        """Number of loads answered from the cache"""
+        return self._hits
+    
+    @property
+    def misses(self):
+        """Number of loads not answered from the cache"""
+        return self._misses
+    
+    @property
+    def size(self):
+        """Total size (in bytes) of the pickled values held"""
+        return self._size
+    
+    def __len__(self, ):
+        return len(self._entries)
+    
+    def file_identity(self, path):
+        """Get the identity of the current content of the file at *path*
+        
+        Capture this before reading the file and pass it to :meth:`save`, so
+        that changes made while the file is read are detected.
+        """
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+    
+    def clear(self, ):
+        """Remove all entries and reset the hit and miss counters"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self._hits = self._misses = 0
+    
+    def _load(self, entry_key, path):
+        try:
+            identity = self.file_identity(path)
+        except OSError:
+            identity = None
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] != identity:
+                # The file has changed
+                self._discard(entry_key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(entry_key)
+            self._hits += 1
+        return pickle.loads(entry[1])
+    
+    def _save(self, entry_key, value, identity):
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        if self.max_bytes is not None and len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(entry_key)
+            self._entries[entry_key] = (identity, data)
+            self._size += len(data)
+            while self._over_limit():
+                self._discard(next(iter(self._entries)))
+    
+    def _over_limit(self, ):
+        if self.max_bytes is not None and self._size > self.max_bytes:
+            return True
+        return self.max_entries is not None and len(self._entries) > self.max_entries
+    
+    def _discard(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+class ParsedCaseCache(_PickledValueCache):
+    """Size-bounded, in-memory cache of the test cases parsed from test case files
+    
+    One instance can be shared by all the :class:`.framework.InterfaceCaseProvider`
+    objects of a process (see
+    :attr:`.framework.InterfaceCaseProvider.parsed_case_cache`), so that
+    test case files read by more than one of them are parsed only once.
+    
+    Entries are looked up by the resolved path of the test case file and
+    a *kind* distinguishing how it was parsed, and are only used while the
+    file's size, modification time and inode match those recorded when it
+    was read.  The test cases are held pickled; each :meth:`load` unpickles
+    a new copy, so callers may modify the cases they receive without
+    affecting other callers.  The least recently used entries are evicted
+    once the pickled data exceeds *max_bytes*.
+    """
+    def __init__(self, max_bytes=64 << 20):
+        super().__init__(max_bytes=max_bytes)
+    
+    def load(self, path, kind):
+        """Get a copy of the test cases cached for *path*, or ``None``"""
+        return self._load((os.path.realpath(path), kind), path)
+    
+    def save(self, path, kind, test_cases, identity):
+        """Cache *test_cases* parsed from *path* when it had *identity*
+        
+        Test cases that cannot be pickled, or whose pickled size exceeds
+        :attr:`max_bytes`, are not cached.
+        """
+        self._save((os.path.realpath(path), kind), test_cases, identity)
+
+class AugmentationCache(_PickledValueCache):
+    """Bounded, in-memory LRU cache of decoded case augmentation data
+    
+    A :class:`.framework.CaseAugmenter` given one (see
+    :attr:`.framework.CaseAugmenter.augmentation_cache`) keeps the
+    augmentation data it decodes for each case, so augmenting the same case
+    again -- e.g. for parametrized tests or retries -- does not parse the
+    augmentation file again.
+    
+    Entries are looked up by case key and the resolved path of the
+    augmentation file, and are only used while the file's size,
+    modification time and inode match those recorded when it was read.  As
+    with :class:`ParsedCaseCache`, the data is held pickled and each
+    :meth:`load` returns a new copy.  The least recently used entries are
+    evicted once there are more than *max_entries* or the pickled data
+    exceeds *max_bytes*; either limit may be ``None``, but not both.
+    
+    .. automethod:: __init__
+    """
+    def __init__(self, max_entries=None, *, max_bytes=16 << 20):
+        """
+        :param int max_entries: *optional* maximum number of cases held
+        :keyword int max_bytes: maximum total size of the pickled data held
+        """
+        if max_entries is None and max_bytes is None:
+            raise ValueError("AugmentationCache requires max_entries or max_bytes")
+        super().__init__(max_bytes=max_bytes, max_entries=max_entries)
+    
+    def load(self, case_key, path):
+        """Get a copy of the augmentation data cached for *case_key* from *path*, or ``None``"""
+        return self._load((case_key, os.path.realpath(path)), path)
+    
+    def save(self, case_key, path, augmentation, identity):
+        """Cache *augmentation* for *case_key*, read from *path* when it had *identity*"""
+        self._save((case_key, os.path.realpath(path)), augmentation, identity)
+    
+    def invalidate(self, path):
+        """Remove the entries read from the file at *path*"""
+        path = os.path.realpath(path)
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[1] == path]:
+                self._discard(entry_key)
+
+class _FingerprintTag:
+    def __init__(self, name):
+        super().__init__()
+        self.name = name
+    
+    def __repr__(self, ):
+        return "<{}>".format(self.name)
+
+_MAPPING_FP = _FingerprintTag('mapping')
+_SEQUENCE_FP = _FingerprintTag('sequence')
+
+def _fingerprint(value, *, distinct_bools=False):
+    # Values with equal fingerprints must have equal DER encodings; lists and
+    # tuples encode identically, as do numbers that compare equal.  Canonical
+    # JSON also encodes numbers that compare equal identically, except that
+    # booleans differ from 0 and 1.  Non-string mapping keys are encoded by
+    # their string forms, which differ by type.
+    if distinct_bools and isinstance(value, bool):
+        return (bool, value)
+    elif isinstance(value, (str, int, float)) or value is None:
+        return value
+    elif callable(getattr(value, 'items', None)):
+        return (_MAPPING_FP, frozenset(
+            (
+                k if isinstance(k, str) else (type(k), k),
+                _fingerprint(v, distinct_bools=distinct_bools),
+            )
+            for k, v in value.items()
+        ))
+    elif isinstance(value, (list, tuple)):
+        return (_SEQUENCE_FP, tuple(
+            _fingerprint(item, distinct_bools=distinct_bools)
+            for item in value
+        ))
+    return (type(value), value)
+
 class IdentificationListReader:
     """Utility class to read case ID and associated events from a YAML event stream
     
@@ -54,14 +584,19 @@ class IdentificationListReader:
     
     safe_loading = True
     
+    # Set this to another of KEY_SCHEMES to compute case keys with it
+    key_scheme = JSON_ASN1_KEY_SCHEME
+    
     @def_enum
     def State():
         return "header content tail"
     
-    def __init__(self, key_fields, *, safe_loading=None):
+    def __init__(self, key_fields, *, safe_loading=None, key_scheme=None):
         super().__init__()
         if safe_loading is not None and safe_loading is not self.safe_loading:
             self.safe_loading = safe_loading
+        if key_scheme is not None and key_scheme != self.key_scheme:
+            self.key_scheme = key_scheme
         self._key_fields = frozenset(key_fields)
         self._state = self.State.header
     
@@ -129,10 +664,16 @@ class IdentificationListReader:
         pass
     
     def _key_from_events(self, events):
-        given_values = _value_from_events(events, safe_loading=self.safe_loading)
-        return hash_from_fields(dict(
-            entry for entry in given_values.items()
-            if entry[0] in self._key_fields
+        if self.key_scheme != JSON_ASN1_KEY_SCHEME:
+            fields = _value_from_events(events, safe_loading=self.safe_loading)
+            return hash_from_fields(
+                dict((k, v) for k, v in fields.items() if k in self._key_fields),
+                scheme=self.key_scheme,
+            )
+        return hash_from_der(_der_from_events(
+            events,
+            safe_loading=self.safe_loading,
+            key_filter=self._key_fields.__contains__,
         ))
     
     def _expect(self, event_type):
@@ -0,0 +1,260 @@
+# Copyright 2018 PayTrace, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Persistent caches of data derived from test case and augmentation files
+
+Data computed from a source file is stored in a *sidecar* file within a
+cache directory (conventionally :const:`DEFAULT_CACHE_DIR`), together with
+the identity of the source file -- its size and modification time and,
+optionally, a digest of its content -- at the time it was read.  A sidecar
+is only used while the source file still has the same identity.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+DEFAULT_CACHE_DIR = '.intercom_cache'
+
+# Protocol 5 (Python 3.8+) handles large buffers most efficiently
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+
+class CaseKeyStore:
+    """Sidecar cache of case keys (and offsets) computed from data files
+    
+    Each entry is stored for a source file, a *kind* of data (e.g.
+    ``'update-index'``), and the set of key fields used to compute the case
+    keys.  The stored entries are a JSON-compatible :class:`list`, usually of
+    ``[case_key, offset]`` pairs.
+    
+    Set *verify_content* to also compare a SHA-256 digest of the source file
+    content when checking whether a sidecar is current; this protects against
+    changes that leave the size and modification time of the file unchanged,
+    at the cost of reading the whole file.
+    
+    .. automethod:: __init__
+    """
+    # Version 2: offsets are byte offsets (earlier, YAML character indexes)
+    FORMAT_VERSION = 2
+    SUBDIR = 'case-keys'
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, *, verify_content=False):
+        """Constructing an instance
+        
+        :param cache_dir: directory in which to store sidecar files
+        :keyword bool verify_content:
+            whether to compare content digests of source files
+        """
+        super().__init__()
+        self._cache_dir = cache_dir
+        self.verify_content = verify_content
+    
+    @property
+    def cache_dir(self):
+        """The directory holding the sidecar files of this store"""
+        return self._cache_dir
+    
+    def file_identity(self, source_path):
+        """Get the identity of *source_path* as stored with sidecar data
+        
+        Callers should get the identity *before* reading the source file, so
+        that any concurrent modification of the file invalidates the data
+        stored with this identity.
+        """
+        stat = os.stat(source_path)
+        result = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        if self.verify_content:
+            result['sha256'] = file_digest(source_path)
+        return result
+    
+    def load(self, source_path, kind, key_fields):
+        """Load the entries stored for *source_path*
+        
+        :returns:
+            the stored :class:`list` of entries, or ``None`` if there is no
+            current sidecar for *source_path*
+        """
+        try:
+            with open(self._sidecar_path(source_path, kind, key_fields)) as sidecar:
+                stored = json.load(sidecar)
+            identity = self.file_identity(source_path)
+        except (OSError, ValueError):
+            return None
+        
+        if not isinstance(stored, dict):
+            return None
+        if stored.get('version') != self.FORMAT_VERSION:
+            return None
+        if stored.get('source') != os.path.realpath(source_path):
+            return None
+        if any(stored.get('identity', {}).get(k) != v for k, v in identity.items()):
+            return None
+        return stored.get('entries')
+    
+    def save(self, source_path, kind, key_fields, entries, identity):
+        """Store *entries* computed from *source_path*
+        
+        :param identity:
+            the result of :meth:`file_identity` for *source_path*, taken
+            before the source file was read to compute *entries*
+        
+        The sidecar file is replaced atomically, so concurrent readers never
+        see a partially written sidecar.  Failure to write the sidecar is not
+        an error; the entries will simply be recomputed next time.
+        """
+        sidecar_path = self._sidecar_path(source_path, kind, key_fields)
+        content = {
+            'version': self.FORMAT_VERSION,
+            'source': os.path.realpath(source_path),
+            'kind': kind,
+            'key fields': sorted(key_fields),
+            'identity': identity,
+            'entries': list(entries),
+        }
+        try:
+            os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(sidecar_path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as sidecar:
+                    json.dump(content, sidecar)
+                os.replace(temp_path, sidecar_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except OSError:
+            pass
+    
+    def purge(self, ):
+        """Remove all sidecar files of this store"""
+        shutil.rmtree(os.path.join(self.cache_dir, self.SUBDIR), ignore_errors=True)
+    
+    def _sidecar_path(self, source_path, kind, key_fields):
+        name_source = "\0".join(
+            [os.path.realpath(source_path), kind] + sorted(key_fields)
+        )
+        return os.path.join(
+            self.cache_dir,
+            self.SUBDIR,
+            hashlib.sha256(name_source.encode('utf-8')).hexdigest() + '.json',
+        )
+
+class CompiledCaseStore:
+    """Cache of the test cases parsed from test case files, in binary form
+    
+    Loading pickled test case data is many times faster than parsing the
+    YAML it came from.  Each sidecar is stored for a source file and a
+    *kind* of parsing (e.g. ``'safe'`` for safe YAML loading), and holds the
+    SHA-256 digest of the source file content from which the cases were
+    parsed; it is only used while the source file has the same digest.
+    
+    The sidecars are unpickled, so the cache directory must be no more
+    writable than the test case files themselves.
+    
+    .. automethod:: __init__
+    """
+    FORMAT_VERSION = 1
+    SUBDIR = 'compiled-cases'
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR):
+        """Constructing an instance
+        
+        :param cache_dir: directory in which to store sidecar files
+        """
+        super().__init__()
+        self._cache_dir = cache_dir
+    
+    @property
+    def cache_dir(self):
+        """The directory holding the sidecar files of this store"""
+        return self._cache_dir
+    
+    def load(self, source_path, kind, digest):
+        """Load the test cases stored for *source_path*
+        
+        :param str digest:
+            hex SHA-256 digest of the current content of *source_path*
+        :returns:
+            the stored :class:`list` of test cases, or ``None`` if there is
+            no current sidecar for *source_path*
+        """
+        try:
+            with open(self._sidecar_path(source_path, kind), 'rb') as sidecar:
+                stored = pickle.load(sidecar)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        
+        if not isinstance(stored, dict):
+            return None
+        if stored.get('version') != self.FORMAT_VERSION:
+            return None
+        if stored.get('source') != os.path.realpath(source_path):
+            return None
+        if stored.get('sha256') != digest:
+            return None
+        return stored.get('cases')
+    
+    def save(self, source_path, kind, digest, test_cases):
+        """Store *test_cases* parsed from content of *source_path* with *digest*
+        
+        As with :meth:`CaseKeyStore.save`, the sidecar is replaced atomically
+        and failure to write it (including failure to pickle *test_cases*) is
+        not an error.
+        """
+        sidecar_path = self._sidecar_path(source_path, kind)
+        content = {
+            'version': self.FORMAT_VERSION,
+            'source': os.path.realpath(source_path),
+            'kind': kind,
+            'sha256': digest,
+            'cases': list(test_cases),
+        }
+        try:
+            os.makedirs(os.path.dirname(sidecar_path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(sidecar_path), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as sidecar:
+                    pickle.dump(content, sidecar, protocol=PICKLE_PROTOCOL)
+                os.replace(temp_path, sidecar_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
+        except (OSError, pickle.PicklingError, TypeError, AttributeError):
+            pass
+    
+    def purge(self, ):
+        """Remove all sidecar files of this store"""
+        shutil.rmtree(os.path.join(self.cache_dir, self.SUBDIR), ignore_errors=True)
+    
+    def _sidecar_path(self, source_path, kind):
+        name_source = "\0".join([os.path.realpath(source_path), kind])
+        return os.path.join(
+            self.cache_dir,
+            self.SUBDIR,
+            hashlib.sha256(name_source.encode('utf-8')).hexdigest() + '.pickle',
+        )
+
+def file_digest(path, *, blocksize=1 << 16):
+    """Compute the hex SHA-256 digest of the content of the file at *path*"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as content:
+        for block in iter(lambda: content.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def purge(cache_dir=DEFAULT_CACHE_DIR):
+    """Remove the whole cache directory *cache_dir*"""
+    shutil.rmtree(cache_dir, ignore_errors=True)
@@ -20,3 +20,9 @@ class DataParseError(Exception):
 
 class NoAugmentationError(ValueError):
     """Raised when lack of augmentation data prevents a requested operation"""
+
+class EncodingMismatchError(AssertionError):
+    """Raised when cross-checked encodings of the same value differ"""
+
+class KeySchemeMismatchError(ValueError):
+    """Raised when augmentation data files use different case key schemes"""
@@ -4,7 +4,7 @@ import re
 import sys
 import yaml
 
-from . import __version__ as _package_version, __name__ as _package, framework
+from . import __version__ as _package_version, __name__ as _package, disk_cache, framework
 
 try:
     from docopt_subcommands import command as subcommand, main
@@ -116,6 +116,8 @@ class Config(object):
     CASE_AUGMENTATION_KEYS = frozenset(('augmentation data', 'request keys'))
     
     case_augmenter = None
+    case_key_store = None
+    compiled_case_store = None
     request_keys = ()
     
     def __init__(self, filepath):
@@ -128,6 +130,13 @@ class Config(object):
         self.interface_dir = os.path.join(ref_dir, cfg_data['interfaces'])
         self.service_name = cfg_data['service name']
         
+        if 'cache dir' in cfg_data:
+            self.cache_dir = os.path.join(ref_dir, cfg_data['cache dir'])
+            self.case_key_store = disk_cache.CaseKeyStore(self.cache_dir)
+            self.compiled_case_store = disk_cache.CompiledCaseStore(self.cache_dir)
+        else:
+            self.cache_dir = os.path.join(ref_dir, disk_cache.DEFAULT_CACHE_DIR)
+        
         if 'request keys' in cfg_data:
             self.request_keys = frozenset(cfg_data['request keys'])
             assert all(isinstance(k, str) for k in self.request_keys), (
@@ -139,7 +148,8 @@ class Config(object):
                 pass
             CLICaseAugmenter.CASE_PRIMARY_KEYS = self.request_keys
             self.case_augmenter = CLICaseAugmenter(
-                os.path.join(ref_dir, cfg_data['augmentation data'])
+                os.path.join(ref_dir, cfg_data['augmentation data']),
+                case_key_store=self.case_key_store,
             )
         elif 'augmentation data' in cfg_data:
             print(
@@ -213,7 +223,13 @@ def enumerate(options):
     Options:
         -c CONFFILE, --config CONFFILE      path to configuration file
         -o FORMAT, --output FORMAT          format of output, e.g. yaml, jsonl [default: yaml]
+        --shard SHARD                       only enumerate shard I of N (0 <= I < N), given as I/N
     """
+    cases_kwargs = {}
+    if options.get('--shard'):
+        shard, of = _shard_option(options['--shard'])
+        cases_kwargs.update(shard=shard, of=of)
+    
     config = Config(options.get('--config'))
     
     icp_kwargs = {}
@@ -221,22 +237,31 @@ def enumerate(options):
         config.interface_dir,
         config.service_name,
         case_augmenter=config.case_augmenter,
+        case_key_store=config.case_key_store,
+        compiled_case_store=config.compiled_case_store,
     )
     
     outfmt = options['--output']
     if outfmt == 'yaml':
         def dump(c):
             print('---')
-            yaml.safe_dump(c, sys.stdout)
+            yaml.dump(c, sys.stdout, Dumper=framework._SafeCaseDumper)
     elif outfmt == 'jsonl':
         def dump(c):
             print(json.dumps(c))
     else:
         raise ValueError("{!r} is not a supported output format".format(outfmt))
     
-    for c in case_provider.cases():
+    for c in case_provider.cases(**cases_kwargs):
         dump(c)
 
+def _shard_option(value):
+    match = re.fullmatch(r'(\d+)/(\d+)', value)
+    if match is None or not int(match.group(1)) < int(match.group(2)):
+        from docopt import DocoptExit
+        raise DocoptExit("--shard must be given as I/N, with 0 <= I < N")
+    return int(match.group(1)), int(match.group(2))
+
 @subcommand()
 def commit_updates(options):
     """usage: {program} commitupdates [options]
@@ -255,6 +280,79 @@ def commit_updates(options):
     )
     case_provider.update_compact_files()
 
+@subcommand()
+def rekey(options):
+    """usage: {program} rekey [options]
+    
+    Rewrite the compact augmentation data files to use a different case key
+    scheme (json_asn1 or blake2b-json).  Case keys that do not match any test
+    case are listed on STDERR and left unchanged.
+    
+    Options:
+        -c CONFFILE, --config CONFFILE      path to configuration file
+        -s SCHEME, --scheme SCHEME          case key scheme to use [default: blake2b-json]
+    """
+    config = Config(options.get('--config'))
+    
+    case_provider = framework.InterfaceCaseProvider(
+        config.interface_dir,
+        config.service_name,
+        case_augmenter=config.case_augmenter,
+    )
+    for case_key in case_provider.rekey_compact_files(options['--scheme']):
+        print("No test case for augmentation key {}".format(case_key), file=sys.stderr)
+
+@subcommand()
+def check_duplicates(options):
+    """usage: {program} checkduplicates [options]
+    
+    List test cases sharing a case key (i.e. the same request) with the
+    file and line of each, noting where their other fields (e.g. the
+    response) conflict.  Without augmentation data configured, requests are
+    identified by the `request keys` in the configuration file or, if those
+    are not given, by `method`, `url`, and `request body`.  Exits with
+    status 1 if any duplicates conflict.
+    
+    Options:
+        -c CONFFILE, --config CONFFILE      path to configuration file
+    """
+    config = Config(options.get('--config'))
+    
+    case_provider = framework.InterfaceCaseProvider(
+        config.interface_dir,
+        config.service_name,
+        case_augmenter=config.case_augmenter,
+        compiled_case_store=config.compiled_case_store,
+    )
+    key_of_case = None
+    if config.case_augmenter is None:
+        if config.request_keys:
+            from intercom_test.cases import hash_from_fields
+            key_of_case = lambda case: hash_from_fields(
+                (k, v) for k, v in case.items() if k in config.request_keys
+            )
+        else:
+            key_of_case = framework.HTTPCaseAugmenter.key_of_case
+    
+    reports = case_provider.duplicate_cases(key_of_case=key_of_case)
+    for report in reports:
+        print(report.description())
+    if any(report.conflicting for report in reports):
+        sys.exit(1)
+
+@subcommand()
+def purge_cache(options):
+    """usage: {program} purgecache [options]
+    
+    Remove the cache directory (the 'cache dir' given in the configuration
+    file, or .intercom_cache in the directory of the configuration file)
+    
+    Options:
+        -c CONFFILE, --config CONFFILE      path to configuration file
+    """
+    config = Config(options.get('--config'))
+    disk_cache.purge(config.cache_dir)
+
 @subcommand()
 def merge_cases(options):
     """usage: {program} mergecases [options]
@@ -300,22 +398,35 @@ def http_stub_exchange(options):
     if using augmentation data, make sure to also list `method`, `url`, and
     `request body` under `request keys`.
     
+    With `--watch`, the test case files are checked for changes before each
+    request, and only changed files are reloaded.
+    
     Options:
         -c CONFFILE, --config CONFFILE      path to configuration file
+        -w, --watch                         reload changed test case files
     """
     config = Config(options.get('--config'))
+    watch = options.get('--watch')
     
     case_provider = framework.InterfaceCaseProvider(
         config.interface_dir,
         config.service_name,
+        compiled_case_store=config.compiled_case_store,
     )
     from intercom_test import http_best_matches
+    from intercom_test.cases import CaseKeyCache
     database = http_best_matches.Database(
-        case_provider.cases(),
+        () if watch else case_provider.cases(),
         add_request_keys=config.request_keys,
+        case_key_cache=CaseKeyCache(),
     )
+    watcher = None
+    if watch:
+        watcher = framework.SpecWatcher(case_provider, key_of_case=database.case_key)
     
     for line in sys.stdin:
+        if watcher is not None:
+            database.apply_changes(watcher.poll())
         database.json_exchange(line, sys.stdout)
 
 def csmain():
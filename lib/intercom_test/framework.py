@@ -12,34 +12,73 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import copy
 from enum import Enum
+from fnmatch import fnmatchcase
 import functools
+import hashlib
+import heapq
+import inspect
+import io
 from io import StringIO
+import itertools
 import json
 import logging
 import os.path
 import shutil
+import time
 import yaml
 from .cases import (
     IdentificationListReader as CaseIdListReader,
+    JSON_ASN1_KEY_SCHEME,
+    KEY_SCHEMES,
+    hash_from_der as _hash_from_der,
     hash_from_fields as _hash_from_fields,
+    hash_many as _hash_many,
+)
+from .exceptions import (
+    DataParseError,
+    KeySchemeMismatchError,
+    MultipleAugmentationEntriesError,
+    NoAugmentationError,
 )
-from .exceptions import MultipleAugmentationEntriesError, NoAugmentationError
 from .augmentation.compact_file import (
     augment_dict_from,
     case_keys as case_keys_in_compact_file,
+    key_scheme as key_scheme_of_compact_file,
+    MappedFile as MappedCompactFile,
+    key_scheme_header,
+    reindex as reindex_compact_file,
+    rekeyed_events,
     TestCaseAugmenter as CompactFileAugmenter,
     Updater as CompactAugmentationUpdater,
 )
 from .augmentation import update_file
+from .json_asn1.convert import SubtreeMemo
 from .utils import (
     FilteredDictView as _FilteredDictView,
-    open_temp_copy,
+    LazyJSON as _LazyJSON,
+    def_enum,
+    open_replacement as _open_replacement,
 )
 from .yaml_tools import (
     YAML_EXT,
     content_events as _yaml_content_events,
+    der_from_event_stream as _yaml_der_from_events,
+    document_chunks as _yaml_document_chunks,
+    file_positions as _file_positions,
     get_load_all_fn as _get_yaml_load_all,
+    parse as _yaml_parse,
+    is_self_contained as _yaml_is_self_contained,
+    mapping_entry_events as _yaml_mapping_entry_events,
+    mapping_scalars as _yaml_mapping_scalars,
+    node_events as _yaml_node_events,
+    sequence_item_events as _yaml_sequence_item_events,
+    sequence_items as _yaml_sequence_items,
+    value_from_event_stream as _yaml_value_from_events,
 )
 
 logger = logging.getLogger(__name__)
@@ -58,15 +97,57 @@ class InterfaceCaseProvider:
     Setting :attr:`use_body_type_magic` to ``True`` automatically parses the
     ``"request body"`` value as JSON if ``"request type"`` in the same test
     case is ``"json"``, and similarly for ``"response body"`` and
-    ``"response type"``.
+    ``"response type"``.  If :attr:`lazy_json_bodies` is also ``True``, the
+    bodies are instead replaced with :class:`.utils.LazyJSON` objects, which
+    parse the JSON only when first used (and keep the text as
+    :attr:`~.utils.LazyJSON.raw`); bodies used as augmentation key fields
+    (such as ``"request body"`` with :class:`HTTPCaseAugmenter`) are always
+    parsed immediately, since computing the case key requires them.
     
     .. automethod:: __init__
     """
     
     use_body_type_magic = False
     
+    lazy_json_bodies = False
+    
     safe_yaml_loading = True
     
+    # Set this to a number of worker processes (greater than 1) to parse test
+    # case files in parallel; files larger than parallel_parsing_chunk_size
+    # characters are split at document boundaries and parsed in chunks of
+    # about that size.  The parsed values must be picklable.
+    parallel_parsing_workers = None
+    parallel_parsing_chunk_size = 1 << 20
+    
+    # When true, cases() reuses the DER encodings of containers shared between
+    # the key fields of its test cases (e.g. through YAML aliases), and of
+    # equal key field values (e.g. the same request body written out in
+    # several test cases); see json_asn1.convert.SubtreeMemo
+    memoize_shared_subtrees = False
+    
+    # Set this to a cases.ParsedCaseCache to share the test cases parsed from
+    # each file with other instances using the same cache; setting it on this
+    # class shares them throughout the process
+    parsed_case_cache = None
+    
+    # Set this to a utils.StringPool to deduplicate the equal strings (field
+    # names, URLs, JSON object keys, etc.) of the test cases loaded from the
+    # test case files; setting it on this class shares the pool throughout
+    # the process
+    string_pool = None
+    
+    # When true (and there is a case augmenter), cases() logs a warning for
+    # each case key shared by more than one of the cases it generates; see
+    # duplicate_cases()
+    check_duplicate_cases = True
+    
+    # When true (and there is a case augmenter), cases() augments the cases
+    # of each test case file together with CaseAugmenter.augment_all, which
+    # reads the augmentation files sequentially; cases are then generated
+    # after their whole file has been loaded
+    batch_augmentation = False
+    
     class _UpdateState(Enum):
         not_requested   = '-'
         requested       = '?'
@@ -77,14 +158,38 @@ class InterfaceCaseProvider:
     
     _case_augmenter = None
     
-    def __init__(self, spec_dir, group_name, *, case_augmenter=None):
+    _augmenter_case_key = None
+    
+    _augmenter_case_keys = None
+    
+    def __init__(self, spec_dir, group_name, *, case_augmenter=None, case_key_cache=None, case_key_store=None, compiled_case_store=None, parsed_case_cache=None, string_pool=None):
         """Constructing an instance
         
         :param spec_dir: File system directory for test case specifications
         :param group_name: Name of the group of tests to load
         :keyword case_augmenter:
             *optional* An object providing the interface of a
-            :class:`.CaseAugmenter`
+            :class:`.CaseAugmenter`; one providing only
+            :meth:`~.CaseAugmenter.augmented_test_case` (without
+            :meth:`~.CaseAugmenter.case_key`) augments the cases, but the
+            cases are not checked for duplicates nor indexed by key
+        :keyword case_key_cache:
+            *optional* :class:`.cases.CaseKeyCache` to use when computing
+            case keys for augmentation
+        :keyword case_key_store:
+            *optional* :class:`.disk_cache.CaseKeyStore` in which to persist
+            the keys of the cases in each test case file for augmentation
+        :keyword compiled_case_store:
+            *optional* :class:`.disk_cache.CompiledCaseStore` in which to
+            cache the test cases parsed from each test case file
+        :keyword parsed_case_cache:
+            *optional* override of :attr:`parsed_case_cache`, a
+            :class:`.cases.ParsedCaseCache` in which to cache the test
+            cases parsed from each test case file in memory
+        :keyword string_pool:
+            *optional* override of :attr:`string_pool`, a
+            :class:`.utils.StringPool` for deduplicating the strings of the
+            loaded test cases
         
         The main test case file of the group is located in *spec_dir* and is
         named for *group_name* with the '.yml' extension added.  Extension
@@ -95,9 +200,37 @@ class InterfaceCaseProvider:
         self._spec_dir = spec_dir
         self._group_name = group_name
         self._compact_files_update = self._UpdateState.not_requested
+        self._case_key_cache = case_key_cache
+        self._case_key_store = case_key_store
+        self._compiled_case_store = compiled_case_store
+        if parsed_case_cache is not None and parsed_case_cache is not self.parsed_case_cache:
+            self.parsed_case_cache = parsed_case_cache
+        if string_pool is not None and string_pool is not self.string_pool:
+            self.string_pool = string_pool
+        self._indexed_cases = None
         if case_augmenter:
             self._case_augmenter = case_augmenter
-            self._augmented_case = case_augmenter.augmented_test_case
+            # Subclasses may still override augmented_test_case(self, test_case)
+            augment = _with_accepted_keywords(case_augmenter.augmented_test_case)
+            self._augment_test_case = augment
+            self._augments_in_batches = (
+                _accepts_keyword(augment, 'case_key')
+                and hasattr(case_augmenter, 'augment_all')
+            )
+            if all(
+                hasattr(case_augmenter, attr)
+                for attr in ('case_key', 'case_key_scheme', 'CASE_PRIMARY_KEYS')
+            ):
+                self._augmenter_case_key = _with_accepted_keywords(case_augmenter.case_key)
+                if hasattr(case_augmenter, 'case_keys'):
+                    self._augmenter_case_keys = _with_accepted_keywords(case_augmenter.case_keys)
+            if case_key_cache is None:
+                self._augmented_case = augment
+            else:
+                self._augmented_case = functools.partial(
+                    augment,
+                    case_key_cache=case_key_cache,
+                )
     
     @property
     def spec_dir(self):
@@ -114,6 +247,11 @@ class InterfaceCaseProvider:
         """The :class:`.CaseAugmenter` instance used by this object, if any"""
         return self._case_augmenter
     
+    @property
+    def case_key_cache(self):
+        """The :class:`.cases.CaseKeyCache` used by this object, if any"""
+        return self._case_key_cache
+    
     @property
     def main_group_test_file(self):
         """Path to the main test file of the group for this instance"""
@@ -123,20 +261,227 @@ class InterfaceCaseProvider:
         """Get an iterable of the extension files of this instance"""
         return extension_files(self.spec_dir, self.group_name)
     
-    def cases(self, ):
+    def case_files(self, ):
+        """Get a :class:`list` of the test case files of this instance, in the order read by :meth:`cases`"""
+        return [self.main_group_test_file] + sorted(self.extension_files())
+    
+    def __len__(self, ):
+        """Number of test cases generated by :meth:`cases`
+        
+        This and :meth:`case_at` and :meth:`case_by_key` use an index of the
+        test cases in the group's files, built on first use.  Only test
+        cases with aliases to anchors outside them are constructed to build
+        the index; otherwise, only the augmentation key fields of each case
+        are read (decoding only JSON bodies that are key fields, if
+        :attr:`use_body_type_magic` is set).  The index reflects the files
+        at that time; call :meth:`discard_case_index` to index changed
+        files.  An instance is true even if the group has no test cases.
+        """
+        return len(self._case_index()[0])
+    
+    def __bool__(self, ):
+        # Testing an instance must not index its files (as __len__ would)
+        return True
+    
+    def case_at(self, i):
+        """Get the test case at index *i* of those generated by :meth:`cases`
+        
+        :param int i: index of the test case; negative values count from the end
+        :raises IndexError: if *i* is out of range
+        
+        Only the requested case is parsed when the test case file is in block
+        format and the case contains no aliases to anchors outside it;
+        otherwise, its file is loaded to find the case.
+        """
+        indexed_cases, _ = self._case_index()
+        return self._case_from_index(indexed_cases[i])
+    
+    def discard_case_index(self, ):
+        """Discard the index used by :meth:`__len__`, :meth:`case_at`, etc.
+        
+        The index is rebuilt from the test case files when next used.
+        """
+        self._indexed_cases = None
+    
+    def case_key(self, test_case):
+        """Compute the augmentation case key of *test_case*
+        
+        :raises NoAugmentationError:
+            when no case augmentation data was specified during construction
+            of this object
+        :raises TypeError: if the case augmenter does not compute case keys
+        
+        The key is computed by :meth:`CaseAugmenter.case_key` of the case
+        augmenter, using the :attr:`case_key_cache` of this object (if any).
+        """
+        if self._case_augmenter is None:
+            raise NoAugmentationError("No augmentation data specified")
+        if self._augmenter_case_key is None:
+            raise TypeError("{!r} does not compute case keys".format(self._case_augmenter))
+        return self._case_key(test_case)
+    
+    def case_by_key(self, case_key):
+        """Get the test case with the given augmentation case key
+        
+        :param str case_key:
+            the key of the case, as computed by :meth:`case_key`
+        :raises NoAugmentationError:
+            when no case augmentation data was specified during construction
+            of this object
+        :raises TypeError: if the case augmenter does not compute case keys
+        :raises KeyError: if no test case has *case_key*
+        
+        If more than one test case has *case_key*, the first is returned.
+        """
+        if self._case_augmenter is None:
+            raise NoAugmentationError("No augmentation data specified")
+        if self._augmenter_case_key is None:
+            raise TypeError("{!r} does not compute case keys".format(self._case_augmenter))
+        indexed_cases, positions = self._case_index()
+        return self._case_from_index(indexed_cases[positions[case_key]])
+    
+    def cases(self, *, shard=None, of=None, case_weights=None, where=None):
         """Generates :class:`dict`\ s of test case data
         
+        :keyword int shard:
+            *optional* index (from 0) of the shard of test cases to generate
+        :keyword int of: number of shards, required with *shard*
+        :keyword case_weights:
+            *optional* mapping of shard keys (see below) to the recorded
+            runtimes (or other weights) of test cases, for balancing shards
+        :keyword where:
+            *optional* mapping of field names to patterns the fields of a
+            generated test case must match
+        
         This method reads test cases from the group's main test case file
         and auxiliary files, possibly extending them with augmented data (if
         *case_augmentations* was given in the constructor).
+        
+        If :attr:`parallel_parsing_workers` is set, the files (and chunks of
+        large files) are parsed in a process pool, but the cases are still
+        generated in the same order.
+        
+        Giving *shard* and *of* generates only the cases in one of *of*
+        disjoint shards of the test cases, in the same order as they would
+        otherwise be generated.  The cases are located through the same
+        index as :meth:`case_at`, so cases outside the shard are neither
+        constructed nor augmented.  The *shard key* of a case is its
+        augmentation case key if there is a case augmenter, otherwise its
+        index in the cases of the group.  Without *case_weights*, cases are
+        assigned to shards by a hash of their shard keys.  With
+        *case_weights*, cases are assigned to balance the total weight of
+        the shards, heaviest first; cases without a recorded weight are
+        assumed to have the mean recorded weight.  Either way, the assignment
+        depends only on the test cases (and weights), so every worker of a
+        distributed test run computes the same shards.
+        
+        Giving *where* generates only the cases having all of the fields it
+        names, with each value matching the corresponding pattern, which may
+        be a :class:`str` glob pattern (as for :func:`fnmatch.fnmatchcase`,
+        e.g. ``'/widgets/*'``), a compiled regular expression (found with its
+        ``search`` method) or a callable taking the field value and returning
+        a truth value.  Glob patterns and regular expressions only match
+        :class:`str` values.  The patterns are tested against the test case
+        data as read from the file (i.e. before any JSON body parsing or
+        augmentation), and as early as possible: where a test case's fields
+        are scalars in the YAML, the case is only constructed if it matches.
+        Parallel parsing is not used with *where* unless parsed test cases
+        are cached (see *compiled_case_store* and :attr:`parsed_case_cache`).
         """
-        yield from self._cases_from_file(self.main_group_test_file)
-        for ext_file in sorted(self.extension_files()):
-            yield from self._cases_from_file(ext_file)
+        predicate = None if where is None else _CasePredicate(where)
+        duplicates = None
+        if self.check_duplicate_cases and self._augmenter_case_key is not None:
+            duplicates = _DuplicateCaseIndex()
+        if shard is not None:
+            yield from self._cases_from_index(
+                self._shard_positions(shard, of, case_weights),
+                predicate=predicate,
+                duplicates=duplicates,
+            )
+        else:
+            yield from self._all_cases(predicate=predicate, duplicates=duplicates)
+        
+        if duplicates is not None:
+            for report in duplicates.reports(self._case_lines):
+                logger.warning("%s", report.description())
         
         if self._compact_files_update is self._UpdateState.requested:
             self.update_compact_files()
     
+    def duplicate_cases(self, *, key_of_case=None):
+        """Find test cases of this group sharing a case key
+        
+        :keyword key_of_case:
+            *optional* callable computing the key of a test case; defaults
+            to :meth:`case_key`
+        :returns: :class:`list` of :class:`DuplicateCases`
+        :raises NoAugmentationError:
+            if *key_of_case* is not given and no augmentation data was
+            specified during construction of this object
+        :raises TypeError:
+            if *key_of_case* is not given and the case augmenter does not
+            compute case keys
+        
+        Cases sharing a key (i.e. the same request, for
+        :class:`HTTPCaseAugmenter`) are *conflicting* if they differ in any
+        other field (e.g. the response).  The same check is run by
+        :meth:`cases` (unless :attr:`check_duplicate_cases` is false), which
+        logs the duplicates found as warnings.  Test cases are compared as
+        read from the files, i.e. without augmentation data; lazily parsed
+        JSON bodies (see :attr:`lazy_json_bodies`) are compared by their
+        text.
+        """
+        if key_of_case is None:
+            if self._case_augmenter is None:
+                raise NoAugmentationError("No augmentation data or key_of_case specified")
+            if self._augmenter_case_key is None:
+                raise TypeError("{!r} does not compute case keys".format(self._case_augmenter))
+            numbered_case_keys = self._numbered_case_keys
+        else:
+            def numbered_case_keys(numbered_cases):
+                for file_position, test_case in numbered_cases:
+                    yield file_position, test_case, key_of_case(test_case)
+        
+        duplicates = _DuplicateCaseIndex()
+        for case_file in self.case_files():
+            for file_position, test_case, case_key in numbered_case_keys(self._numbered_cases(case_file)):
+                duplicates.add(case_key, case_file, file_position, test_case)
+        return duplicates.reports(self._case_lines)
+    
+    def _case_lines(self, filepath):
+        with open(filepath) as stream:
+            return [
+                item_events[0].start_mark.line + 1
+                for item_events in _yaml_sequence_item_events(_yaml_parse(stream))
+            ]
+    
+    def _all_cases(self, *, predicate=None, duplicates=None):
+        key_options = {}
+        if self.memoize_shared_subtrees and self._augmenter_case_key is not None:
+            key_options['subtree_memo'] = SubtreeMemo()
+        
+        case_files = self.case_files()
+        with self._parallel_parsing(case_files, filtering=predicate is not None) as parsing:
+            for case_file in case_files:
+                yield from self._cases_from_file(
+                    case_file,
+                    parsing=parsing,
+                    predicate=predicate,
+                    duplicates=duplicates,
+                    **key_options
+                )
+    
+    def file_cases(self, filepath):
+        """Generates :class:`dict` objects of test case data from one test case file
+        
+        :param filepath: one of the paths from :meth:`case_files`
+        
+        The test cases are generated as by :meth:`cases`, but without
+        checking for duplicate test cases or updating compact augmentation
+        files.
+        """
+        return self._cases_from_file(filepath)
+    
     def update_compact_augmentation_on_success(self, fn):
         """Decorator for activating compact data file updates
         
@@ -162,7 +507,7 @@ class InterfaceCaseProvider:
         
         return wrapper
     
-    def case_runners(self, fn, *, do_compact_updates=True):
+    def case_runners(self, fn, *, do_compact_updates=True, **case_options):
         """Generates runner callables from a callable
         
         The callables in the returned iterable each call *fn* with all the
@@ -178,17 +523,20 @@ class InterfaceCaseProvider:
         * Each returned runner callable will log the test case as YAML prior
           to invoking *fn*, which is helpful when updating the augmenting data
           for the case becomes necessary
+        
+        Any other keyword arguments (e.g. *shard* and *of*) are passed to
+        :meth:`cases`.
         """
         
         if do_compact_updates:
             fn = self.update_compact_augmentation_on_success(fn)
         
-        for case in self.cases():
+        for case in self.cases(**case_options):
             @functools.wraps(fn)
             def wrapper(*args, **kwargs):
                 logger.info("{}\n{}".format(
                     " CASE TESTED ".center(40, '*'),
-                    yaml.dump([case]),
+                    yaml.dump([case], Dumper=_CaseDumper),
                 ))
                 return fn(*args, case, **kwargs)
             
@@ -205,6 +553,26 @@ class InterfaceCaseProvider:
             raise NoAugmentationError("No augmentation data specified")
         return self._case_augmenter.update_compact_files()
     
+    def rekey_compact_files(self, scheme):
+        """Calls the :class:`CaseAugmenter` to change the case key scheme of compact data files
+        
+        :param str scheme: one of :const:`.cases.KEY_SCHEMES`
+        :returns: see :meth:`CaseAugmenter.rekey_compact_files`
+        :raises NoAugmentationError:
+            when no case augmentation data was specified during construction
+            of this object
+        """
+        if self._case_augmenter is None:
+            raise NoAugmentationError("No augmentation data specified")
+        test_cases = itertools.chain(
+            self._loaded_cases(self.main_group_test_file),
+            *(
+                self._loaded_cases(ext_file)
+                for ext_file in sorted(self.extension_files())
+            )
+        )
+        return self._case_augmenter.rekey_compact_files(test_cases, scheme)
+    
     def merge_test_extensions(self, ):
         """Merge the extension files of the target group into the group's main file"""
         ext_files = sorted(self.extension_files())
@@ -218,21 +586,772 @@ class InterfaceCaseProvider:
         for ext_file in ext_files:
             os.remove(ext_file)
     
-    def _augmented_case(self, x):
+    def _augmented_case(self, x, **key_options):
         """This method is defined to be overwritten on the instance level when augmented data is used"""
         return x
     
-    def _cases_from_file(self, filepath):
-        with open(filepath) as file:
+    def _cases_from_file(self, filepath, *, parsing=None, predicate=None, duplicates=None, **key_options):
+        keys_cases = self._augmenter_case_key is not None
+        if self._case_key_store is not None and keys_cases:
+            yield from self._augmented_keyed_cases(self._keyed_cases_with_stored_keys(
+                filepath,
+                parsing=parsing,
+                predicate=predicate,
+                duplicates=duplicates,
+                **key_options
+            ))
+            return
+        
+        numbered_cases = self._numbered_cases(filepath, parsing=parsing, predicate=predicate)
+        if duplicates is None and not (
+            keys_cases and (self.batch_augmentation or self._hashes_in_parallel())
+        ):
+            for _, test_case in numbered_cases:
+                yield self._augmented_case(test_case, **key_options)
+            return
+        
+        yield from self._augmented_keyed_cases(
+            self._keyed_cases(filepath, numbered_cases, duplicates=duplicates, **key_options)
+        )
+    
+    def _case_key(self, test_case, **key_options):
+        return self._augmenter_case_key(
+            test_case,
+            case_key_cache=self._case_key_cache,
+            **key_options
+        )
+    
+    def _hashes_in_parallel(self, ):
+        # Whether the augmenter may compute the keys of a file's cases in
+        # worker processes (see CaseAugmenter.parallel_hashing_threshold)
+        return (
+            self._augmenter_case_keys is not None
+            and getattr(self._case_augmenter, 'parallel_hashing_threshold', None) is not None
+        )
+    
+    def _numbered_case_keys(self, numbered_cases, **key_options):
+        if not self._hashes_in_parallel():
+            for file_position, test_case in numbered_cases:
+                yield file_position, test_case, self._case_key(test_case, **key_options)
+            return
+        
+        numbered_cases = list(numbered_cases)
+        case_keys = self._augmenter_case_keys(
+            [test_case for _, test_case in numbered_cases],
+            case_key_cache=self._case_key_cache,
+        )
+        for (file_position, test_case), case_key in zip(numbered_cases, case_keys):
+            yield file_position, test_case, case_key
+    
+    def _keyed_cases(self, filepath, numbered_cases, *, duplicates=None, **key_options):
+        for file_position, test_case, case_key in self._numbered_case_keys(numbered_cases, **key_options):
+            if duplicates is not None:
+                duplicates.add(case_key, filepath, file_position, test_case)
+            yield test_case, case_key
+    
+    def _augmented_keyed_cases(self, keyed_cases):
+        augmenter = self._case_augmenter
+        if not (self.batch_augmentation and self._augments_in_batches):
+            for test_case, case_key in keyed_cases:
+                yield self._augment_test_case(test_case, case_key=case_key)
+            return
+        
+        test_cases, case_keys = [], []
+        for test_case, case_key in keyed_cases:
+            test_cases.append(test_case)
+            case_keys.append(case_key)
+        yield from augmenter.augment_all(test_cases, case_keys=case_keys)
+    
+    def _loaded_cases(self, filepath, *, parsing=None, predicate=None):
+        for _, test_case in self._numbered_cases(filepath, parsing=parsing, predicate=predicate):
+            yield test_case
+    
+    def _numbered_cases(self, filepath, *, parsing=None, predicate=None):
+        if self._caches_parsed_cases():
+            test_cases = enumerate(self._cached_cases(filepath, parsing=parsing))
+        elif predicate is not None and parsing is None:
+            test_cases = self._matching_parsed_cases(filepath, predicate)
+        else:
+            test_cases = enumerate(self._parsed_cases(filepath, parsing=parsing))
+        for file_position, test_case in test_cases:
+            if predicate is not None and not predicate(test_case):
+                continue
+            if self.use_body_type_magic:
+                _parse_json_bodies(test_case, lazy_fields=self._lazy_body_fields())
+            if self.string_pool is not None:
+                self.string_pool.intern_strings(test_case)
+            yield file_position, test_case
+    
+    def _matching_parsed_cases(self, filepath, predicate):
+        file_cases = None
+        with open(filepath) as stream:
+            items = _yaml_sequence_item_events(_yaml_parse(stream))
+            for file_position, item_events in enumerate(items):
+                fields = _yaml_mapping_scalars(item_events, predicate.fields)
+                if fields is not None and not predicate(fields):
+                    continue
+                
+                if not _yaml_is_self_contained(item_events):
+                    # Aliases to anchors outside the case require loading the whole file
+                    if file_cases is None:
+                        file_cases = list(self._parsed_cases(filepath))
+                    yield file_position, file_cases[file_position]
+                    continue
+                
+                yield file_position, _yaml_value_from_events(
+                    item_events,
+                    safe_loading=self.safe_yaml_loading,
+                )
+    
+    def _lazy_body_fields(self, ):
+        if not self.lazy_json_bodies:
+            return ()
+        if self._case_augmenter is None:
+            return _JSON_BODY_FIELDS
+        # Any body may be a key field of an augmenter not declaring its key fields
+        key_fields = getattr(self._case_augmenter, 'CASE_PRIMARY_KEYS', _JSON_BODY_FIELDS)
+        return _JSON_BODY_FIELDS - frozenset(key_fields)
+    
+    def _parsed_cases(self, filepath, *, content=None, parsing=None):
+        if parsing is not None:
+            yield from parsing.cases(filepath, content=content)
+            return
+        
+        with (open(filepath) if content is None else content) as file:
             load_all_yaml = _get_yaml_load_all(safe=self.safe_yaml_loading)
-            for test_case in (
+            yield from (
                 tc
                 for case_set in load_all_yaml(file)
                 for tc in case_set
+            )
+    
+    def _case_index(self, ):
+        if self._indexed_cases is None:
+            indexed_cases = []
+            for case_file in self.case_files():
+                indexed_cases.extend(
+                    _IndexedCase(case_file, offset, file_position, case_key)
+                    for file_position, (case_key, offset) in enumerate(
+                        self._case_index_entries(case_file)
+                    )
+                )
+            
+            positions = {}
+            for position, indexed_case in enumerate(indexed_cases):
+                positions.setdefault(indexed_case.case_key, position)
+            self._indexed_cases = (indexed_cases, positions)
+        return self._indexed_cases
+    
+    def _case_index_entries(self, filepath):
+        augmenter = self._case_augmenter
+        kind = 'case-index'
+        if self._augmenter_case_key is None:
+            augmenter, key_fields = None, ()
+        else:
+            key_fields = augmenter.CASE_PRIMARY_KEYS
+            if self.use_body_type_magic:
+                # Parsing JSON bodies changes the case keys
+                kind += '+json-bodies'
+            if augmenter.case_key_scheme not in (None, JSON_ASN1_KEY_SCHEME):
+                kind += ':' + augmenter.case_key_scheme
+        
+        key_store = self._case_key_store
+        if key_store is not None:
+            entries = key_store.load(filepath, kind, key_fields)
+            if entries is not None:
+                return entries
+            identity = key_store.file_identity(filepath)
+        
+        offsets, case_keys = [], []
+        with open(filepath) as stream:
+            for item_events, flow_style in _yaml_sequence_items(_yaml_parse(stream)):
+                if not _yaml_is_self_contained(item_events):
+                    # Aliases to anchors outside the case require loading the whole file
+                    offsets.append(None)
+                    case_keys.append(None)
+                    continue
+                
+                # Only cases of block sequences start lines of their own
+                case_start = item_events[0].start_mark
+                offsets.append(None if flow_style else case_start.index - case_start.column)
+                if augmenter is None or not _has_default_case_keys(augmenter):
+                    case_keys.append(None)
+                else:
+                    case_keys.append(self._case_key_from_events(item_events))
+        
+        if augmenter is not None and None in case_keys:
+            # Key the remaining cases from the constructed cases
+            unkeyed_cases = (
+                (file_position, test_case)
+                for file_position, test_case in self._numbered_cases(filepath)
+                if case_keys[file_position] is None
+            )
+            for file_position, _, case_key in self._numbered_case_keys(unkeyed_cases):
+                case_keys[file_position] = case_key
+        entries = list(zip(case_keys, _file_positions(filepath, offsets)))
+        
+        if key_store is not None:
+            key_store.save(filepath, kind, key_fields, entries, identity)
+        return entries
+    
+    def _case_key_from_events(self, item_events):
+        augmenter = self._case_augmenter
+        key_fields = augmenter.CASE_PRIMARY_KEYS
+        json_bodies = []
+        if self.use_body_type_magic:
+            # Parsing JSON bodies changes the case keys
+            json_bodies = [
+                (type_field, body_field)
+                for type_field, body_field in _JSON_BODY_TYPES
+                if body_field in key_fields
+            ]
+        if not json_bodies and augmenter.case_key_scheme in (None, JSON_ASN1_KEY_SCHEME):
+            return _hash_from_der(_yaml_der_from_events(
+                item_events,
+                safe_loading=self.safe_yaml_loading,
+                key_filter=key_fields.__contains__,
+            ))
+        
+        entries = _yaml_mapping_entry_events(
+            item_events,
+            key_fields.union(type_field for type_field, _ in json_bodies),
+        )
+        if entries is None:
+            # Merge keys (or the like) require constructing the case
+            test_case = _yaml_value_from_events(item_events, safe_loading=self.safe_yaml_loading)
+            if self.use_body_type_magic:
+                _parse_json_bodies(test_case)
+            return self._case_key(test_case)
+        
+        fields = dict(
+            (k, _yaml_value_from_events(v, safe_loading=self.safe_yaml_loading))
+            for k, v in entries.items()
+        )
+        for type_field, body_field in json_bodies:
+            if fields.get(type_field) == 'json':
+                fields[body_field] = json.loads(fields[body_field])
+        return self._case_key(dict(
+            (k, v) for k, v in fields.items()
+            if k in key_fields
+        ))
+    
+    def _shard_positions(self, shard, of, case_weights):
+        if of is None or not 0 <= shard < of:
+            raise ValueError("shard must be in range(of)")
+        indexed_cases, _ = self._case_index()
+        if self._augmenter_case_key is None:
+            shard_keys = list(range(len(indexed_cases)))
+        else:
+            shard_keys = [indexed_case.case_key for indexed_case in indexed_cases]
+        
+        if case_weights is None:
+            return [
+                position
+                for position, shard_key in enumerate(shard_keys)
+                if _shard_hash(shard_key) % of == shard
+            ]
+        
+        weights = [case_weights.get(shard_key) for shard_key in shard_keys]
+        recorded = [w for w in weights if w is not None]
+        default_weight = sum(recorded) / len(recorded) if recorded else 1
+        weights = [default_weight if w is None else w for w in weights]
+        
+        # Assign the heaviest remaining case to the lightest shard
+        shard_loads = [(0, i) for i in range(of)]
+        positions = []
+        for position in sorted(range(len(weights)), key=lambda p: (-weights[p], p)):
+            load, assigned_shard = heapq.heappop(shard_loads)
+            heapq.heappush(shard_loads, (load + weights[position], assigned_shard))
+            if assigned_shard == shard:
+                positions.append(position)
+        return sorted(positions)
+    
+    def _cases_from_index(self, positions, *, predicate=None, duplicates=None):
+        indexed_cases, _ = self._case_index()
+        file_cases = (None, None)
+        for position in positions:
+            indexed_case = indexed_cases[position]
+            if indexed_case.offset is not None:
+                test_case = self._parsed_case_from_index(indexed_case, predicate=predicate)
+            else:
+                # Load the file only once for consecutive cases requiring it
+                if file_cases[0] != indexed_case.file_path:
+                    file_cases = (
+                        indexed_case.file_path,
+                        list(self._parsed_cases(indexed_case.file_path)),
+                    )
+                test_case = copy.deepcopy(file_cases[1][indexed_case.file_position])
+            
+            if test_case is None:
+                continue
+            if predicate is not None and not predicate(test_case):
+                continue
+            if duplicates is not None:
+                duplicates.add(
+                    indexed_case.case_key,
+                    indexed_case.file_path,
+                    indexed_case.file_position,
+                    test_case,
+                )
+            yield self._case_from_index(indexed_case, test_case=test_case)
+    
+    def _case_from_index(self, indexed_case, *, test_case=None):
+        if test_case is None:
+            test_case = self._parsed_case_from_index(indexed_case)
+        if self.use_body_type_magic:
+            _parse_json_bodies(test_case, lazy_fields=self._lazy_body_fields())
+        if self.string_pool is not None:
+            self.string_pool.intern_strings(test_case)
+        if self._case_augmenter is None:
+            return test_case
+        return self._augment_test_case(test_case, case_key=indexed_case.case_key)
+    
+    def _parsed_case_from_index(self, indexed_case, *, predicate=None):
+        if indexed_case.offset is None:
+            return next(itertools.islice(
+                self._parsed_cases(indexed_case.file_path),
+                indexed_case.file_position,
+                None
+            ))
+        
+        with open(indexed_case.file_path) as stream:
+            stream.seek(indexed_case.offset)
+            events = _yaml_parse(stream)
+            next(events) # should be yaml.StreamStartEvent
+            next(events) # should be yaml.DocumentStartEvent
+            case_start = next(events)
+            if isinstance(case_start, yaml.SequenceStartEvent):
+                case_start = next(events)
+            case_events = _yaml_node_events(itertools.chain((case_start,), events))
+        
+        if predicate is not None:
+            fields = _yaml_mapping_scalars(case_events, predicate.fields)
+            if fields is not None and not predicate(fields):
+                return None
+        return _yaml_value_from_events(case_events, safe_loading=self.safe_yaml_loading)
+    
+    @contextmanager
+    def _parallel_parsing(self, case_files, *, filtering=False):
+        workers = self.parallel_parsing_workers
+        if filtering and not self._caches_parsed_cases():
+            # Filtering the YAML events avoids constructing most cases
+            workers = None
+        if workers is None or workers <= 1:
+            yield None
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsing = _ParallelCaseParsing(
+                executor,
+                safe=self.safe_yaml_loading,
+                chunk_size=self.parallel_parsing_chunk_size,
+            )
+            try:
+                if not self._caches_parsed_cases():
+                    # Every file will be parsed, so start on all of them now
+                    for case_file in case_files:
+                        parsing.prefetch(case_file)
+                yield parsing
+            finally:
+                parsing.cancel()
+    
+    def _caches_parsed_cases(self, ):
+        return self._compiled_case_store is not None or self.parsed_case_cache is not None
+    
+    def _cached_cases(self, filepath, *, parsing=None):
+        cache = self.parsed_case_cache
+        if cache is None:
+            return self._compiled_cases(filepath, parsing=parsing)
+        
+        kind = 'safe' if self.safe_yaml_loading else 'unsafe'
+        test_cases = cache.load(filepath, kind)
+        if test_cases is None:
+            identity = cache.file_identity(filepath)
+            if self._compiled_case_store is not None:
+                test_cases = self._compiled_cases(filepath, parsing=parsing)
+            else:
+                test_cases = list(self._parsed_cases(filepath, parsing=parsing))
+            cache.save(filepath, kind, test_cases, identity)
+        return test_cases
+    
+    def _compiled_cases(self, filepath, *, parsing=None):
+        store = self._compiled_case_store
+        kind = 'safe' if self.safe_yaml_loading else 'unsafe'
+        with open(filepath, 'rb') as file:
+            content = file.read()
+        digest = hashlib.sha256(content).hexdigest()
+        
+        test_cases = store.load(filepath, kind, digest)
+        if test_cases is None:
+            # Decode as open(filepath) would
+            test_cases = list(self._parsed_cases(
+                filepath,
+                content=io.TextIOWrapper(io.BytesIO(content)),
+                parsing=parsing,
+            ))
+            store.save(filepath, kind, digest, test_cases)
+        return test_cases
+    
+    def _keyed_cases_with_stored_keys(self, filepath, *, parsing=None, predicate=None, duplicates=None, **key_options):
+        key_store = self._case_key_store
+        augmenter = self._case_augmenter
+        key_fields = augmenter.CASE_PRIMARY_KEYS
+        key_scheme = augmenter.case_key_scheme
+        # Parsing JSON bodies changes the case keys
+        kind = 'cases+json-bodies' if self.use_body_type_magic else 'cases'
+        if key_scheme not in (None, JSON_ASN1_KEY_SCHEME):
+            kind += ':' + key_scheme
+        
+        stored_keys = key_store.load(filepath, kind, key_fields) or ()
+        if stored_keys or predicate is not None:
+            # Only store keys computed for every case
+            identity = None
+        else:
+            identity = key_store.file_identity(filepath)
+        numbered_cases = self._numbered_cases(filepath, parsing=parsing, predicate=predicate)
+        if stored_keys:
+            numbered_case_keys = (
+                (case_index, test_case, stored_keys[case_index])
+                if case_index < len(stored_keys)
+                else (case_index, test_case, self._case_key(test_case, **key_options))
+                for case_index, test_case in numbered_cases
+            )
+        else:
+            numbered_case_keys = self._numbered_case_keys(numbered_cases, **key_options)
+        case_keys = []
+        for case_index, test_case, case_key in numbered_case_keys:
+            case_keys.append(case_key)
+            if duplicates is not None:
+                duplicates.add(case_key, filepath, case_index, test_case)
+            yield test_case, case_key
+        
+        if identity is not None:
+            key_store.save(filepath, kind, key_fields, case_keys, identity)
+
+_IndexedCase = namedtuple('_IndexedCase', 'file_path offset file_position case_key')
+
+CaseLocation = namedtuple('CaseLocation', 'file_path line')
+CaseLocation.__doc__ = """Location (with 1-based line number) of a test case in a test case file"""
+
+class DuplicateCases(namedtuple('DuplicateCases', 'case_key locations conflicting')):
+    """Test cases sharing a case key, reported by :meth:`InterfaceCaseProvider.duplicate_cases`
+    
+    *locations* is a :class:`list` of :class:`CaseLocation`, in the order
+    the cases are generated; *conflicting* is true if the cases differ.
+    """
+    __slots__ = ()
+    
+    def description(self, ):
+        """Describe the duplicates in text"""
+        return "{} test cases with key {}{}:\n{}".format(
+            len(self.locations),
+            self.case_key,
+            " conflict" if self.conflicting else "",
+            "\n".join(
+                "    {}:{}".format(location.file_path, location.line)
+                for location in self.locations
+            ),
+        )
+
+class _DuplicateCaseIndex:
+    def __init__(self, ):
+        super().__init__()
+        # Case key -> (file path, file position, content hash) of first case
+        self._first = {}
+        # Case key -> all such entries for the key, if more than one
+        self._duplicates = {}
+    
+    def add(self, case_key, file_path, file_position, test_case):
+        entry = (file_path, file_position, _content_hash(test_case))
+        first = self._first.setdefault(case_key, entry)
+        if first is not entry:
+            self._duplicates.setdefault(case_key, [first]).append(entry)
+    
+    def reports(self, case_lines):
+        lines_by_file = {}
+        def line_of(file_path, file_position):
+            if file_path not in lines_by_file:
+                lines_by_file[file_path] = case_lines(file_path)
+            return lines_by_file[file_path][file_position]
+        
+        return [
+            DuplicateCases(
+                case_key,
+                [CaseLocation(path, line_of(path, position)) for path, position, _ in entries],
+                len(set(content_hash for _, _, content_hash in entries)) > 1,
+            )
+            for case_key, entries in self._duplicates.items()
+        ]
+
+def _content_hash(test_case):
+    try:
+        return hash(_content_fingerprint(test_case))
+    except TypeError:
+        # Unhashable leaf values; fall back to the representation
+        return hash(repr(test_case))
+
+def _content_fingerprint(value):
+    if isinstance(value, _LazyJSON):
+        return (_LazyJSON, value.raw)
+    elif isinstance(value, (str, int, float)) or value is None:
+        return (type(value), value)
+    elif callable(getattr(value, 'items', None)):
+        return frozenset((k, _content_fingerprint(v)) for k, v in value.items())
+    elif isinstance(value, (list, tuple)):
+        return tuple(_content_fingerprint(item) for item in value)
+    return (type(value), value)
+
+class _CasePredicate:
+    def __init__(self, where):
+        super().__init__()
+        self.fields = frozenset(where)
+        self._tests = [
+            (field, _field_test(pattern))
+            for field, pattern in where.items()
+        ]
+    
+    def __call__(self, test_case):
+        for field, test in self._tests:
+            if field not in test_case or not test(test_case[field]):
+                return False
+        return True
+
+def _field_test(pattern):
+    if isinstance(pattern, str):
+        return lambda value: isinstance(value, str) and fnmatchcase(value, pattern)
+    elif callable(getattr(pattern, 'search', None)):
+        return lambda value: isinstance(value, str) and pattern.search(value) is not None
+    elif callable(pattern):
+        return pattern
+    raise TypeError("{!r} is not a glob pattern, regular expression or callable".format(pattern))
+
+def _with_accepted_keywords(fn):
+    """Wrap *fn* to drop any keyword arguments its signature does not accept"""
+    try:
+        params = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return fn
+    if any(p.kind is p.VAR_KEYWORD for p in params):
+        return fn
+    accepted = frozenset(
+        p.name for p in params
+        if p.kind in (p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)
+    )
+    
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        return fn(*args, **{k: v for k, v in kwargs.items() if k in accepted})
+    call.accepted_keywords = accepted
+    return call
+
+def _has_default_case_keys(augmenter):
+    """Test whether *augmenter* computes case keys as :class:`CaseAugmenter` does
+    
+    Only then can the keys be computed from YAML events.
+    """
+    augmenter_class = type(augmenter)
+    key_of_case = getattr(augmenter_class, 'key_of_case', None)
+    return (
+        getattr(key_of_case, '__func__', None) is CaseAugmenter.key_of_case.__func__
+        and getattr(augmenter_class, 'case_key', None) is CaseAugmenter.case_key
+    )
+
+def _accepts_keyword(fn, name):
+    accepted = getattr(fn, 'accepted_keywords', None)
+    return accepted is None or name in accepted
+
+def _shard_hash(shard_key):
+    if isinstance(shard_key, int):
+        shard_key = str(shard_key)
+    return int.from_bytes(hashlib.sha256(shard_key.encode('utf-8')).digest()[:8], 'big')
+
+class _ParallelCaseParsing:
+    def __init__(self, executor, *, safe, chunk_size):
+        super().__init__()
+        self._executor = executor
+        self._safe = safe
+        self._chunk_size = chunk_size
+        self._pending = {}
+    
+    def prefetch(self, filepath):
+        self._pending[filepath] = self._submit(filepath)
+    
+    def cases(self, filepath, *, content=None):
+        futures = self._pending.pop(filepath, None)
+        if futures is None or content is not None:
+            futures = self._submit(filepath, content=content)
+        for future in futures:
+            yield from future.result()
+    
+    def cancel(self, ):
+        for futures in self._pending.values():
+            for future in futures:
+                future.cancel()
+        self._pending.clear()
+    
+    def _submit(self, filepath, *, content=None):
+        with (open(filepath) if content is None else content) as file:
+            text = file.read()
+        return [
+            self._executor.submit(_cases_from_yaml_text, chunk, self._safe)
+            for chunk in _yaml_document_chunks(text, self._chunk_size)
+        ]
+
+def _cases_from_yaml_text(text, safe):
+    load_all_yaml = _get_yaml_load_all(safe=safe)
+    return [
+        tc
+        for case_set in load_all_yaml(text)
+        for tc in case_set
+    ]
+
+CaseChange = namedtuple('CaseChange', 'kind case_key old_case new_case')
+CaseChange.__doc__ = """A change to the test cases of a group, reported by :class:`SpecWatcher`
+
+*kind* is a :class:`SpecWatcher.ChangeKind`; *old_case* is ``None`` for an
+added case and *new_case* is ``None`` for a removed case.
+"""
+
+class SpecWatcher:
+    """Incrementally tracks changes to the test cases of an :class:`InterfaceCaseProvider`
+    
+    Each call to :meth:`poll` checks the group's main test case file and
+    extension files for changes (by modification time, size and inode) and
+    re-reads only the files that changed, reporting the differences as
+    :class:`CaseChange` objects keyed by case key.  The first poll reports
+    every case as added.  A consumer (e.g. an
+    :class:`.http_best_matches.Database`, through its
+    :meth:`~.http_best_matches.Database.apply_changes`) can then apply the
+    changes instead of reloading all test cases.
+    
+    Test cases are read as by :meth:`InterfaceCaseProvider.cases`, so they
+    include augmentation data; changes to the augmentation data files
+    themselves are not detected.  A file that fails to parse (e.g. because
+    it is being written) is logged and its previous cases are kept until it
+    changes again.
+    
+    .. automethod:: __init__
+    """
+    
+    # Seconds between checks in watch()
+    poll_interval = 1.0
+    
+    @def_enum
+    def ChangeKind():
+        return "added removed changed"
+    
+    def __init__(self, case_provider, *, key_of_case=None, poll_interval=None):
+        """Constructing an instance
+        
+        :param case_provider: the :class:`InterfaceCaseProvider` to watch
+        :keyword key_of_case:
+            *optional* callable computing the key of a test case; defaults
+            to :meth:`InterfaceCaseProvider.case_key` of *case_provider*
+        :keyword float poll_interval:
+            *optional* override of :attr:`poll_interval`
+        :raises NoAugmentationError:
+            if *key_of_case* is not given and *case_provider* has no case
+            augmenter
+        """
+        super().__init__()
+        if key_of_case is None:
+            if case_provider.case_augmenter is None:
+                raise NoAugmentationError("No augmentation data or key_of_case specified")
+            key_of_case = case_provider.case_key
+        if poll_interval is not None and poll_interval != self.poll_interval:
+            self.poll_interval = poll_interval
+        self._case_provider = case_provider
+        self._key_of_case = key_of_case
+        # Path -> (file status, [(case key, test case), ...])
+        self._files = {}
+    
+    def cases(self, ):
+        """Get the test cases as of the last :meth:`poll`, in file order"""
+        return [
+            test_case
+            for case_file in self._case_provider.case_files()
+            for _, test_case in self._files.get(case_file, (None, ()))[1]
+        ]
+    
+    def poll(self, ):
+        """Check for changed test case files and report the case changes
+        
+        :returns: :class:`list` of :class:`CaseChange`
+        """
+        old_cases, new_cases = [], []
+        current_files = set()
+        for case_file in self._case_provider.case_files():
+            try:
+                status = _file_status(case_file)
+            except FileNotFoundError:
+                continue
+            current_files.add(case_file)
+            previous = self._files.get(case_file)
+            if previous is not None and previous[0] == status:
+                continue
+            
+            try:
+                keyed_cases = [
+                    (self._key_of_case(test_case), test_case)
+                    for test_case in self._case_provider.file_cases(case_file)
+                ]
+            except (yaml.YAMLError, DataParseError, ValueError) as e:
+                logger.warning("Unable to read test cases from %s: %s", case_file, e)
+                keyed_cases = () if previous is None else previous[1]
+            if previous is not None:
+                old_cases.extend(previous[1])
+            new_cases.extend(keyed_cases)
+            self._files[case_file] = (status, keyed_cases)
+        
+        for case_file in set(self._files) - current_files:
+            old_cases.extend(self._files.pop(case_file)[1])
+        
+        changes = self._changes(old_cases, new_cases)
+        if changes:
+            # Any index of the cases is out of date
+            self._case_provider.discard_case_index()
+        return changes
+    
+    def watch(self, ):
+        """Poll indefinitely, generating each non-empty :class:`list` of changes
+        
+        The files are checked every :attr:`poll_interval` seconds.
+        """
+        while True:
+            changes = self.poll()
+            if changes:
+                yield changes
+            time.sleep(self.poll_interval)
+    
+    def _changes(self, old_cases, new_cases):
+        old_by_key = _group_by_key(old_cases)
+        new_by_key = _group_by_key(new_cases)
+        changes = []
+        # Report in the order of the new cases, then of the removed cases
+        case_keys = list(new_by_key)
+        case_keys.extend(k for k in old_by_key if k not in new_by_key)
+        for case_key in case_keys:
+            for old_case, new_case in itertools.zip_longest(
+                old_by_key.get(case_key, ()),
+                new_by_key.get(case_key, ()),
             ):
-                if self.use_body_type_magic:
-                    _parse_json_bodies(test_case)
-                yield self._augmented_case(test_case)
+                if old_case is None:
+                    changes.append(CaseChange(self.ChangeKind.added, case_key, None, new_case))
+                elif new_case is None:
+                    changes.append(CaseChange(self.ChangeKind.removed, case_key, old_case, None))
+                elif old_case != new_case:
+                    changes.append(CaseChange(self.ChangeKind.changed, case_key, old_case, new_case))
+        return changes
+
+def _file_status(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+def _group_by_key(keyed_cases):
+    result = {}
+    for case_key, test_case in keyed_cases:
+        result.setdefault(case_key, []).append(test_case)
+    return result
 
 def extension_files(spec_dir, group_name):
     """Iterator of file paths for extensions of a test case group
@@ -258,11 +1377,37 @@ def data_files(dir_path):
         
         yield entry
 
-def _parse_json_bodies(test_case):
-    if test_case.get('request type') == 'json':
-        test_case['request body'] = json.loads(test_case['request body'])
-    if test_case.get('response type') == 'json':
-        test_case['response body'] = json.loads(test_case['response body'])
+_JSON_BODY_TYPES = (
+    ('request type', 'request body'),
+    ('response type', 'response body'),
+)
+_JSON_BODY_FIELDS = frozenset(body_field for _, body_field in _JSON_BODY_TYPES)
+
+def _parse_json_bodies(test_case, *, lazy_fields=()):
+    for type_field, body_field in _JSON_BODY_TYPES:
+        if test_case.get(type_field) != 'json':
+            continue
+        if body_field in lazy_fields:
+            test_case[body_field] = _LazyJSON(test_case[body_field])
+        else:
+            test_case[body_field] = json.loads(test_case[body_field])
+
+def _represent_lazy_json(dumper, data):
+    # Dump the JSON text as in the test case file, without parsing it
+    return dumper.represent_str(data.raw)
+
+class _SafeCaseDumper(yaml.SafeDumper):
+    # Dumper for test cases (see _represent_lazy_json), registering its
+    # representers without changing those of yaml.SafeDumper
+    pass
+
+class _CaseDumper(yaml.Dumper):
+    # As _SafeCaseDumper, for test cases that may hold arbitrary objects
+    pass
+
+for _dumper in (_SafeCaseDumper, _CaseDumper):
+    _dumper.add_representer(_LazyJSON, _represent_lazy_json)
+del _dumper
 
 class CaseAugmenter:
     """Base class of case augmentation data managers
@@ -311,34 +1456,139 @@ class CaseAugmenter:
     # execution from loaded YAML
     safe_loading = True
     
-    def __init__(self, augmentation_data_dir):
+    # Set this to a cases.CaseKeyCache to memoize case keys
+    case_key_cache = None
+    
+    # Set this to a disk_cache.CaseKeyStore to persist the indexes of update
+    # and compact files
+    case_key_store = None
+    
+    # Set this to the minimum number of cases for which keys_of_cases and
+    # case_keys compute the case keys in parallel (with cases.hash_many)
+    parallel_hashing_threshold = None
+    
+    # Set this to one of cases.KEY_SCHEMES to require that case key scheme;
+    # otherwise, the scheme is taken from the headers of the compact files
+    case_key_scheme = None
+    
+    # Set this to a cases.AugmentationCache to reuse the augmentation data
+    # decoded for each case when the case is augmented again
+    augmentation_cache = None
+    
+    def __init__(self, augmentation_data_dir, *, case_key_cache=None, case_key_store=None, case_key_scheme=None, augmentation_cache=None):
         """Constructing an instance
         
         :param augmentation_data_dir:
             path to directory holding the augmentation data
+        :keyword case_key_cache:
+            *optional* :class:`.cases.CaseKeyCache` for memoizing the keys
+            computed by :meth:`augmented_test_case`
+        :keyword case_key_store:
+            *optional* :class:`.disk_cache.CaseKeyStore` for persisting the
+            case keys indexed from update and compact files
+        :keyword str case_key_scheme:
+            *optional* case key scheme (one of :const:`.cases.KEY_SCHEMES`)
+            required of the compact files
+        :keyword augmentation_cache:
+            *optional* :class:`.cases.AugmentationCache` in which to keep the
+            augmentation data decoded for each case
+        :raises KeySchemeMismatchError:
+            if the compact files do not all use the same case key scheme (or
+            the one given as *case_key_scheme*)
+        
+        Compact files record their case key scheme in a header (see
+        :func:`.augmentation.compact_file.key_scheme`); if neither the
+        compact files nor *case_key_scheme* specify otherwise, the
+        :const:`.cases.JSON_ASN1_KEY_SCHEME` is used.
         """
         super().__init__()
+        if case_key_cache is not None:
+            self.case_key_cache = case_key_cache
+        if case_key_store is not None:
+            self.case_key_store = case_key_store
+        if case_key_scheme is not None:
+            self.case_key_scheme = case_key_scheme
+        if augmentation_cache is not None:
+            self.augmentation_cache = augmentation_cache
+        if self.case_key_scheme not in (None,) + KEY_SCHEMES:
+            raise ValueError("Unknown case key scheme {!r}".format(self.case_key_scheme))
+        self._augmentation_data_dir = augmentation_data_dir
+        # Subclasses may still override key_of_case(cls, test_case)
+        self._key_of_case = _with_accepted_keywords(self.key_of_case)
+        self._mapped_files = {}
+        self._load_augmentation_data()
+    
+    def __enter__(self, ):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @property
+    def augmentation_data_dir(self):
+        return self._augmentation_data_dir
+    
+    def close(self, ):
+        """Release the memory maps of the compact files
+        
+        The compact files are mapped (see
+        :class:`.augmentation.compact_file.MappedFile`) as augmentation data
+        is read from them, with one mapping per file shared by all of its
+        cases.  Augmenting after closing maps the files again.
+        """
+        for mapped_file in self._mapped_files.values():
+            mapped_file.close()
+    
+    def _load_augmentation_data(self, ):
         # Initialize info on extension data location
+        self.close()
+        self._mapped_files = {}
         self._case_augmenters = {}
         self._updates = {} # compact_file_path -> dict of update readers
         working_files = []
-        self._augmentation_data_dir = augmentation_data_dir
-        for file_path in data_files(augmentation_data_dir):
+        compact_files = []
+        for file_path in data_files(self.augmentation_data_dir):
             if file_path.endswith(self.UPDATE_FILE_EXT):
                 working_files.append(file_path)
             else:
-                self._load_compact_refs(file_path)
+                compact_files.append(file_path)
+        self._determine_key_scheme(compact_files)
+        for file_path in compact_files:
+            self._load_compact_refs(file_path)
         self._index_working_files(working_files)
     
-    @property
-    def augmentation_data_dir(self):
-        return self._augmentation_data_dir
+    def _determine_key_scheme(self, compact_files):
+        scheme, scheme_source = self.case_key_scheme, None
+        for file_path in compact_files:
+            file_scheme = key_scheme_of_compact_file(file_path)
+            if scheme is None:
+                scheme, scheme_source = file_scheme, file_path
+            elif file_scheme != scheme:
+                raise KeySchemeMismatchError(
+                    "{} uses case key scheme {!r}, but {} uses {!r}".format(
+                        file_path,
+                        file_scheme,
+                        scheme_source or "this augmenter",
+                        scheme,
+                    )
+                )
+        self.case_key_scheme = scheme or JSON_ASN1_KEY_SCHEME
     
     def _load_compact_refs(self, file_path):
-        for case_key, start_byte in case_keys_in_compact_file(file_path):
+        compact_refs = case_keys_in_compact_file(file_path, case_key_store=self.case_key_store)
+        mapped_file = self._mapped_files[file_path] = MappedCompactFile(file_path)
+        end_offsets = [start_byte for _, start_byte in compact_refs[1:]] + [None]
+        for (case_key, start_byte), end_byte in zip(compact_refs, end_offsets):
             if case_key in self._case_augmenters:
                 self._excessive_augmentation_data(case_key, self._case_augmenters[case_key].file_path, file_path)
-            self._case_augmenters[case_key] = CompactFileAugmenter(file_path, start_byte, case_key, safe_loading=self.safe_loading)
+            self._case_augmenters[case_key] = CompactFileAugmenter(
+                file_path,
+                start_byte,
+                case_key,
+                safe_loading=self.safe_loading,
+                end_offset=end_byte,
+                mapped_file=mapped_file,
+            )
             self._case_augmenters[case_key].safe_loading = self.safe_loading
     
     def _excessive_augmentation_data(self, case_key, file1, file2):
@@ -356,7 +1606,13 @@ class CaseAugmenter:
         raise MultipleAugmentationEntriesError(error_msg)
     
     def _index_working_files(self, working_files):
-        for case_key, augmenter in update_file.index(working_files, self.CASE_PRIMARY_KEYS, safe_loading=self.safe_loading).items():
+        for case_key, augmenter in update_file.index(
+            working_files,
+            self.CASE_PRIMARY_KEYS,
+            safe_loading=self.safe_loading,
+            case_key_store=self.case_key_store,
+            key_scheme=self.case_key_scheme,
+        ).items():
             existing_augmenter = self._case_augmenters.get(case_key)
             if isinstance(existing_augmenter, CompactFileAugmenter):
                 if augmenter.deposit_file_path != existing_augmenter.file_path:
@@ -382,31 +1638,225 @@ class CaseAugmenter:
             self._case_augmenters[case_key] = augmenter
     
     @classmethod
-    def key_of_case(cls, test_case):
-        """Compute the key (hash) value of the given test case"""
+    def key_of_case(cls, test_case, *, case_key_cache=None, subtree_memo=None, scheme=None):
+        """Compute the key (hash) value of the given test case
+        
+        If *case_key_cache* (or, failing that, the class's
+        :attr:`case_key_cache`) is given, the key is looked up in and stored
+        to that :class:`.cases.CaseKeyCache`.  Encodings of containers in the
+        key fields are reused from and recorded to *subtree_memo*, a
+        :class:`.json_asn1.convert.SubtreeMemo`, if given.
+        
+        The key is computed with case key *scheme* or, failing that, the
+        class's :attr:`case_key_scheme`.  Instance-level settings (such as
+        a scheme read from the compact files) are not consulted; see
+        :meth:`case_key`.
+        """
         if hasattr(test_case, 'items'):
             test_case = test_case.items()
-        return _hash_from_fields(
+        key_fields = dict(
             (k, v) for k, v in test_case
             if k in cls.CASE_PRIMARY_KEYS
         )
+        if case_key_cache is None:
+            case_key_cache = cls.case_key_cache
+        if scheme is None:
+            scheme = cls.case_key_scheme
+        if case_key_cache is not None:
+            return case_key_cache.key_of(key_fields, subtree_memo=subtree_memo, scheme=scheme)
+        return _hash_from_fields(key_fields, subtree_memo=subtree_memo, scheme=scheme)
     
-    def augmented_test_case(self, test_case):
+    def case_key(self, test_case, *, case_key_cache=None, subtree_memo=None):
+        """Compute the key of *test_case* as this object indexes augmentation data
+        
+        This is :meth:`key_of_case` with this object's :attr:`case_key_scheme`
+        (which may come from the headers of the compact files) and, unless
+        *case_key_cache* is given, this object's :attr:`case_key_cache`.
+        Use this rather than :meth:`key_of_case` to look up cases augmented
+        by this object.
+        """
+        return self._key_of_case(
+            test_case,
+            case_key_cache=case_key_cache or self.case_key_cache,
+            subtree_memo=subtree_memo,
+            scheme=self.case_key_scheme,
+        )
+    
+    @classmethod
+    def keys_of_cases(cls, test_cases, *, scheme=None, case_key_cache=None):
+        """Compute the key (hash) values of many test cases
+        
+        :param test_cases: iterable of test case :class:`dict` objects
+        :returns: the case keys, in the same order as *test_cases*
+        :rtype: list
+        
+        When there are at least :attr:`parallel_hashing_threshold` cases,
+        the keys are computed in worker processes by
+        :func:`.cases.hash_many`; otherwise each is computed by
+        :meth:`key_of_case`.  The keys are computed with case key *scheme*
+        or, failing that, the class's :attr:`case_key_scheme`, and are looked
+        up in and stored to *case_key_cache* or, failing that, the class's
+        :attr:`case_key_cache`.
+        """
+        test_cases = list(test_cases)
+        if scheme is None:
+            scheme = cls.case_key_scheme
+        if case_key_cache is None:
+            case_key_cache = cls.case_key_cache
+        threshold = cls.parallel_hashing_threshold
+        if threshold is None or len(test_cases) < threshold:
+            return [
+                cls.key_of_case(test_case, case_key_cache=case_key_cache, scheme=scheme)
+                for test_case in test_cases
+            ]
+        if case_key_cache is not None:
+            return case_key_cache.keys_of_many(
+                (
+                    dict((k, v) for k, v in test_case.items() if k in cls.CASE_PRIMARY_KEYS)
+                    for test_case in test_cases
+                ),
+                scheme=scheme,
+            )
+        return _hash_many(test_cases, cls.CASE_PRIMARY_KEYS, scheme=scheme)
+    
+    def case_keys(self, test_cases, *, case_key_cache=None):
+        """Compute the keys of many test cases as this object indexes augmentation data
+        
+        :param test_cases: iterable of test case :class:`dict` objects
+        :returns: the case keys, in the same order as *test_cases*
+        :rtype: list
+        
+        This is :meth:`keys_of_cases` with the settings used by
+        :meth:`case_key`, so the keys are computed in parallel when there are
+        at least :attr:`parallel_hashing_threshold` cases.  If a subclass
+        overrides how keys are computed, each key is computed by
+        :meth:`case_key` instead.
+        """
+        test_cases = list(test_cases)
+        case_key_cache = case_key_cache or self.case_key_cache
+        if not _has_default_case_keys(self):
+            return [
+                self.case_key(test_case, case_key_cache=case_key_cache)
+                for test_case in test_cases
+            ]
+        return self.keys_of_cases(
+            test_cases,
+            scheme=self.case_key_scheme,
+            case_key_cache=case_key_cache,
+        )
+    
+    def augmented_test_case(self, test_case, *, case_key_cache=None, case_key=None, subtree_memo=None):
         """Add key/value pairs to *test_case* per the stored augmentation data
         
         :param dict test_case: The test case to augment
+        :keyword case_key_cache:
+            *optional* :class:`.cases.CaseKeyCache` overriding
+            :attr:`case_key_cache` for computing the case key
+        :keyword str case_key:
+            *optional* previously computed key of *test_case*
+        :keyword subtree_memo:
+            *optional* :class:`.json_asn1.convert.SubtreeMemo` to use when
+            computing the case key
         :returns: Test case with additional key/value pairs
         :rtype: dict
         """
-        case_key = self.key_of_case(test_case)
+        if case_key is None:
+            case_key = self.case_key(
+                test_case,
+                case_key_cache=case_key_cache,
+                subtree_memo=subtree_memo,
+            )
         augment_case = self._case_augmenters.get(case_key)
         if not augment_case:
             return test_case
         
         aug_test_case = dict(test_case)
-        augment_case(aug_test_case)
+        if not self._augment_from_cache(case_key, augment_case, aug_test_case):
+            self._read_augmentation(case_key, augment_case, aug_test_case)
         return aug_test_case
     
+    def augment_all(self, test_cases, *, case_keys=None, case_key_cache=None):
+        """Augment many test cases, reading each augmentation file once
+        
+        :param test_cases: iterable of test case :class:`dict` objects
+        :keyword case_keys:
+            *optional* previously computed keys of *test_cases*, in the same
+            order
+        :keyword case_key_cache:
+            *optional* :class:`.cases.CaseKeyCache` overriding
+            :attr:`case_key_cache` for computing the case keys
+        :returns:
+            :class:`list` of the augmented test cases, in the same order as
+            *test_cases* (as from :meth:`augmented_test_case`)
+        
+        The cases are grouped by the file holding their augmentation data,
+        and the entries for each file are read in one parse of the file
+        (with the ``read_many`` method of the augmenters' class), rather than
+        opening, seeking and parsing the file for each case.
+        """
+        test_cases = list(test_cases)
+        if case_keys is None:
+            case_keys = self.case_keys(test_cases, case_key_cache=case_key_cache)
+        
+        result = list(test_cases)
+        file_entries = {}
+        for position, case_key in enumerate(case_keys):
+            augment_case = self._case_augmenters.get(case_key)
+            if not augment_case:
+                continue
+            result[position] = dict(test_cases[position])
+            if self._augment_from_cache(case_key, augment_case, result[position]):
+                continue
+            # Keyed by augmenter (one per entry): augmenter -> (case key, positions)
+            file_entries.setdefault(augment_case.file_path, {}).setdefault(
+                augment_case, (case_key, [])
+            )[1].append(position)
+        
+        cache = self.augmentation_cache
+        for file_path, entries in file_entries.items():
+            if cache is not None:
+                identity = cache.file_identity(file_path)
+            augmenter_class = type(next(iter(entries)))
+            for augment_case, augmentation in augmenter_class.read_many(list(entries)):
+                case_key, positions = entries.pop(augment_case)
+                if cache is not None:
+                    cache.save(case_key, file_path, augmentation, identity)
+                for i, position in enumerate(positions):
+                    for k, v in (copy.deepcopy(augmentation) if i else augmentation).items():
+                        result[position].setdefault(k, v)
+            
+            # Entries not found in the parse are read (or fail) individually
+            for augment_case, (case_key, positions) in entries.items():
+                for position in positions:
+                    self._read_augmentation(case_key, augment_case, result[position])
+        return result
+    
+    def _augment_from_cache(self, case_key, augment_case, d):
+        cache = self.augmentation_cache
+        if cache is None:
+            return False
+        augmentation = cache.load(case_key, augment_case.file_path)
+        if augmentation is None:
+            return False
+        for k, v in augmentation.items():
+            d.setdefault(k, v)
+        return True
+    
+    def _read_augmentation(self, case_key, augment_case, d):
+        cache = self.augmentation_cache
+        if cache is None:
+            augmentation = d
+        else:
+            identity = cache.file_identity(augment_case.file_path)
+            augmentation = {}
+        
+        augment_case(augmentation)
+        
+        if cache is not None:
+            cache.save(case_key, augment_case.file_path, augmentation, identity)
+            for k, v in augmentation.items():
+                d.setdefault(k, v)
+    
     def augmented_test_case_events(self, case_key, case_id_events):
         """Generate YAML events for a test case
         
@@ -427,19 +1877,79 @@ class CaseAugmenter:
         yield yaml.MappingEndEvent()
     
     def update_compact_files(self, ):
-        """Update compact data files from update data files"""
+        """Update compact data files from update data files
+        
+        If there is a :attr:`case_key_store`, the stored index of each
+        rewritten compact file is rebuilt; if there is an
+        :attr:`augmentation_cache`, its entries from the file are removed.
+        """
+        # Each file is replaced rather than rewritten in place, so maps of
+        # the previous content (here or in other processes) remain valid
+        self.close()
         for file_path, updates in self._updates.items():
             if os.path.exists(file_path):
-                with open_temp_copy(file_path) as instream, open(file_path, 'w') as outstream:
+                with open(file_path) as instream, _open_replacement(file_path) as outstream:
                     updated_events = self._updated_compact_events(
-                        yaml.parse(instream),
+                        _yaml_parse(instream),
                         updates
                     )
                     
+                    outstream.write(key_scheme_header(self.case_key_scheme))
                     yaml.emit(updated_events, outstream)
             else:
-                with open(file_path, 'w') as outstream:
+                with _open_replacement(file_path) as outstream:
+                    outstream.write(key_scheme_header(self.case_key_scheme))
                     yaml.emit(self._fresh_content_events(updates.items()), outstream)
+            
+            if self.case_key_store is not None:
+                reindex_compact_file(file_path, case_key_store=self.case_key_store)
+            if self.augmentation_cache is not None:
+                self.augmentation_cache.invalidate(file_path)
+    
+    def rekey_compact_files(self, test_cases, scheme):
+        """Rewrite the compact data files to use a different case key scheme
+        
+        :param test_cases:
+            iterable of all test cases that may be augmented by the compact
+            files; the case keys in the compact files can only be translated
+            for these cases
+        :param str scheme: one of :const:`.cases.KEY_SCHEMES`
+        :returns:
+            :class:`list` of case keys in the compact files that did not
+            match any of *test_cases*; these are left unchanged
+        
+        The header of each compact file is updated to record *scheme*, and
+        the augmentation data of this object is reloaded afterward.
+        """
+        if scheme not in KEY_SCHEMES:
+            raise ValueError("Unknown case key scheme {!r}".format(scheme))
+        test_cases = list(test_cases)
+        new_keys = dict(zip(
+            self.keys_of_cases(test_cases, scheme=self.case_key_scheme),
+            self.keys_of_cases(test_cases, scheme=scheme),
+        ))
+        unmatched_keys = []
+        compact_files = [
+            file_path
+            for file_path in data_files(self.augmentation_data_dir)
+            if not file_path.endswith(self.UPDATE_FILE_EXT)
+        ]
+        for file_path in compact_files:
+            unmatched_keys.extend(
+                case_key
+                for case_key, _ in case_keys_in_compact_file(file_path, case_key_store=self.case_key_store)
+                if case_key not in new_keys
+            )
+            self.close()
+            with open(file_path) as instream, _open_replacement(file_path) as outstream:
+                outstream.write(key_scheme_header(scheme))
+                yaml.emit(rekeyed_events(_yaml_parse(instream), new_keys), outstream)
+            if self.augmentation_cache is not None:
+                self.augmentation_cache.invalidate(file_path)
+        
+        self.case_key_scheme = scheme
+        self._load_augmentation_data()
+        return unmatched_keys
     
     def extend_updates(self, file_name_base):
         """Create an object for extending a particular update file
@@ -552,8 +2062,12 @@ class UpdateExtender:
             buffered_input.seek(0)
             stream = buffered_input
         
-        id_list_reader = CaseIdListReader(self._case_augmenter.CASE_PRIMARY_KEYS, safe_loading=self.safe_loading)
-        for event in yaml.parse(stream):
+        id_list_reader = CaseIdListReader(
+            self._case_augmenter.CASE_PRIMARY_KEYS,
+            safe_loading=self.safe_loading,
+            key_scheme=self._case_augmenter.case_key_scheme,
+        )
+        for event in _yaml_parse(stream):
             test_case = id_list_reader.read(event)
             if test_case is None:
                 continue
@@ -9,25 +9,46 @@ from enum import IntEnum
 from heapq import heappush, heappop
 import itertools
 import json
-import Levenshtein
 import math
 from operator import itemgetter
 import time
 from typing import Iterable, Tuple, Sequence as SequenceType
 from urllib.parse import urlparse, parse_qsl
-from intercom_test.cases import hash_from_fields as case_hash
+from intercom_test.cases import hash_from_fields as case_hash, hash_many
+from intercom_test.json_asn1.convert import SubtreeMemo
 from intercom_test.utils import FilteredDictView
 
 class Database:
-    def __init__(self, cases: Iterable[dict], *, add_request_keys=()):
+    # Set this to the minimum number of cases for which the case keys are
+    # computed in parallel (with cases.hash_many) during construction
+    parallel_hashing_threshold = None
+    
+    # When true, the DER encodings of containers shared between the key
+    # fields of the cases, or equal among them, are reused when computing the
+    # case keys during construction; see json_asn1.convert.SubtreeMemo
+    memoize_shared_subtrees = False
+    
+    # Set this to a utils.StringPool to deduplicate the equal strings of the
+    # cases (in place) during construction and when changes are applied
+    string_pool = None
+    
+    def __init__(self, cases: Iterable[dict], *, add_request_keys=(), case_key_cache=None, parallel_hashing_threshold=None, string_pool=None):
         super().__init__()
         
         if not isinstance(cases, Sequence):
             cases = list(cases)
         
         self._additional_request_keys = frozenset(add_request_keys)
-        
-        self._responses = dict((self._case_key(case), case) for case in cases)
+        self._case_key_cache = case_key_cache
+        if parallel_hashing_threshold is not None:
+            self.parallel_hashing_threshold = parallel_hashing_threshold
+        if string_pool is not None:
+            self.string_pool = string_pool
+        if self.string_pool is not None:
+            for case in cases:
+                self.string_pool.intern_strings(case)
+        
+        self._responses = dict(zip(self._case_keys(cases), cases))
         self._reqlines = _group_dict(cases, _reqline)
         self._urls = _group_dict(cases, _request_url)
         self._paths = _group_dict(cases, _request_url_path)
@@ -35,6 +56,57 @@ class Database:
     def get_case(self, request: dict):
         return self._responses.get(self._case_key(request))
     
+    def case_key(self, request: dict) -> str:
+        """Compute the key by which this database matches *request* (or a test case)"""
+        return self._case_key(request)
+    
+    def apply_changes(self, changes):
+        """Update this database from changes to the test cases
+        
+        :param changes:
+            iterable of objects with ``old_case`` and ``new_case`` attributes,
+            either of which may be ``None``, such as the
+            :class:`.framework.CaseChange` objects from
+            :meth:`.framework.SpecWatcher.poll`
+        """
+        for change in changes:
+            if change.old_case is not None:
+                self._remove_case(change.old_case)
+            if change.new_case is not None:
+                self._add_case(change.new_case)
+    
+    def _add_case(self, case: dict):
+        if self.string_pool is not None:
+            self.string_pool.intern_strings(case)
+        self._responses[self._case_key(case)] = case
+        for index, key in self._indexes():
+            index.setdefault(key(case), []).append(case)
+    
+    def _remove_case(self, case: dict):
+        for index, key in self._indexes():
+            group_key = key(case)
+            group = index.get(group_key, [])
+            _remove_item(group, case)
+            if not group:
+                index.pop(group_key, None)
+        
+        case_key = self._case_key(case)
+        response = self._responses.get(case_key)
+        if response is case or response == case:
+            del self._responses[case_key]
+            # Fall back to any remaining case with the same key
+            for other in reversed(self._reqlines.get(_reqline(case), [])):
+                if self._case_key(other) == case_key:
+                    self._responses[case_key] = other
+                    break
+    
+    def _indexes(self, ):
+        return (
+            (self._reqlines, _reqline),
+            (self._urls, _request_url),
+            (self._paths, _request_url_path),
+        )
+    
     def best_matches(self, request: dict, *, timeout: float = 0.3) -> dict:
         """Given HTTP request parameters, find the best known match"""
         
@@ -56,7 +128,23 @@ class Database:
         
         json.dump(response, reply_stream)
     
-    def _case_key(self, request: dict):
+    def _case_keys(self, cases: SequenceType[dict]):
+        threshold = self.parallel_hashing_threshold
+        if threshold is None or len(cases) < threshold:
+            subtree_memo = SubtreeMemo() if self.memoize_shared_subtrees else None
+            return [self._case_key(case, subtree_memo=subtree_memo) for case in cases]
+        key_fields = [dict(self._key_fields(case)) for case in cases]
+        if self._case_key_cache is not None:
+            return self._case_key_cache.keys_of_many(key_fields)
+        return hash_many(key_fields)
+    
+    def _case_key(self, request: dict, *, subtree_memo=None):
+        hash_input = self._key_fields(request)
+        if self._case_key_cache is not None:
+            return self._case_key_cache.key_of(hash_input, subtree_memo=subtree_memo)
+        return case_hash(hash_input, subtree_memo=subtree_memo)
+    
+    def _key_fields(self, request: dict):
         def request_key(k):
             return (
                 k in ('method', 'url', 'request body')
@@ -68,12 +156,11 @@ class Database:
             if isinstance(v, bytes):
                 return ('binary', str(v))
             return v
-        hash_input = FilteredDictView(
+        return FilteredDictView(
             request,
             key_filter=request_key,
             value_transform=value_lens,
         )
-        return case_hash(hash_input)
 
 class _Reporter:
     def __init__(self, database, request, *, deadline=math.inf):
@@ -103,6 +190,7 @@ class _Reporter:
         if request_path in db._paths:
             return self._report_closest_query_params()
         
+        import Levenshtein # deferred: only needed for reporting near misses
         def dist_from_request_path(url):
             return Levenshtein.distance(url, request_path)
         
@@ -186,6 +274,7 @@ class _Reporter:
             return AvailableJsonRequestBodiesReport(closest_reqbody_entries)
         else:
             # Look for lowest Levenshtein distance between request_body and case['request body']
+            import Levenshtein # deferred: only needed for reporting near misses
             def distance_from_request_body(case):
                 return Levenshtein.distance(request_body, case['request body'])
             
@@ -404,6 +493,14 @@ def _http_method(case):
 def _reqline(case):
     return (_http_method(case), case['url'])
 
+def _remove_item(items: list, item):
+    for i, candidate in enumerate(items):
+        if candidate is item:
+            del items[i]
+            return
+    if item in items:
+        items.remove(item)
+
 def _group_dict(a: Iterable, key, *, value=lambda x: x) -> dict:
     result = {}
     for item in a:
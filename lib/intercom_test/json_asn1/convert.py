@@ -13,52 +13,316 @@
 # limitations under the License.
 
 from numbers import Number
-from pyasn1.codec.der import encoder as der_encoder
-from pyasn1.type import univ
-from .types import JSONValue, JSONObject, KeyValuePair
+import sys
+from ..exceptions import EncodingMismatchError
+from . import types
+
+# pyasn1 is only imported when values are converted to pyasn1 objects (see
+# asn1), which direct_der makes unnecessary for computing case keys
+
+NULL_DER = b'\x05\x00'
+_PLUS_INF_DER = b'\x09\x01\x40'
+_MINUS_INF_DER = b'\x09\x01\x41'
+_INFINITIES = (float('inf'), float('-inf'))
+
+class DirectEncodingUnavailable(Exception):
+    """Raised when a value can only be encoded through :mod:`pyasn1`"""
+
+class SubtreeMemo:
+    """Memo of the DER encodings of (possibly shared) containers
+    
+    Pass an instance of this class to :func:`direct_der` (or the functions
+    built on it) for all values encoded within one *load* of test cases to
+    encode each container object -- e.g. a request body shared between test
+    cases, or a YAML-aliased node -- only once.  Encodings are remembered by
+    object identity, so the containers MUST NOT be modified while the memo is
+    in use; a reference to each remembered container is held to keep its
+    identity from being reused.  Only encodings of at least *min_size* bytes
+    are remembered.
+    
+    Containers looked up *by_content* (which :func:`direct_der` does for the
+    containers directly within the value it encodes, e.g. the request body
+    among the key fields of a case) are also remembered by a fingerprint of
+    their content, so equal but distinct containers -- e.g. the same body
+    written out in several test cases -- are encoded only once, at the cost
+    of computing the fingerprint.
+    
+    :attr:`hits` counts the encodings reused and :attr:`bytes_reused` totals
+    their length.
+    """
+    def __init__(self, *, min_size=64):
+        super().__init__()
+        self.min_size = min_size
+        self._ders = {}
+        self._content_ders = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_reused = 0
+    
+    def __len__(self, ):
+        return len(self._ders)
+    
+    def lookup(self, value, *, by_content=False):
+        """Get the remembered encoding of *value*, or ``None``"""
+        entry = self._ders.get(id(value))
+        if entry is not None and entry[0] is value:
+            return self.reused(entry[1])
+        if by_content:
+            der = self._content_ders.get(_content_fingerprint(value))
+            if der is not None:
+                self._ders[id(value)] = (value, der)
+                return self.reused(der)
+        self.misses += 1
+        return None
+    
+    def reused(self, der):
+        """Count a reuse of the encoding *der* and return it"""
+        self.hits += 1
+        self.bytes_reused += len(der)
+        return der
+    
+    def store(self, value, der, *, by_content=False):
+        """Remember *der* as the encoding of the container *value*"""
+        if len(der) >= self.min_size:
+            self._ders[id(value)] = (value, der)
+            if by_content:
+                fingerprint = _content_fingerprint(value)
+                if fingerprint is not None:
+                    self._content_ders[fingerprint] = der
+    
+    def clear(self, ):
+        """Forget all remembered encodings (but not the counts)"""
+        self._ders.clear()
+        self._content_ders.clear()
+
+# Leaf types whose equal values have equal encodings
+_FINGERPRINT_LEAF_TYPES = (str, int, float, bool, type(None))
+
+def _content_fingerprint(value):
+    # Equal fingerprints imply equal DER encodings; None if *value* holds
+    # anything other than JSON-ic data
+    try:
+        return _fingerprint(value)
+    except TypeError:
+        return None
+
+def _fingerprint(value):
+    if callable(getattr(value, 'items', None)):
+        return ('o', frozenset(
+            (_fingerprint_key(k), _fingerprint(v))
+            for k, v in value.items()
+        ))
+    elif isinstance(value, (list, tuple)):
+        return ('a', tuple(_fingerprint(item) for item in value))
+    elif type(value) in _FINGERPRINT_LEAF_TYPES:
+        return value
+    raise TypeError()
+
+def _fingerprint_key(key):
+    # As converted by kvp_der
+    if isinstance(key, str):
+        return key
+    elif type(key) in _FINGERPRINT_LEAF_TYPES:
+        return str(key)
+    raise TypeError()
 
 def kvp(k, v):
-    result = KeyValuePair()
+    return _kvp(k, v, set())
+
+def _kvp(k, v, ancestors):
+    result = types.KeyValuePair()
     result['key'] = k
-    result['value'] = asn1(v)
+    result['value'] = _asn1(v, ancestors)
     return result
 
 def asn1(value):
-    visited_objs = set()
-    
-    def step(value):
-        if id(value) in visited_objs:
-            raise ValueError("Cannot convert cyclical object graph")
-        
-        result = JSONValue()
-        if isinstance(value, str):
-            result['strval'] = value
-        elif isinstance(value, Number):
-            result['numval'] = value
-        elif value is None:
-            result['nullval'] = None
-        elif isinstance(value, bool):
-            result['boolval'] = value
-        elif isinstance(value, JSONObject):
-            visited_objs.add(id(value))
-            result['objval'] = value
-        elif callable(getattr(value, 'items', None)):
-            visited_objs.add(id(value))
-            result['objval'] = JSONObject()
-            result['objval'].extend(
-                kvp(k, v)
-                for k, v
-                in value.items()
-            )
-        elif isinstance(value, (list, tuple)):
-            if isinstance(value, list):
-                visited_objs.add(id(value))
-            result['arrval'] = univ.SequenceOf()
-            result['arrval'].extend(step(item) for item in value)
-          
-        return result
+    return _asn1(value, set())
+
+def _asn1(value, ancestors):
+    # *ancestors* holds the ids of the containers enclosing *value*
+    if id(value) in ancestors:
+        raise ValueError("Cannot convert cyclical object graph")
+    
+    result = types.JSONValue()
+    if isinstance(value, str):
+        result['strval'] = value
+    elif isinstance(value, Number):
+        result['numval'] = value
+    elif value is None:
+        result['nullval'] = None
+    elif isinstance(value, bool):
+        result['boolval'] = value
+    elif isinstance(value, types.JSONObject):
+        result['objval'] = value
+    elif callable(getattr(value, 'items', None)):
+        ancestors.add(id(value))
+        result['objval'] = types.JSONObject()
+        result['objval'].extend(
+            _kvp(k, v, ancestors)
+            for k, v
+            in value.items()
+        )
+        ancestors.discard(id(value))
+    elif isinstance(value, (list, tuple)):
+        ancestors.add(id(value))
+        from pyasn1.type import univ
+        result['arrval'] = univ.SequenceOf()
+        result['arrval'].extend(_asn1(item, ancestors) for item in value)
+        ancestors.discard(id(value))
+    
+    return result
+
+def asn1_der(value, *, cross_check=False, subtree_memo=None):
+    """Encode a JSON-ic *value* in DER per :const:`.types.ASN1_SOURCE`
     
-    return step(value)
+    The encoding is produced by :func:`direct_der` when possible, falling back
+    to building a :mod:`pyasn1` object tree (see :func:`asn1`) for values
+    :func:`direct_der` does not handle.  Passing *cross_check* as ``True``
+    additionally encodes *value* through :mod:`pyasn1` and raises
+    :class:`.EncodingMismatchError` if the two encodings differ.
+    
+    A :class:`SubtreeMemo` given as *subtree_memo* is passed to
+    :func:`direct_der`.
+    """
+    try:
+        result = direct_der(value, subtree_memo=subtree_memo)
+    except DirectEncodingUnavailable:
+        return pyasn1_der(value)
+    
+    if cross_check:
+        reference = pyasn1_der(value)
+        if result != reference:
+            raise EncodingMismatchError(
+                "direct DER encoding differs from pyasn1 encoding for {!r}".format(value)
+            )
+    return result
 
-def asn1_der(value):
+def pyasn1_der(value):
+    """Encode a JSON-ic *value* in DER through :mod:`pyasn1` objects"""
+    from pyasn1.codec.der import encoder as der_encoder
     return der_encoder.encode(asn1(value))
+
+def direct_der(value, *, subtree_memo=None):
+    """Encode a JSON-ic *value* in DER without constructing :mod:`pyasn1` objects
+    
+    The output is byte-for-byte identical to :func:`pyasn1_der`, including the
+    :mod:`pyasn1` conventions for encoding ``REAL`` values (base 10, "NR3"
+    form) and the DER ordering of ``SET OF`` components.  Values of types
+    with no direct encoding (e.g. :class:`decimal.Decimal` or :mod:`pyasn1`
+    objects) cause :class:`DirectEncodingUnavailable` to be raised.
+    
+    The building blocks of this encoder (:func:`str_der`, :func:`real_der`,
+    :func:`array_der`, :func:`kvp_der` and :func:`object_der`) are available
+    for producing the same encoding from other representations of a value.
+    
+    If a :class:`SubtreeMemo` is given as *subtree_memo*, containers already
+    encoded through it are not encoded again.  Only containers nested in
+    *value* are looked up in and recorded to the memo; *value* itself is
+    typically built afresh for each call (e.g. the key fields of a case).
+    The containers directly within *value* are also looked up by content.
+    """
+    return _direct_der(value, set(), subtree_memo)
+
+def _is_asn1_item(value):
+    # No pyasn1 objects can exist before pyasn1 has been imported
+    pyasn1_base = sys.modules.get('pyasn1.type.base')
+    return pyasn1_base is not None and isinstance(value, pyasn1_base.Asn1Item)
+
+def _direct_der(value, ancestors, memo):
+    # *ancestors* holds the ids of the containers enclosing *value*
+    if isinstance(value, str):
+        return str_der(value)
+    elif isinstance(value, Number):
+        return real_der(value)
+    elif value is None:
+        return NULL_DER
+    elif _is_asn1_item(value):
+        raise DirectEncodingUnavailable()
+    
+    is_mapping = callable(getattr(value, 'items', None))
+    if not is_mapping and not isinstance(value, (list, tuple)):
+        raise DirectEncodingUnavailable()
+    
+    # Only nested containers can be shared with other values
+    memoize = memo is not None and bool(ancestors)
+    if memoize:
+        by_content = len(ancestors) == 1
+        result = memo.lookup(value, by_content=by_content)
+        if result is not None:
+            return result
+    if id(value) in ancestors:
+        raise ValueError("Cannot convert cyclical object graph")
+    
+    ancestors.add(id(value))
+    if is_mapping:
+        result = object_der(
+            kvp_der(k, _direct_der(v, ancestors, memo))
+            for k, v
+            in value.items()
+        )
+    else:
+        result = array_der([_direct_der(item, ancestors, memo) for item in value])
+    ancestors.discard(id(value))
+    
+    if memoize:
+        memo.store(value, result, by_content=by_content)
+    return result
+
+def _tlv(tag, content):
+    length = len(content)
+    if length < 0x80:
+        return bytes((tag, length)) + content
+    length_octets = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes((tag, 0x80 | len(length_octets))) + length_octets + content
+
+def str_der(value):
+    """DER encoding of a :class:`str` as ``strval``"""
+    return _tlv(0x0c, value.encode('utf-8'))
+
+def array_der(item_ders):
+    """DER encoding of ``arrval`` from the encodings of its items"""
+    return _tlv(0x30, b''.join(item_ders))
+
+def kvp_der(key, value_der):
+    """DER encoding of a ``KeyValuePair`` from *key* and an encoded value"""
+    if isinstance(key, str):
+        pass
+    elif isinstance(key, (int, float)) or key is None:
+        key = str(key)
+    else:
+        raise DirectEncodingUnavailable()
+    return _tlv(0x61, _tlv(0x0c, key.encode('utf-8')) + value_der)
+
+def object_der(kvp_ders):
+    """DER encoding of ``objval`` from the encodings of its ``KeyValuePair`` items"""
+    # Same ordering as pyasn1's DER/CER SetOfEncoder: by zero-padded encoding
+    chunks = list(kvp_ders)
+    if len(chunks) > 1:
+        max_len = max(map(len, chunks))
+        chunks.sort(key=lambda chunk: chunk.ljust(max_len, b'\x00'))
+    return _tlv(0x31, b''.join(chunks))
+
+def real_der(value):
+    """DER encoding of an :class:`int` or :class:`float` as ``numval``"""
+    # Mirrors pyasn1.type.univ.Real.prettyIn followed by the base 10 branch
+    # of pyasn1.codec.ber.encoder.RealEncoder
+    if isinstance(value, int):
+        m, e = value, 0
+    elif isinstance(value, float):
+        if value in _INFINITIES:
+            return _PLUS_INF_DER if value > 0 else _MINUS_INF_DER
+        e = 0
+        while int(value) != value:
+            value *= 10
+            e -= 1
+        m = int(value)
+    else:
+        raise DirectEncodingUnavailable()
+    
+    while m and m % 10 == 0:
+        m //= 10
+        e += 1
+    
+    if not m:
+        return _tlv(0x09, b'')
+    return _tlv(0x09, b'\x03%dE%s%d' % (m, e == 0 and b'+' or b'', e))
@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+
 ASN1_SOURCE_LIST = []
 
 # Auto-generated by asn1ate v.0.6.1.dev0 from json.asn1
@@ -29,41 +31,63 @@ KeyValuePair ::= [APPLICATION 1] IMPLICIT SEQUENCE { key UTF8String, value JSONV
 END
 """)
 
-from pyasn1.type import univ, char, namedtype, namedval, tag, constraint, useful
-
-
-class JSONValue(univ.Choice):
-    pass
-
-
-class KeyValuePair(univ.Sequence):
-    pass
-
-
-class JSONObject(univ.SetOf):
-    pass
-
-
-JSONValue.componentType = namedtype.NamedTypes(
-    namedtype.NamedType('nullval', univ.Null()),
-    namedtype.NamedType('strval', char.UTF8String()),
-    namedtype.NamedType('numval', univ.Real()),
-    namedtype.NamedType('boolval', univ.Boolean()),
-    namedtype.NamedType('objval', JSONObject()),
-    namedtype.NamedType('arrval', univ.SequenceOf(componentType=JSONValue()))
-)
-
-
-KeyValuePair.tagSet = univ.Sequence.tagSet.tagImplicitly(tag.Tag(tag.tagClassApplication, tag.tagFormatConstructed, 1))
-KeyValuePair.componentType = namedtype.NamedTypes(
-    namedtype.NamedType('key', char.UTF8String()),
-    namedtype.NamedType('value', JSONValue())
-)
-
-
-JSONObject.componentType = KeyValuePair()
-
-
-
 ASN1_SOURCE = ''.join(ASN1_SOURCE_LIST)
 
+# The pyasn1 types below are only constructed (importing pyasn1) when first
+# accessed as attributes of this module, since computing case keys does not
+# normally need them; see __getattr__
+
+_TYPE_NAMES = ('JSONValue', 'KeyValuePair', 'JSONObject')
+_types_lock = threading.Lock()
+
+def _construct_types():
+    from pyasn1.type import univ, char, namedtype, namedval, tag, constraint, useful
+    
+    
+    class JSONValue(univ.Choice):
+        pass
+    
+    
+    class KeyValuePair(univ.Sequence):
+        pass
+    
+    
+    class JSONObject(univ.SetOf):
+        pass
+    
+    
+    JSONValue.componentType = namedtype.NamedTypes(
+        namedtype.NamedType('nullval', univ.Null()),
+        namedtype.NamedType('strval', char.UTF8String()),
+        namedtype.NamedType('numval', univ.Real()),
+        namedtype.NamedType('boolval', univ.Boolean()),
+        namedtype.NamedType('objval', JSONObject()),
+        namedtype.NamedType('arrval', univ.SequenceOf(componentType=JSONValue()))
+    )
+    
+    
+    KeyValuePair.tagSet = univ.Sequence.tagSet.tagImplicitly(tag.Tag(tag.tagClassApplication, tag.tagFormatConstructed, 1))
+    KeyValuePair.componentType = namedtype.NamedTypes(
+        namedtype.NamedType('key', char.UTF8String()),
+        namedtype.NamedType('value', JSONValue())
+    )
+    
+    
+    JSONObject.componentType = KeyValuePair()
+    
+    types = dict(JSONValue=JSONValue, KeyValuePair=KeyValuePair, JSONObject=JSONObject)
+    for name, asn1_type in types.items():
+        asn1_type.__qualname__ = name
+    return types
+
+def __getattr__(name):
+    if name not in _TYPE_NAMES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    with _types_lock:
+        if name not in globals():
+            globals().update(_construct_types())
+    return globals()[name]
+
+def __dir__():
+    return sorted(set(globals()) | set(_TYPE_NAMES))
+
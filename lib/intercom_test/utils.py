@@ -16,6 +16,8 @@ from contextlib import contextmanager, ExitStack
 import enum
 import functools
 import inspect
+import json
+import os
 import shutil
 import tempfile
 
@@ -51,6 +53,40 @@ def open_temp_copy(path, binary=False, *, blocksize=None):
         copied_file.seek(0)
         yield copied_file
 
+@contextmanager
+def open_replacement(path, binary=False):
+    """Open a new file to take the place of *path*
+    
+    The returned file object writes to a temporary file in the directory of
+    *path*, which replaces *path* (via :func:`os.replace`) when the context
+    exits without an exception; otherwise the temporary file is removed.
+    Readers that already have *path* open -- or memory mapped -- keep seeing
+    the previous content rather than a partially written or truncated file.
+    The replacement gets the permissions of *path*, if it exists.
+    """
+    bflag = 'b' if binary else ''
+    dir_path, file_name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(prefix='.' + file_name + '.', suffix='.tmp', dir=dir_path or '.')
+    try:
+        try:
+            shutil.copymode(path, temp_path)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o666 & ~_umask())
+        with open(fd, 'w' + bflag) as replacement:
+            yield replacement
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def _umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
 class FilteredDictView:
     """:class:`dict`-like access to a key-filtered and value-transformed :class:`dict`
     
@@ -171,6 +207,155 @@ class FilteredDictView:
     def __hash__(self, ):
         raise TypeError("unhashable type: '{}'".format(type(self).__qualname__))
 
+class LazyJSON:
+    """A JSON value parsed from its text when first used
+    
+    Comparison, indexing, iteration, length, truth value and other attribute
+    access (e.g. ``items()``) are delegated to :attr:`value`, which is parsed
+    from :attr:`raw` the first time it is needed and then kept.  Instances
+    are not themselves of the type of the value, so use :attr:`value` where
+    that matters (e.g. for :func:`isinstance` or :func:`json.dumps`).
+    """
+    __slots__ = ('_raw', '_value')
+    
+    def __init__(self, raw):
+        """
+        :param str raw: JSON text of the value
+        """
+        super().__init__()
+        self._raw = raw
+        self._value = _UNPARSED
+    
+    @property
+    def raw(self):
+        """The JSON text, for byte-exact comparison"""
+        return self._raw
+    
+    @property
+    def value(self):
+        """The parsed value"""
+        if self._value is _UNPARSED:
+            self._value = json.loads(self._raw)
+        return self._value
+    
+    @property
+    def parsed(self):
+        """Whether :attr:`value` has been parsed"""
+        return self._value is not _UNPARSED
+    
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.value, name)
+    
+    def __eq__(self, other):
+        if isinstance(other, LazyJSON):
+            if self._raw == other._raw:
+                return True
+            other = other.value
+        return self.value == other
+    
+    __hash__ = None
+    
+    def __getitem__(self, key):
+        return self.value[key]
+    
+    def __iter__(self, ):
+        return iter(self.value)
+    
+    def __len__(self, ):
+        return len(self.value)
+    
+    def __contains__(self, item):
+        return item in self.value
+    
+    def __bool__(self, ):
+        return bool(self.value)
+    
+    def __repr__(self, ):
+        return "{}({!r})".format(type(self).__name__, self._raw)
+    
+    def __reduce__(self, ):
+        return (type(self), (self._raw,))
+
+_UNPARSED = object()
+
+class StringPool:
+    """Deduplicates equal strings in loaded test case data
+    
+    Loaded test cases repeat many strings -- field names such as ``"url"``,
+    methods, URLs, header names and JSON object keys -- as separate
+    :class:`str` objects.  :meth:`intern_strings` replaces each string in a
+    test case with the instance of an equal string already held by the pool,
+    so a corpus of cases keeps one copy of each.  Strings longer than
+    :attr:`max_length` (which are seldom repeated) are left alone.
+    
+    The pool holds every string it has seen for its own lifetime.
+    
+    .. automethod:: __init__
+    """
+    max_length = 256
+    
+    def __init__(self, *, max_length=None):
+        """
+        :keyword max_length:
+            *optional* override of :attr:`max_length`, the length of the
+            longest string to pool
+        """
+        super().__init__()
+        if max_length is not None and max_length != self.max_length:
+            self.max_length = max_length
+        self._strings = {}
+    
+    def __len__(self, ):
+        return len(self._strings)
+    
+    def intern(self, s: str) -> str:
+        """Get the pooled instance of a string equal to *s*"""
+        if len(s) > self.max_length:
+            return s
+        return self._strings.setdefault(s, s)
+    
+    def intern_strings(self, value):
+        """Pool the strings within *value*
+        
+        :param value: a JSON-ic value, such as a test case :class:`dict`
+        :returns: *value* -- or, if it is a :class:`str`, the pooled string
+        
+        :class:`dict` keys and values and :class:`list` items are replaced
+        in place.  Other values (including unparsed :class:`LazyJSON` bodies)
+        are left as they are.
+        """
+        if isinstance(value, str):
+            return self.intern(value)
+        
+        pending = [value]
+        visited = set()
+        while pending:
+            container = pending.pop()
+            if id(container) in visited:
+                continue
+            visited.add(id(container))
+            
+            if isinstance(container, dict):
+                entries = list(container.items())
+                container.clear()
+                for k, v in entries:
+                    if isinstance(k, str):
+                        k = self.intern(k)
+                    container[k] = self._pooled_item(v, pending)
+            elif isinstance(container, list):
+                for i, item in enumerate(container):
+                    container[i] = self._pooled_item(item, pending)
+        return value
+    
+    def _pooled_item(self, item, pending):
+        if isinstance(item, str):
+            return self.intern(item)
+        if isinstance(item, (dict, list)):
+            pending.append(item)
+        return item
+
 def attributed_error(cls):
     """Expose exception instance constructor arguments (or specified names) as properties
     
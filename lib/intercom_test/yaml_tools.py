@@ -12,17 +12,125 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from bisect import bisect_left
+import functools
 from io import StringIO
+import itertools
 import packaging.version
+import re
 import yaml
+from .json_asn1.convert import (
+    asn1_der,
+    direct_der,
+    array_der,
+    kvp_der,
+    object_der,
+    DirectEncodingUnavailable,
+)
+from .exceptions import DataParseError
 
 YAML_EXT = '.yml'
 PYYAML_REQUIRES_LOADER = packaging.version.parse('5.1') <= packaging.version.parse(yaml.__version__)
 
+# Whether to load and parse YAML with the libyaml-based (C) implementations
+# in PyYAML; set this to False to use the pure-Python implementations even
+# when PyYAML was built with libyaml
+use_libyaml = getattr(yaml, '__with_libyaml__', False)
+
+def parse(stream):
+    """Parse *stream*, generating YAML events as :func:`yaml.parse` does
+    
+    The libyaml parser is used if available (see :data:`use_libyaml`).  The
+    events are the same either way, including their marks, which give
+    character offsets into *stream* (see :func:`file_positions` for
+    converting these to jump indexes).
+    """
+    if not use_libyaml:
+        return yaml.parse(stream)
+    return _normalized_c_events(yaml.parse(stream, Loader=yaml.cyaml.CParser))
+
+def file_positions(path, char_offsets):
+    """Convert character offsets of YAML marks into positions in a file
+    
+    :param path: path to the file that was parsed (opened in text mode)
+    :param char_offsets:
+        iterable of character offsets (e.g. ``start_mark.index`` values) or
+        ``None``
+    :returns:
+        :class:`list` of the corresponding positions for :meth:`seek` on
+        the file -- byte offsets -- with ``None`` passed through
+    
+    Marks count characters of the decoded text, after newline translation,
+    so they are only byte offsets in files of ASCII text with ``\\n`` line
+    endings.  Files opened in text mode (with the default encoding) accept
+    byte offsets of character boundaries for :meth:`seek`.
+    """
+    char_offsets = list(char_offsets)
+    with open(path, 'rb') as stream:
+        content = stream.read()
+    if content.isascii() and b'\r' not in content:
+        return char_offsets
+    
+    with open(path, newline='') as stream:
+        text = stream.read()
+        encoding = stream.encoding
+    # Translated offsets of the "\n" of each "\r\n", which read as one character
+    crlf_offsets = [
+        m.start() - i
+        for i, m in enumerate(re.finditer('\r\n', text))
+    ]
+    
+    byte_offsets = {}
+    text_offset = byte_offset = 0
+    for char_offset in sorted(set(o for o in char_offsets if o is not None)):
+        text_end = char_offset + bisect_left(crlf_offsets, char_offset)
+        byte_offset += len(text[text_offset:text_end].encode(encoding))
+        text_offset = text_end
+        byte_offsets[char_offset] = byte_offset
+    return [
+        None if o is None else byte_offsets[o]
+        for o in char_offsets
+    ]
+
+# A document start marker at the start of a line always starts a new document
+_DOCUMENT_START = re.compile(r'^---(?=[ \t\r\n]|$)', re.MULTILINE)
+_DIRECTIVE = re.compile(r'^%', re.MULTILINE)
+
+def document_chunks(text, chunk_size):
+    """Split the YAML stream *text* into chunks of whole documents
+    
+    :param str text: YAML stream text
+    :param int chunk_size:
+        approximate minimum size (in characters) of each chunk
+    :returns: :class:`list` of :class:`str` that concatenate to *text*
+    
+    Each chunk (except the first) starts with a document start marker
+    (``---``) and can be loaded independently of the others.  A stream
+    containing directives (e.g. ``%TAG``) is not split.
+    """
+    if len(text) <= chunk_size or _DIRECTIVE.search(text):
+        return [text]
+    
+    chunks = []
+    start = 0
+    for marker in _DOCUMENT_START.finditer(text):
+        if marker.start() - start >= chunk_size:
+            chunks.append(text[start:marker.start()])
+            start = marker.start()
+    chunks.append(text[start:])
+    return chunks
+
+def _normalized_c_events(events):
+    for event in events:
+        # The libyaml parser gives plain scalars a style of '' instead of None
+        if isinstance(event, yaml.ScalarEvent) and event.style == '':
+            event.style = None
+        yield event
+
 def content_events(value):
     """Return an iterable of events presenting *value* within a YAML document"""
     return (
-        e for e in yaml.parse(StringIO(yaml.dump(value)))
+        e for e in parse(StringIO(yaml.dump(value)))
         if not isinstance(e, (
             yaml.StreamStartEvent,
             yaml.DocumentStartEvent,
@@ -91,7 +199,290 @@ def value_from_event_stream(content_events, *, safe_loading=True):
     )()
     return node_constructor.construct_object(node, True)
 
+class _EventsNotDirectlyEncodable(Exception):
+    """Raised internally when YAML events must be composed to be encoded"""
+
+_DIRECT_SCALAR_TAGS = frozenset(
+    'tag:yaml.org,2002:' + t
+    for t in ('str', 'null', 'bool', 'int', 'float')
+)
+_SEQUENCE_TAGS = frozenset((None, '!', yaml.resolver.BaseResolver.DEFAULT_SEQUENCE_TAG))
+_MAPPING_TAGS = frozenset((None, '!', yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG))
+_scalar_resolver = yaml.resolver.Resolver()
+_scalar_constructor = yaml.constructor.SafeConstructor()
+
+def der_from_event_stream(content_events, *, safe_loading=True, key_filter=None, subtree_memo=None):
+    """Convert a sequence of YAML events to the DER encoding of its value
+    
+    The result is the same as passing the result of
+    :func:`value_from_event_stream` to :func:`.json_asn1.convert.asn1_der`,
+    but common YAML (untagged collections with core schema scalars, and
+    aliases to anchors within *content_events*) is encoded without composing
+    YAML nodes or constructing Python values.  Anything else (e.g. merge keys
+    or explicit tags) is converted through :func:`value_from_event_stream`,
+    so *content_events* MUST be a sequence that can be iterated more than once.
+    
+    If *key_filter* is given, only top-level mapping entries for whose key it
+    returns a true value are included in the encoding.
+    
+    Reuse of the encoding of an aliased node is counted as a hit in the
+    :class:`.json_asn1.convert.SubtreeMemo` given as *subtree_memo*, which is
+    also used if the value must be constructed.
+    
+    The *content_events* MUST NOT include stream or document events.
+    """
+    try:
+        return _EventDEREncoder(content_events, subtree_memo).encode(key_filter)
+    except (_EventsNotDirectlyEncodable, DirectEncodingUnavailable):
+        pass
+    
+    value = value_from_event_stream(content_events, safe_loading=safe_loading)
+    if key_filter is not None:
+        value = dict(
+            (k, v) for k, v in value.items()
+            if key_filter(k)
+        )
+    return asn1_der(value, subtree_memo=subtree_memo)
+
+class _EventDEREncoder:
+    def __init__(self, content_events, subtree_memo):
+        super().__init__()
+        self._events = iter(content_events)
+        self._memo = subtree_memo
+        self._anchored_ders = {}
+    
+    def encode(self, key_filter):
+        return self._node_der(next(self._events), key_filter)
+    
+    def _node_der(self, event, key_filter=None):
+        if isinstance(event, yaml.AliasEvent):
+            return self._alias_der(event)
+        elif isinstance(event, yaml.ScalarEvent):
+            result = direct_der(_scalar_value(event))
+        elif isinstance(event, yaml.SequenceStartEvent):
+            if event.tag not in _SEQUENCE_TAGS:
+                raise _EventsNotDirectlyEncodable()
+            result = array_der(self._sequence_item_ders())
+        elif isinstance(event, yaml.MappingStartEvent):
+            if event.tag not in _MAPPING_TAGS:
+                raise _EventsNotDirectlyEncodable()
+            result = object_der(self._mapping_kvp_ders(key_filter))
+        else:
+            raise _EventsNotDirectlyEncodable()
+        
+        if event.anchor is not None:
+            if key_filter is not None:
+                # Encoding of a filtered mapping does not represent the node
+                raise _EventsNotDirectlyEncodable()
+            self._anchored_ders[event.anchor] = result
+        return result
+    
+    def _alias_der(self, event):
+        try:
+            result = self._anchored_ders[event.anchor]
+        except KeyError:
+            # Anchored outside the events or cyclic
+            raise _EventsNotDirectlyEncodable()
+        if self._memo is not None:
+            self._memo.reused(result)
+        return result
+    
+    def _sequence_item_ders(self, ):
+        items = []
+        while True:
+            event = next(self._events)
+            if isinstance(event, yaml.SequenceEndEvent):
+                return items
+            items.append(self._node_der(event))
+    
+    def _mapping_kvp_ders(self, key_filter):
+        entries = {}
+        while True:
+            event = next(self._events)
+            if isinstance(event, yaml.MappingEndEvent):
+                break
+            if not isinstance(event, yaml.ScalarEvent) or event.anchor is not None:
+                raise _EventsNotDirectlyEncodable()
+            key = _scalar_value(event)
+            if key_filter is None or key_filter(key):
+                entries[key] = self._node_der(next(self._events))
+            else:
+                self._skip_node()
+        return [kvp_der(k, v) for k, v in entries.items()]
+    
+    def _skip_node(self, ):
+        depth = 0
+        while True:
+            event = next(self._events)
+            if isinstance(event, yaml.CollectionStartEvent):
+                depth += 1
+            elif isinstance(event, yaml.CollectionEndEvent):
+                depth -= 1
+            if depth == 0:
+                return
+
+def _scalar_value(event):
+    tag = event.tag
+    if tag is None or tag == '!':
+        tag = _scalar_resolver.resolve(yaml.ScalarNode, event.value, event.implicit)
+    if tag not in _DIRECT_SCALAR_TAGS:
+        raise _EventsNotDirectlyEncodable()
+    return _scalar_constructor.yaml_constructors[tag](
+        _scalar_constructor,
+        yaml.ScalarNode(tag, event.value, style=event.style),
+    )
+
+def node_events(content_events):
+    """Take the events of the next node (with its content) from *content_events*
+    
+    :param content_events: iterator of YAML events
+    :returns: :class:`list` of the events of one node
+    
+    No events after the node are consumed from *content_events*.
+    """
+    events = []
+    depth = 0
+    for event in content_events:
+        events.append(event)
+        if isinstance(event, yaml.CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+        if depth == 0:
+            break
+    return events
+
+def sequence_item_events(events):
+    """Generate the events of each item of the sequences in a YAML event stream
+    
+    :param events: YAML events of a stream of documents, each a sequence
+    :raises DataParseError: if the root of a document is not a sequence
+    
+    Each generated :class:`list` of events (from :func:`node_events`) can be
+    passed to :func:`value_from_event_stream` if it is self-contained (see
+    :func:`is_self_contained`).
+    """
+    for item_events, _ in sequence_items(events):
+        yield item_events
+
+def sequence_items(events):
+    """Generate the events of each item of the sequences in a YAML event stream, with their sequence's style
+    
+    :param events: YAML events of a stream of documents, each a sequence
+    :raises DataParseError: if the root of a document is not a sequence
+    
+    As :func:`sequence_item_events`, but generating ``(item_events,
+    flow_style)`` pairs, where *flow_style* is true if the item's sequence
+    is in flow (rather than block) style.  Only items of block sequences
+    start on lines of their own.
+    """
+    events = iter(events)
+    for event in events:
+        if not isinstance(event, yaml.DocumentStartEvent):
+            continue
+        root = next(events)
+        if not isinstance(root, yaml.SequenceStartEvent):
+            raise DataParseError(
+                "{} where SequenceStartEvent expected in line {}".format(
+                    type(root).__name__,
+                    root.start_mark.line,
+                )
+            )
+        while True:
+            item_start = next(events)
+            if isinstance(item_start, yaml.SequenceEndEvent):
+                break
+            yield node_events(itertools.chain((item_start,), events)), root.flow_style
+
+def is_self_contained(events):
+    """Test whether a node's events contain the anchors of all of its aliases"""
+    anchors = set()
+    for event in events:
+        if isinstance(event, yaml.AliasEvent):
+            if event.anchor not in anchors:
+                return False
+        elif getattr(event, 'anchor', None) is not None:
+            anchors.add(event.anchor)
+    return True
+
+def mapping_scalars(mapping_events, keys):
+    """Get the scalar values of some entries of a mapping from its YAML events
+    
+    :param mapping_events: events of a mapping node, as from :func:`node_events`
+    :param keys: container of the keys of interest
+    :returns:
+        :class:`dict` of the entries with keys in *keys*, or ``None`` if
+        they cannot be determined without composing the mapping
+    
+    This avoids constructing the rest of the mapping's content.  Entries
+    can only be determined from the events if all keys of the mapping, and
+    the values for *keys*, are scalars of the core schema (so merge keys,
+    aliases and collections as values for *keys* all give ``None``).
+    """
+    events = iter(mapping_events)
+    if not isinstance(next(events), yaml.MappingStartEvent):
+        return None
+    
+    result = {}
+    try:
+        while True:
+            event = next(events)
+            if isinstance(event, yaml.MappingEndEvent):
+                return result
+            if not isinstance(event, yaml.ScalarEvent):
+                return None
+            key = _scalar_value(event)
+            if key not in keys:
+                node_events(itertools.chain((next(events),), events))
+                continue
+            event = next(events)
+            if not isinstance(event, yaml.ScalarEvent):
+                return None
+            result[key] = _scalar_value(event)
+    except _EventsNotDirectlyEncodable:
+        return None
+
+def mapping_entry_events(mapping_events, keys):
+    """Get the events of the values of some entries of a mapping
+    
+    :param mapping_events: events of a mapping node, as from :func:`node_events`
+    :param keys: container of the keys of interest
+    :returns:
+        :class:`dict` of the entries with keys in *keys*, each value a
+        :class:`list` of events that can be passed to
+        :func:`value_from_event_stream`, or ``None`` if the entries cannot
+        be determined without composing the mapping
+    
+    As for :func:`mapping_scalars`, all keys of the mapping must be scalars
+    of the core schema (so a mapping with merge keys gives ``None``); the
+    values for *keys* may be collections, but must be self-contained (see
+    :func:`is_self_contained`).
+    """
+    events = iter(mapping_events)
+    if not isinstance(next(events), yaml.MappingStartEvent):
+        return None
+    
+    result = {}
+    try:
+        while True:
+            event = next(events)
+            if isinstance(event, yaml.MappingEndEvent):
+                return result
+            if not isinstance(event, yaml.ScalarEvent):
+                return None
+            key = _scalar_value(event)
+            value_events = node_events(itertools.chain((next(events),), events))
+            if key not in keys:
+                continue
+            if not is_self_contained(value_events):
+                return None
+            result[key] = value_events
+    except _EventsNotDirectlyEncodable:
+        return None
+
 def get_load_fn(*, safe=True):
+    if use_libyaml:
+        return functools.partial(yaml.load, Loader=_c_loader(safe=safe))
     if safe:
         return yaml.safe_load
     if PYYAML_REQUIRES_LOADER:
@@ -99,9 +490,17 @@ def get_load_fn(*, safe=True):
     return yaml.load
 
 def get_load_all_fn(*, safe=True):
+    if use_libyaml:
+        return functools.partial(yaml.load_all, Loader=_c_loader(safe=safe))
     if safe:
         return yaml.safe_load_all
     if PYYAML_REQUIRES_LOADER:
         return yaml.unsafe_load_all
     return yaml.load_all
+
+def _c_loader(*, safe):
+    if safe:
+        return yaml.CSafeLoader
+    # CUnsafeLoader was added (as the counterpart of UnsafeLoader) in PyYAML 5.1
+    return getattr(yaml, 'CUnsafeLoader', yaml.CLoader)
     
@@ -0,0 +1,354 @@
+from intercom_test import cases as subject
+from intercom_test.json_asn1 import convert
+from decimal import Decimal
+from io import StringIO
+import json
+import os
+import random
+import string
+import tempfile
+import yaml
+from should_dsl import should, should_not
+
+# Keys computed with the pyasn1-based encoder; these must never change
+GOLDEN_KEYS = [
+    ({}, '555BjkhiNWnXXip7Ca6I7Zt3sSakRbn/ncaYmgjvoHk='),
+    ({'url': '/foo', 'method': 'get'}, 'uLDLQ0Fhud4+i7g0BVgd2UAFMi1h3dyzDzIsBqk0yT4='),
+    (
+        {
+            'url': '/widgets?color=blue',
+            'method': 'post',
+            'request body': {
+                'name': 'sprocket',
+                'count': 3,
+                'price': 1.25,
+                'tags': ['a', 'b'],
+                'active': True,
+                'owner': None,
+            },
+        },
+        'GJ0/s24f09Negj+QWP8/FT0FuBCtS3bwliEU1kM0+nE=',
+    ),
+    (
+        {'url': '/big', 'method': 'put', 'request body': 'x' * 300},
+        '7Fd01/93RvwwYmO8AJeMDB67DYE+5h6zpPVb1/ep7YQ=',
+    ),
+    (
+        {
+            'endpoint': 'compute',
+            'request parameters': [
+                0, -1, 10, 1e300, -0.5,
+                float('inf'), float('-inf'),
+                12345678901234567890,
+            ],
+        },
+        'mNWtVZzbry4k1J+1gWLjaLhDsZ5XvtoTM/XpJEzvwRI=',
+    ),
+    (
+        {'url': '/ünïcødé', 'method': 'get', 'request body': {'ключ': '值', '': ''}},
+        'zzm5PLz2FF19gtA25cEFBYVFA9KXc2PyJc2fdXu0gXg=',
+    ),
+]
+
+def random_jsonic_value(rng, depth=0):
+    choice = rng.random()
+    if depth > 3 or choice < 0.4:
+        return rng.choice([
+            None,
+            True,
+            False,
+            rng.randint(-10 ** 6, 10 ** 6),
+            rng.uniform(-1e3, 1e3),
+            ''.join(rng.choice(string.printable) for _ in range(rng.randint(0, 150))),
+        ])
+    if choice < 0.7:
+        return [random_jsonic_value(rng, depth + 1) for _ in range(rng.randint(0, 5))]
+    return dict(
+        (
+            ''.join(rng.choice('abc') for _ in range(rng.randint(0, 4))),
+            random_jsonic_value(rng, depth + 1),
+        )
+        for _ in range(rng.randint(0, 6))
+    )
+
+################################# TESTS #################################
+
+def test_golden_keys():
+    for case, key in GOLDEN_KEYS:
+        subject.hash_from_fields(case) |should| equal_to(key)
+
+def test_golden_keys_cross_checked():
+    for case, key in GOLDEN_KEYS:
+        subject.hash_from_fields(case, cross_check=True) |should| equal_to(key)
+
+def test_direct_der_matches_pyasn1():
+    rng = random.Random(20181021)
+    for _ in range(500):
+        value = random_jsonic_value(rng)
+        convert.direct_der(value) |should| equal_to(convert.pyasn1_der(value))
+
+def test_non_string_mapping_keys():
+    value = {1: 'a', 2.5: 'b', None: 'c', False: 'd'}
+    convert.direct_der(value) |should| equal_to(convert.pyasn1_der(value))
+
+def test_shared_subtrees():
+    shared = {'a': [1, 2]}
+    value = [shared, {'b': shared}, shared]
+    convert.direct_der(value) |should| equal_to(convert.pyasn1_der(value))
+
+def test_cycle_rejected():
+    cyclic = {'a': []}
+    cyclic['a'].append(cyclic)
+    (convert.direct_der, cyclic) |should| throw(ValueError)
+    (convert.pyasn1_der, cyclic) |should| throw(ValueError)
+
+def test_subtree_memo():
+    body = {'items': ['x' * 100, 'y' * 100], 'count': 2}
+    memo = convert.SubtreeMemo()
+    keys = [
+        subject.hash_from_fields(
+            {'url': url, 'method': 'post', 'request body': body},
+            subtree_memo=memo,
+        )
+        for url in ('/a', '/b', '/c')
+    ]
+    keys |should| equal_to([
+        subject.hash_from_fields({'url': url, 'method': 'post', 'request body': body})
+        for url in ('/a', '/b', '/c')
+    ])
+    memo.hits |should| equal_to(2)
+    # Only the body and its item list are remembered, not the key fields of each case
+    len(memo) |should| equal_to(2)
+    memo.misses |should| equal_to(2)
+
+def test_subtree_memo_reuses_equal_bodies():
+    def body():
+        return {'items': ['x' * 100, 'y' * 100], 'count': 2}
+    memo = convert.SubtreeMemo()
+    for url in ('/a', '/b', '/c'):
+        subject.hash_from_fields(
+            {'url': url, 'method': 'post', 'request body': body()},
+            subtree_memo=memo,
+        ) |should| equal_to(
+            subject.hash_from_fields({'url': url, 'method': 'post', 'request body': body()})
+        )
+    memo.hits |should| equal_to(2)
+    
+    # Keys equal in Python but converted differently are not confused
+    for request_body in ({1: 'x' * 100}, {True: 'x' * 100}, {'1': 'x' * 100}):
+        subject.hash_from_fields(
+            {'request body': request_body},
+            subtree_memo=memo,
+        ) |should| equal_to(subject.hash_from_fields({'request body': request_body}))
+    memo.hits |should| equal_to(3)
+
+def test_fallback_for_unhandled_numbers():
+    value = {'n': Decimal('1.5')}
+    def outcome(encode):
+        try:
+            return encode(value)
+        except Exception as e:
+            return type(e)
+    outcome(convert.asn1_der) |should| equal_to(outcome(convert.pyasn1_der))
+
+def test_identification_list_reader_keys():
+    case_yaml = (
+        "- url: /widgets\n"
+        "  method: post\n"
+        "  description: not part of the key\n"
+        "  request body: {name: sprocket, tags: [a, b]}\n"
+    )
+    key_fields = ('url', 'method', 'request body')
+    reader = subject.IdentificationListReader(key_fields)
+    keys = [
+        entry[0]
+        for entry in (reader.read(e) for e in yaml.parse(StringIO(case_yaml)))
+        if entry is not None
+    ]
+    case = yaml.safe_load(case_yaml)[0]
+    keys |should| equal_to([subject.hash_from_fields(
+        (k, v) for k, v in case.items() if k in key_fields
+    )])
+
+def test_case_key_cache_matches_uncached_keys():
+    cache = subject.CaseKeyCache()
+    for case, key in GOLDEN_KEYS:
+        cache.key_of(case) |should| equal_to(key)
+        cache.key_of(case) |should| equal_to(key)
+    cache.misses |should| equal_to(len(GOLDEN_KEYS))
+    cache.hits |should| equal_to(len(GOLDEN_KEYS))
+
+def test_case_key_cache_distinguishes_types():
+    cache = subject.CaseKeyCache()
+    for case in ({'a': '1'}, {'a': 1}, {'a': [1]}, {'a': {'1': 1}}, {'a': None}):
+        cache.key_of(case) |should| equal_to(subject.hash_from_fields(case))
+    cache.hits |should| equal_to(0)
+
+def test_case_key_cache_eviction():
+    cache = subject.CaseKeyCache(max_entries=2)
+    cache.key_of({'url': '/a'})
+    cache.key_of({'url': '/b'})
+    cache.key_of({'url': '/a'})
+    cache.key_of({'url': '/c'})
+    len(cache) |should| equal_to(2)
+    cache.key_of({'url': '/a'})
+    cache.hits |should| equal_to(2)
+    cache.key_of({'url': '/b'})
+    cache.misses |should| equal_to(4)
+
+def test_case_key_cache_keys_of_many():
+    cache = subject.CaseKeyCache()
+    fields_list = [case for case, _ in GOLDEN_KEYS]
+    expected = [key for _, key in GOLDEN_KEYS]
+    cache.keys_of_many(fields_list, workers=1) |should| equal_to(expected)
+    cache.misses |should| equal_to(len(GOLDEN_KEYS))
+    cache.keys_of_many(reversed(fields_list)) |should| equal_to(list(reversed(expected)))
+    cache.hits |should| equal_to(len(GOLDEN_KEYS))
+    scheme = subject.BLAKE2_JSON_KEY_SCHEME
+    cache.keys_of_many([{'a': 1}, {'a': True}], scheme=scheme) |should| equal_to([
+        subject.hash_from_fields({'a': 1}, scheme=scheme),
+        subject.hash_from_fields({'a': True}, scheme=scheme),
+    ])
+
+def test_hash_many_preserves_order():
+    test_cases = [
+        {'url': '/widgets/{}'.format(i), 'method': 'get', 'description': str(i)}
+        for i in range(25)
+    ]
+    expected = [
+        subject.hash_from_fields({'url': c['url'], 'method': c['method']})
+        for c in test_cases
+    ]
+    subject.hash_many(test_cases, ('url', 'method'), workers=1) |should| equal_to(expected)
+    subject.hash_many(test_cases, ('url', 'method'), workers=3, chunk_size=4) |should| equal_to(expected)
+
+def test_canonical_json():
+    subject.canonical_json(
+        {'b': [1.0, True, None, 'café'], 'a': {1: 2.5, None: 0}}
+    ) |should| equal_to(
+        '{"a":{"1":2.5,"null":0},"b":[1,true,null,"café"]}'.encode('utf-8')
+    )
+    (subject.canonical_json, {'a': float('inf')}) |should| throw(ValueError)
+    (subject.canonical_json, {'a': 10 ** 400}) |should| throw(ValueError)
+    (subject.canonical_json, {'a': object()}) |should| throw(TypeError)
+
+def test_canonical_json_numbers():
+    # Numbers as written by ECMAScript (RFC 8785, appendix B)
+    for value, encoded in [
+        (0.0, '0'), (-0.0, '0'), (1e-7, '1e-7'), (1.5e-6, '0.0000015'),
+        (1e-6, '0.000001'), (5e-324, '5e-324'), (4.50, '4.5'), (2e-3, '0.002'),
+        (333333333.33333329, '333333333.3333333'), (1e-27, '1e-27'),
+        (1.2345678901234568e+20, '123456789012345680000'), (1e21, '1e+21'),
+        (1e30, '1e+30'), (1.5e300, '1.5e+300'), (-1.25, '-1.25'),
+        (1.7976931348623157e308, '1.7976931348623157e+308'),
+        (2 ** 53, '9007199254740992'), (2 ** 53 + 1, '9007199254740992'),
+        (2 ** 64, '18446744073709552000'),
+    ]:
+        subject.canonical_json(value) |should| equal_to(encoded.encode('ascii'))
+
+def test_canonical_json_key_order():
+    # Keys are sorted by UTF-16 code units (RFC 8785, section 3.2.3)
+    value = {
+        '\u20ac': 'Euro Sign', '\r': 'Carriage Return',
+        '\ufb33': 'Hebrew Letter Dalet With Dagesh', '1': 'One',
+        '\U0001f600': 'Emoji: Grinning Face', '\u0080': 'Control',
+        '\u00f6': 'Latin Small Letter O With Diaeresis',
+    }
+    [
+        k for k in json.loads(subject.canonical_json(value).decode('utf-8'))
+    ] |should| equal_to(
+        ['\r', '1', '\u0080', '\u00f6', '\u20ac', '\U0001f600', '\ufb33']
+    )
+
+def test_blake2_json_keys():
+    scheme = subject.BLAKE2_JSON_KEY_SCHEME
+    subject.hash_from_fields({}, scheme=scheme) |should| equal_to(
+        'wJ2lItrCYcPSVmIwvtENLz7xP452VFdsEuhX4H94YJg='
+    )
+    subject.hash_from_fields({'url': '/foo', 'method': 'get'}, scheme=scheme) |should| equal_to(
+        'YSsmH3T81eJz3/RqyUhApAQbDsNECOIOm1WE9gcgpjU='
+    )
+    (lambda: subject.hash_from_fields({}, scheme='md5')) |should| throw(ValueError)
+
+def test_case_key_cache_separates_schemes():
+    cache = subject.CaseKeyCache()
+    scheme = subject.BLAKE2_JSON_KEY_SCHEME
+    for case in ({'a': 1}, {'a': True}, {'a': 1}, {'a': True}):
+        cache.key_of(case) |should| equal_to(subject.hash_from_fields(case))
+        cache.key_of(case, scheme=scheme) |should| equal_to(
+            subject.hash_from_fields(case, scheme=scheme)
+        )
+
+def test_golden_vector_file():
+    with open(os.path.join(os.path.dirname(__file__), 'golden_case_keys.json')) as f:
+        vectors = json.load(f)
+    for vector in vectors:
+        fields = vector['fields']
+        convert.direct_der(fields).hex() |should| equal_to(vector['der'])
+        for scheme, key in vector['keys'].items():
+            subject.hash_from_fields(fields, scheme=scheme) |should| equal_to(key)
+
+def test_parsed_case_cache():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'cases.yml')
+        with open(path, 'w') as f:
+            f.write("- {url: /foo}\n")
+        cache = subject.ParsedCaseCache(max_bytes=200)
+        cache.load(path, 'safe') |should| be(None)
+        cache.save(path, 'safe', [{'url': '/foo'}], cache.file_identity(path))
+        
+        first = cache.load(path, 'safe')
+        first |should| equal_to([{'url': '/foo'}])
+        first[0]['url'] = '/changed'
+        cache.load(path, 'safe') |should| equal_to([{'url': '/foo'}])
+        cache.load(path, 'unsafe') |should| be(None)
+        (cache.hits, cache.misses) |should| equal_to((2, 2))
+        
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        cache.load(path, 'safe') |should| be(None)
+        len(cache) |should| equal_to(0)
+        
+        for i in range(20):
+            cache.save(path, 'kind{}'.format(i), [{'url': '/foo'}], cache.file_identity(path))
+        cache.size |should| be_less_than_or_equal_to(200)
+        cache.load(path, 'kind19') |should_not| be(None)
+        cache.load(path, 'kind0') |should| be(None)
+        cache.save(path, 'big', ['x' * 2000], cache.file_identity(path))
+        cache.load(path, 'big') |should| be(None)
+
+def test_augmentation_cache():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'widgets.yml')
+        other_path = os.path.join(root, 'gadgets.yml')
+        for p in (path, other_path):
+            with open(p, 'w') as f:
+                f.write("abc=: {fixtures: [a]}\n")
+        cache = subject.AugmentationCache(3, max_bytes=None)
+        cache.save('abc=', path, {'fixtures': ['a']}, cache.file_identity(path))
+        
+        first = cache.load('abc=', path)
+        first |should| equal_to({'fixtures': ['a']})
+        first['fixtures'].append('b')
+        cache.load('abc=', path) |should| equal_to({'fixtures': ['a']})
+        cache.load('abc=', other_path) |should| be(None)
+        cache.load('def=', path) |should| be(None)
+        (cache.hits, cache.misses) |should| equal_to((2, 2))
+        
+        for key in ('k1=', 'k2=', 'k3='):
+            cache.save(key, other_path, {}, cache.file_identity(other_path))
+        len(cache) |should| equal_to(3)
+        cache.load('abc=', path) |should| be(None)
+        
+        cache.invalidate(other_path)
+        len(cache) |should| equal_to(0)
+        
+        cache.save('abc=', path, {'fixtures': ['a']}, cache.file_identity(path))
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        cache.load('abc=', path) |should| be(None)
+        
+        small_cache = subject.AugmentationCache(max_bytes=100)
+        small_cache.save('big=', path, {'note': 'x' * 200}, small_cache.file_identity(path))
+        len(small_cache) |should| equal_to(0)
+        (lambda: subject.AugmentationCache(max_bytes=None)) |should| throw(ValueError)
@@ -0,0 +1,171 @@
+from intercom_test import disk_cache as subject
+from intercom_test import framework
+from intercom_test.augmentation import compact_file, update_file
+import os
+import tempfile
+from unittest.mock import patch
+from should_dsl import should, should_not
+
+CASES_YAML = """\
+- url: /widgets
+  method: get
+  response body: []
+- url: /widgets
+  method: post
+  request body: {name: sprocket}
+  response status: 201
+"""
+
+UPDATES_YAML = """\
+- url: /widgets
+  method: get
+  response body: []
+  fixtures: [empty_widget_table]
+"""
+
+def make_spec_tree(root):
+    spec_dir = os.path.join(root, 'spec')
+    aug_dir = os.path.join(root, 'augmentation')
+    os.mkdir(spec_dir)
+    os.mkdir(aug_dir)
+    with open(os.path.join(spec_dir, 'widgets.yml'), 'w') as f:
+        f.write(CASES_YAML)
+    with open(os.path.join(aug_dir, 'widgets.update.yml'), 'w') as f:
+        f.write(UPDATES_YAML)
+    return spec_dir, aug_dir
+
+def failing_hash(*args, **kwargs):
+    raise AssertionError("case key should have come from the store")
+
+def failing_load(*args, **kwargs):
+    raise AssertionError("test cases should have come from the store")
+
+def failing_index(*args, **kwargs):
+    raise AssertionError("compact file index should have come from the store")
+
+################################# TESTS #################################
+
+def test_store_round_trip():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, 'data.yml')
+        with open(source, 'w') as f:
+            f.write(CASES_YAML)
+        store = subject.CaseKeyStore(os.path.join(root, 'cache'))
+        identity = store.file_identity(source)
+        store.save(source, 'test', ('url',), [['abc', 0]], identity)
+        store.load(source, 'test', ('url',)) |should| equal_to([['abc', 0]])
+        store.load(source, 'test', ('url', 'method')) |should| be(None)
+        store.load(source, 'other', ('url',)) |should| be(None)
+
+def test_store_invalidated_by_change():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, 'data.yml')
+        with open(source, 'w') as f:
+            f.write(CASES_YAML)
+        store = subject.CaseKeyStore(os.path.join(root, 'cache'), verify_content=True)
+        store.save(source, 'test', ('url',), [['abc', 0]], store.file_identity(source))
+        stat = os.stat(source)
+        with open(source, 'w') as f:
+            f.write(CASES_YAML.replace('sprocket', 'gadget!!'))
+        # Defeat the size and modification time checks
+        os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        store.load(source, 'test', ('url',)) |should| be(None)
+
+def test_store_purge():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, 'data.yml')
+        with open(source, 'w') as f:
+            f.write(CASES_YAML)
+        store = subject.CaseKeyStore(os.path.join(root, 'cache'))
+        store.save(source, 'test', ('url',), [], store.file_identity(source))
+        store.purge()
+        store.load(source, 'test', ('url',)) |should| be(None)
+
+def test_update_index_uses_store():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        update_path = os.path.join(aug_dir, 'widgets.update.yml')
+        store = subject.CaseKeyStore(os.path.join(root, 'cache'))
+        key_fields = framework.HTTPCaseAugmenter.CASE_PRIMARY_KEYS
+        first = update_file.index([update_path], key_fields, case_key_store=store)
+        with patch.object(update_file, '_hash_from_der', failing_hash):
+            second = update_file.index([update_path], key_fields, case_key_store=store)
+        sorted(second) |should| equal_to(sorted(first))
+        for case_key, augmenter in second.items():
+            augmenter.offset |should| equal_to(first[case_key].offset)
+
+def test_case_provider_uses_store():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        store = subject.CaseKeyStore(os.path.join(root, 'cache'))
+        def provider():
+            return framework.InterfaceCaseProvider(
+                spec_dir,
+                'widgets',
+                case_augmenter=framework.HTTPCaseAugmenter(aug_dir, case_key_store=store),
+                case_key_store=store,
+            )
+        first = list(provider().cases())
+        first[0]['fixtures'] |should| equal_to(['empty_widget_table'])
+        with patch.object(framework, '_hash_from_fields', failing_hash):
+            list(provider().cases()) |should| equal_to(first)
+
+def test_compiled_case_store_round_trip():
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, 'data.yml')
+        with open(source, 'w') as f:
+            f.write(CASES_YAML)
+        store = subject.CompiledCaseStore(os.path.join(root, 'cache'))
+        store.save(source, 'safe', 'abc', [{'url': '/'}])
+        store.load(source, 'safe', 'abc') |should| equal_to([{'url': '/'}])
+        store.load(source, 'safe', 'def') |should| be(None)
+        store.load(source, 'unsafe', 'abc') |should| be(None)
+
+def test_case_provider_uses_compiled_cases():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        store = subject.CompiledCaseStore(os.path.join(root, 'cache'))
+        def provider():
+            result = framework.InterfaceCaseProvider(
+                spec_dir,
+                'widgets',
+                case_augmenter=framework.HTTPCaseAugmenter(aug_dir),
+                compiled_case_store=store,
+            )
+            result.use_body_type_magic = True
+            return result
+        first = list(provider().cases())
+        first[0]['fixtures'] |should| equal_to(['empty_widget_table'])
+        with patch.object(framework, '_get_yaml_load_all', failing_load):
+            list(provider().cases()) |should| equal_to(first)
+        
+        # Changed content must be parsed again
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            f.write("- {url: /gadgets, method: get}\n")
+        len(list(provider().cases())) |should| equal_to(3)
+
+def test_compact_file_index_uses_store():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        compact_path = os.path.join(aug_dir, 'widgets.yml')
+        store = subject.CaseKeyStore(os.path.join(root, 'cache'))
+        key_fields = framework.HTTPCaseAugmenter.CASE_PRIMARY_KEYS
+        
+        # Rewriting the compact file stores its new index
+        framework.HTTPCaseAugmenter(aug_dir, case_key_store=store).update_compact_files()
+        os.remove(os.path.join(aug_dir, 'widgets.update.yml'))
+        expected = compact_file.case_keys(compact_path)
+        with patch.object(compact_file, 'CaseIndexer', failing_index):
+            compact_file.case_keys(compact_path, case_key_store=store) |should| equal_to(expected)
+            augmenter = framework.HTTPCaseAugmenter(aug_dir, case_key_store=store)
+        augmenter.augmented_test_case(
+            {'url': '/widgets', 'method': 'get'}
+        )['fixtures'] |should| equal_to(['empty_widget_table'])
+        
+        # Changed content must be indexed again
+        with open(compact_path, 'a') as f:
+            f.write("abc=: {fixtures: []}\n")
+        indexed = compact_file.case_keys(compact_path, case_key_store=store)
+        [case_key for case_key, _ in indexed] |should| equal_to(
+            [case_key for case_key, _ in expected] + ['abc=']
+        )
@@ -0,0 +1,899 @@
+from intercom_test import framework as subject
+from intercom_test import cases as cases_module, disk_cache
+from intercom_test.augmentation import compact_file, update_file
+from intercom_test.cases import BLAKE2_JSON_KEY_SCHEME, JSON_ASN1_KEY_SCHEME, AugmentationCache, CaseKeyCache, ParsedCaseCache
+from intercom_test.exceptions import KeySchemeMismatchError
+from intercom_test.utils import StringPool
+from io import StringIO
+import os
+import re
+import tempfile
+import yaml
+from unittest.mock import patch
+from should_dsl import should, should_not
+
+CASES_YAML = """\
+- url: /widgets
+  method: get
+  response body: []
+- url: /widgets
+  method: post
+  request body: {name: sprocket}
+  response status: 201
+"""
+
+UPDATES_YAML = """\
+- url: /widgets
+  method: get
+  response body: []
+  fixtures: [empty_widget_table]
+- url: /widgets
+  method: post
+  request body: {name: sprocket}
+  fixtures: []
+"""
+
+def make_spec_tree(root):
+    spec_dir = os.path.join(root, 'spec')
+    aug_dir = os.path.join(root, 'augmentation')
+    os.mkdir(spec_dir)
+    os.mkdir(aug_dir)
+    with open(os.path.join(spec_dir, 'widgets.yml'), 'w') as f:
+        f.write(CASES_YAML)
+    with open(os.path.join(aug_dir, 'widgets.update.yml'), 'w') as f:
+        f.write(UPDATES_YAML)
+    return spec_dir, aug_dir
+
+def committed_spec_tree(root, **augmenter_kwargs):
+    spec_dir, aug_dir = make_spec_tree(root)
+    subject.HTTPCaseAugmenter(aug_dir, **augmenter_kwargs).update_compact_files()
+    os.remove(os.path.join(aug_dir, 'widgets.update.yml'))
+    return spec_dir, aug_dir
+
+def failing_load(*args, **kwargs):
+    raise AssertionError("the whole file should not have been loaded")
+
+def case_provider(spec_dir, aug_dir):
+    return subject.InterfaceCaseProvider(
+        spec_dir,
+        'widgets',
+        case_augmenter=subject.HTTPCaseAugmenter(aug_dir),
+    )
+
+################################# TESTS #################################
+
+def test_legacy_compact_file_has_no_scheme_header():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        compact_path = os.path.join(aug_dir, 'widgets.yml')
+        with open(compact_path) as f:
+            f.read() |should_not| contain(compact_file.KEY_SCHEME_HEADER_PREFIX)
+        compact_file.key_scheme(compact_path) |should| equal_to(JSON_ASN1_KEY_SCHEME)
+
+def test_case_key_scheme_read_from_compact_files():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root, case_key_scheme=BLAKE2_JSON_KEY_SCHEME)
+        compact_file.key_scheme(
+            os.path.join(aug_dir, 'widgets.yml')
+        ) |should| equal_to(BLAKE2_JSON_KEY_SCHEME)
+        provider = case_provider(spec_dir, aug_dir)
+        provider.case_augmenter.case_key_scheme |should| equal_to(BLAKE2_JSON_KEY_SCHEME)
+        [c['fixtures'] for c in provider.cases()] |should| equal_to([['empty_widget_table'], []])
+
+def test_rekey_compact_files():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        provider = case_provider(spec_dir, aug_dir)
+        expected = list(provider.cases())
+        provider.rekey_compact_files(BLAKE2_JSON_KEY_SCHEME) |should| equal_to([])
+        provider.case_augmenter.case_key_scheme |should| equal_to(BLAKE2_JSON_KEY_SCHEME)
+        list(provider.cases()) |should| equal_to(expected)
+        list(case_provider(spec_dir, aug_dir).cases()) |should| equal_to(expected)
+
+def test_mismatched_key_schemes_rejected():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        (lambda: subject.HTTPCaseAugmenter(
+            aug_dir,
+            case_key_scheme=BLAKE2_JSON_KEY_SCHEME,
+        )) |should| throw(KeySchemeMismatchError)
+
+def test_parallel_parsing_preserves_order():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            for i in range(20):
+                f.write("---\n- {{url: /gadgets/{0}, method: get}}\n- {{url: /gadgets/{0}, method: put}}\n".format(i))
+        os.mkdir(os.path.join(spec_dir, 'widgets'))
+        for name in ('b', 'a'):
+            with open(os.path.join(spec_dir, 'widgets', name + '.yml'), 'w') as f:
+                f.write("- {{url: /{}, method: get}}\n".format(name))
+        
+        class ParallelCaseProvider(subject.InterfaceCaseProvider):
+            parallel_parsing_workers = 3
+            parallel_parsing_chunk_size = 100
+        
+        expected = list(case_provider(spec_dir, aug_dir).cases())
+        len(expected) |should| equal_to(44)
+        list(ParallelCaseProvider(
+            spec_dir,
+            'widgets',
+            case_augmenter=subject.HTTPCaseAugmenter(aug_dir),
+        ).cases()) |should| equal_to(expected)
+
+def test_random_access_to_cases():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            f.write("---\n- &shared {url: /gadgets, method: get}\n")
+            # The alias makes this case unreadable apart from its file
+            f.write("- {url: /gizmos, method: get, related: [*shared]}\n")
+        os.mkdir(os.path.join(spec_dir, 'widgets'))
+        with open(os.path.join(spec_dir, 'widgets', 'more.yml'), 'w') as f:
+            f.write("[{url: /sprockets, method: get}]\n")
+        
+        provider = case_provider(spec_dir, aug_dir)
+        expected = list(provider.cases())
+        len(provider) |should| equal_to(5)
+        with patch.object(subject, '_get_yaml_load_all', failing_load):
+            provider.case_at(0) |should| equal_to(expected[0])
+            provider.case_at(2) |should| equal_to(expected[2])
+        for i, test_case in enumerate(expected):
+            provider.case_at(i) |should| equal_to(test_case)
+        provider.case_at(-1) |should| equal_to(expected[-1])
+        (provider.case_at, len(expected)) |should| throw(IndexError)
+        
+        augmenter = provider.case_augmenter
+        for test_case in expected:
+            provider.case_by_key(augmenter.key_of_case(test_case)) |should| equal_to(test_case)
+        (provider.case_by_key, 'no-such-key') |should| throw(KeyError)
+
+def test_random_access_to_aliased_and_merged_cases():
+    for scheme in (JSON_ASN1_KEY_SCHEME, BLAKE2_JSON_KEY_SCHEME):
+        with tempfile.TemporaryDirectory() as root:
+            spec_dir, aug_dir = committed_spec_tree(root, case_key_scheme=scheme)
+            with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+                f.write(
+                    "- &base {url: /gadgets, method: get}\n"
+                    "- <<: *base\n"
+                    "  url: /gizmos\n"
+                    "- url: /gizmos\n"
+                    "  method: &post post\n"
+                    "  request body: {name: gizmo}\n"
+                    "- url: /sprockets\n"
+                    "  method: *post\n"
+                    "- <<: {method: put}\n"
+                    "  url: /sprockets\n"
+                )
+            
+            provider = case_provider(spec_dir, aug_dir)
+            expected = list(provider.cases())
+            [(c['method'], c['url']) for c in expected[2:]] |should| equal_to([
+                ('get', '/gadgets'),
+                ('get', '/gizmos'),
+                ('post', '/gizmos'),
+                ('post', '/sprockets'),
+                ('put', '/sprockets'),
+            ])
+            len(provider) |should| equal_to(7)
+            [provider.case_at(i) for i in range(7)] |should| equal_to(expected)
+            list(provider.cases(shard=0, of=1)) |should| equal_to(expected)
+            augmenter = provider.case_augmenter
+            for test_case in expected:
+                provider.case_by_key(augmenter.case_key(test_case)) |should| equal_to(test_case)
+
+def test_case_provider_is_true_without_indexing():
+    with tempfile.TemporaryDirectory() as root:
+        provider = subject.InterfaceCaseProvider(root, 'widgets')
+        with patch.object(provider, '_case_index', failing_load):
+            bool(provider) |should| be(True)
+
+def test_random_access_to_non_ascii_cases():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'w', encoding='utf-8', newline='') as f:
+            f.write(
+                "- url: /widgets\r\n"
+                "  method: get\r\n"
+                "  description: caf\u00e9 \u2603\u2603\r\n"
+                "- {url: /caf\u00e9s, method: get}\r\n"
+                "- url: /widgets\n"
+                "  method: post\n"
+                "  request body: {name: \u2603}\n"
+            )
+        
+        provider = case_provider(spec_dir, aug_dir)
+        expected = list(provider.cases())
+        [test_case['url'] for test_case in expected] |should| equal_to(['/widgets', '/caf\u00e9s', '/widgets'])
+        with patch.object(subject, '_get_yaml_load_all', failing_load):
+            [provider.case_at(i) for i in range(3)] |should| equal_to(expected)
+            list(provider.cases(shard=0, of=1)) |should| equal_to(expected)
+
+def test_random_access_with_blake2_keys():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root, case_key_scheme=BLAKE2_JSON_KEY_SCHEME)
+        store = disk_cache.CaseKeyStore(os.path.join(root, 'cache'))
+        provider = subject.InterfaceCaseProvider(
+            spec_dir,
+            'widgets',
+            case_augmenter=subject.HTTPCaseAugmenter(aug_dir),
+            case_key_store=store,
+        )
+        provider.use_body_type_magic = True
+        expected = list(provider.cases())
+        [test_case['fixtures'] for test_case in expected] |should| equal_to([['empty_widget_table'], []])
+        
+        [provider.case_at(i) for i in range(2)] |should| equal_to(expected)
+        list(provider.cases(shard=0, of=1)) |should| equal_to(expected)
+        augmenter = provider.case_augmenter
+        for test_case in expected:
+            provider.case_by_key(augmenter.case_key(test_case)) |should| equal_to(test_case)
+
+def test_case_key_uses_instance_settings():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root, case_key_scheme=BLAKE2_JSON_KEY_SCHEME)
+        cache = CaseKeyCache()
+        augmenter = subject.HTTPCaseAugmenter(aug_dir, case_key_cache=cache)
+        test_case = {'url': '/widgets', 'method': 'get'}
+        augmenter.case_key(test_case) |should| equal_to(
+            augmenter.key_of_case(test_case, scheme=BLAKE2_JSON_KEY_SCHEME)
+        )
+        augmenter.case_key(test_case) |should_not| equal_to(augmenter.key_of_case(test_case))
+        len(cache) |should| equal_to(1)
+        
+        augmenter = OneArgumentKeyAugmenter(os.path.join(root, 'augmentation'))
+        augmenter.case_key(test_case) |should| equal_to(subject.HTTPCaseAugmenter.key_of_case(test_case))
+
+class OneArgumentAugmenter(subject.HTTPCaseAugmenter):
+    def augmented_test_case(self, test_case):
+        return dict(super().augmented_test_case(test_case), checked=True)
+
+class OneArgumentKeyAugmenter(subject.HTTPCaseAugmenter):
+    @classmethod
+    def key_of_case(cls, test_case):
+        return super().key_of_case(test_case)
+
+class DuckTypedAugmenter:
+    def __init__(self, aug_dir):
+        self._augmenter = subject.HTTPCaseAugmenter(aug_dir)
+    
+    def augmented_test_case(self, test_case):
+        return self._augmenter.augmented_test_case(test_case)
+
+def test_augmenter_overriding_one_argument_augmented_test_case():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        for options in ({}, {'case_key_cache': CaseKeyCache()}):
+            provider = subject.InterfaceCaseProvider(
+                spec_dir,
+                'widgets',
+                case_augmenter=OneArgumentAugmenter(aug_dir),
+                **options
+            )
+            expected = list(provider.cases())
+            [test_case['fixtures'] for test_case in expected] |should| equal_to([['empty_widget_table'], []])
+            [test_case['checked'] for test_case in expected] |should| equal_to([True, True])
+            
+            [provider.case_at(i) for i in range(2)] |should| equal_to(expected)
+            list(provider.cases(shard=0, of=1)) |should| equal_to(expected)
+            provider.batch_augmentation = True
+            list(provider.cases()) |should| equal_to(expected)
+
+def test_augmenter_overriding_one_argument_key_of_case():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        augmenter = OneArgumentKeyAugmenter(aug_dir)
+        provider = subject.InterfaceCaseProvider(spec_dir, 'widgets', case_augmenter=augmenter)
+        expected = list(provider.cases())
+        [test_case['fixtures'] for test_case in expected] |should| equal_to([['empty_widget_table'], []])
+        provider.duplicate_cases() |should| equal_to([])
+        
+        [provider.case_at(i) for i in range(2)] |should| equal_to(expected)
+        for test_case in expected:
+            provider.case_by_key(augmenter.case_key(test_case)) |should| equal_to(test_case)
+        provider.batch_augmentation = True
+        list(provider.cases()) |should| equal_to(expected)
+
+def test_duck_typed_augmenter():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        provider = subject.InterfaceCaseProvider(
+            spec_dir,
+            'widgets',
+            case_augmenter=DuckTypedAugmenter(aug_dir),
+            case_key_store=disk_cache.CaseKeyStore(os.path.join(root, 'cache')),
+        )
+        expected = list(provider.cases())
+        [test_case['fixtures'] for test_case in expected] |should| equal_to([['empty_widget_table'], []])
+        
+        [provider.case_at(i) for i in range(2)] |should| equal_to(expected)
+        list(provider.cases(shard=0, of=1)) |should| equal_to(expected)
+        provider.batch_augmentation = True
+        list(provider.cases()) |should| equal_to(expected)
+        provider.duplicate_cases |should| throw(TypeError)
+        (provider.case_by_key, 'abc=') |should| throw(TypeError)
+
+def test_shards_partition_cases():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            for i in range(10):
+                f.write("---\n- {{url: /gadgets/{}, method: get}}\n".format(i))
+        
+        for provider in (case_provider(spec_dir, aug_dir), subject.InterfaceCaseProvider(spec_dir, 'widgets')):
+            expected = list(provider.cases())
+            shards = [list(provider.cases(shard=i, of=3)) for i in range(3)]
+            sum(len(s) for s in shards) |should| equal_to(len(expected))
+            for s in shards:
+                s |should| equal_to([c for c in expected if c in s])
+            list(provider.cases(shard=1, of=3)) |should| equal_to(shards[1])
+        
+        provider = case_provider(spec_dir, aug_dir)
+        (lambda: list(provider.cases(shard=3, of=3))) |should| throw(ValueError)
+        (lambda: list(provider.cases(shard=0))) |should| throw(ValueError)
+
+def test_shards_of_json_body_cases_are_not_all_constructed():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            for i in range(6):
+                f.write(
+                    "- url: /gadgets\n"
+                    "  method: post\n"
+                    "  request type: json\n"
+                    "  request body: '{{\"name\": \"gadget {}\"}}'\n".format(i)
+                )
+        
+        def provider():
+            result = case_provider(spec_dir, aug_dir)
+            result.use_body_type_magic = True
+            return result
+        expected = list(provider().cases())
+        expected[-1]['request body'] |should| equal_to({'name': 'gadget 5'})
+        
+        sharded = provider()
+        with patch.object(subject, '_get_yaml_load_all', failing_load):
+            shards = [list(sharded.cases(shard=i, of=3)) for i in range(3)]
+            for test_case in expected:
+                sharded.case_by_key(sharded.case_key(test_case)) |should| equal_to(test_case)
+        sorted(map(repr, sum(shards, []))) |should| equal_to(sorted(map(repr, expected)))
+
+def test_weighted_shards_balance_runtime():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            for i in range(6):
+                f.write("- {{url: /gadgets/{}, method: get}}\n".format(i))
+        
+        provider = subject.InterfaceCaseProvider(spec_dir, 'widgets')
+        # The first case is as slow as all the others together
+        weights = dict((i, 1.0) for i in range(1, 8))
+        weights[0] = 7.0
+        shards = [list(provider.cases(shard=i, of=2, case_weights=weights)) for i in range(2)]
+        shards[0] |should| equal_to([provider.case_at(0)])
+        len(shards[1]) |should| equal_to(7)
+        
+        # Cases without recorded runtimes count as average
+        del weights[7]
+        len(list(provider.cases(shard=1, of=2, case_weights=weights))) |should| equal_to(7)
+
+def test_where_filters_cases_before_construction():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            f.write("- {url: /gadgets/1, method: get, description: First gadget}\n")
+            f.write("- {url: /gadgets/2, method: put, description: Second gadget}\n")
+            f.write("- &shared {url: /gizmos, method: get}\n")
+            f.write("- {url: /gizmos/1, method: get, related: [*shared]}\n")
+        
+        provider = case_provider(spec_dir, aug_dir)
+        all_cases = list(provider.cases())
+        
+        constructed = []
+        def counting_construction(*args, **kwargs):
+            constructed.append(args)
+            return value_from_event_stream(*args, **kwargs)
+        value_from_event_stream = subject._yaml_value_from_events
+        with patch.object(subject, '_get_yaml_load_all', failing_load), \
+                patch.object(subject, '_yaml_value_from_events', counting_construction):
+            list(provider.cases(where={'url': '/gadgets/*'})) |should| equal_to(all_cases[2:4])
+        len(constructed) |should| equal_to(2)
+        
+        for where in (
+            {'method': 'get', 'url': re.compile('^/gi')},
+            {'description': re.compile('gadget$')},
+            {'url': lambda url: url.count('/') == 2},
+            {'no such field': '*'},
+        ):
+            expected = [c for c in all_cases if subject._CasePredicate(where)(c)]
+            list(provider.cases(where=where)) |should| equal_to(expected)
+            list(provider.cases(where=where, shard=0, of=1)) |should| equal_to(expected)
+        
+        stored_provider = subject.InterfaceCaseProvider(
+            spec_dir,
+            'widgets',
+            case_augmenter=subject.HTTPCaseAugmenter(aug_dir),
+            case_key_store=disk_cache.CaseKeyStore(os.path.join(root, 'cache')),
+        )
+        list(stored_provider.cases(where={'method': 'put'})) |should| equal_to([all_cases[3]])
+        list(stored_provider.cases()) |should| equal_to(all_cases)
+        
+        (lambda: list(provider.cases(where={'url': 3}))) |should| throw(TypeError)
+
+def test_lazy_json_bodies():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            f.write(
+                "- url: /gadgets\n"
+                "  method: post\n"
+                "  request type: json\n"
+                "  request body: '{\"name\": \"gizmo\"}'\n"
+                "  response type: json\n"
+                "  response body: '{\"id\": 7,  \"tags\": []}'\n"
+            )
+        
+        def provider(*, augmented=True, lazy=False):
+            result = subject.InterfaceCaseProvider(
+                spec_dir,
+                'widgets',
+                case_augmenter=subject.HTTPCaseAugmenter(aug_dir) if augmented else None,
+            )
+            result.use_body_type_magic = True
+            result.lazy_json_bodies = lazy
+            return result
+        
+        expected = list(provider().cases())
+        lazy_case = list(provider(lazy=True).cases())[2]
+        # The request body is a key field, so it is parsed immediately
+        lazy_case['request body'] |should| equal_to({'name': 'gizmo'})
+        response_body = lazy_case['response body']
+        response_body.raw |should| equal_to('{"id": 7,  "tags": []}')
+        response_body.parsed |should| be(False)
+        for dumper in (subject._SafeCaseDumper, subject._CaseDumper):
+            yaml.dump(lazy_case, Dumper=dumper) |should| contain(response_body.raw)
+        response_body.parsed |should| be(False)
+        # Importing the framework does not change how PyYAML dumps values
+        (yaml.safe_dump, lazy_case) |should| throw(yaml.representer.RepresenterError)
+        lazy_case |should| equal_to(expected[2])
+        response_body['id'] |should| equal_to(7)
+        response_body.value |should| equal_to({'id': 7, 'tags': []})
+        
+        unaugmented_case = list(provider(augmented=False, lazy=True).cases())[2]
+        unaugmented_case['request body'].parsed |should| be(False)
+        dict(unaugmented_case['request body'].items()) |should| equal_to({'name': 'gizmo'})
+
+def test_spec_watcher_reports_changes():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        main_file = os.path.join(spec_dir, 'widgets.yml')
+        extension_file = os.path.join(spec_dir, 'widgets', 'more.yml')
+        os.mkdir(os.path.join(spec_dir, 'widgets'))
+        with open(extension_file, 'w') as f:
+            f.write("- {url: /gadgets, method: get}\n")
+        
+        provider = case_provider(spec_dir, aug_dir)
+        key_of_case = provider.case_key
+        watcher = subject.SpecWatcher(provider)
+        Kind = subject.SpecWatcher.ChangeKind
+        
+        changes = watcher.poll()
+        [c.kind for c in changes] |should| equal_to([Kind.added] * 3)
+        [c.new_case for c in changes] |should| equal_to(list(provider.cases()))
+        [c.case_key for c in changes] |should| equal_to([key_of_case(c) for c in provider.cases()])
+        watcher.poll() |should| equal_to([])
+        
+        read_files = []
+        file_cases = provider.file_cases
+        def recording_file_cases(filepath):
+            read_files.append(filepath)
+            return file_cases(filepath)
+        provider.file_cases = recording_file_cases
+        
+        with open(extension_file, 'w') as f:
+            f.write("- {url: /gadgets, method: get, response body: [1]}\n- {url: /gizmos, method: get}\n")
+        changes = watcher.poll()
+        read_files |should| equal_to([extension_file])
+        [(c.kind, c.new_case['url']) for c in changes] |should| equal_to(
+            [(Kind.changed, '/gadgets'), (Kind.added, '/gizmos')]
+        )
+        changes[0].old_case |should_not| contain('response body')
+        watcher.cases() |should| equal_to(list(provider.cases()))
+        
+        os.remove(extension_file)
+        [(c.kind, c.old_case['url']) for c in watcher.poll()] |should| equal_to(
+            [(Kind.removed, '/gadgets'), (Kind.removed, '/gizmos')]
+        )
+        len(provider) |should| equal_to(2)
+        
+        # Unparseable files keep their cases until fixed
+        with open(main_file, 'a') as f:
+            f.write("- {url: [\n")
+        watcher.poll() |should| equal_to([])
+        len(watcher.cases()) |should| equal_to(2)
+        
+        unaugmented = subject.InterfaceCaseProvider(spec_dir, 'widgets')
+        (subject.SpecWatcher, unaugmented) |should| throw(subject.NoAugmentationError)
+
+def test_spec_watcher_keys_with_augmenter_scheme():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root, case_key_scheme=BLAKE2_JSON_KEY_SCHEME)
+        provider = case_provider(spec_dir, aug_dir)
+        augmenter = provider.case_augmenter
+        changes = subject.SpecWatcher(provider).poll()
+        [c.case_key for c in changes] |should| equal_to(
+            [augmenter.case_key(test_case) for test_case in provider.cases()]
+        )
+        for change in changes:
+            provider.case_by_key(change.case_key) |should| equal_to(change.new_case)
+
+def test_parsed_case_cache_shared_between_providers():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        
+        class SharingCaseProvider(subject.InterfaceCaseProvider):
+            parsed_case_cache = ParsedCaseCache()
+        
+        def provider():
+            result = SharingCaseProvider(
+                spec_dir,
+                'widgets',
+                case_augmenter=subject.HTTPCaseAugmenter(aug_dir),
+            )
+            result.use_body_type_magic = True
+            return result
+        
+        expected = list(case_provider(spec_dir, aug_dir).cases())
+        first = list(provider().cases())
+        first |should| equal_to(expected)
+        first[0]['fixtures'].append('modified')
+        with patch.object(subject, '_get_yaml_load_all', failing_load):
+            list(provider().cases()) |should| equal_to(expected)
+        SharingCaseProvider.parsed_case_cache.hits |should| equal_to(1)
+        
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            f.write("- {url: /gadgets, method: get}\n")
+        len(list(provider().cases())) |should| equal_to(3)
+        
+        unshared = subject.InterfaceCaseProvider(spec_dir, 'widgets', parsed_case_cache=ParsedCaseCache())
+        unshared.parsed_case_cache |should_not| be(SharingCaseProvider.parsed_case_cache)
+
+def test_duplicate_cases_reported():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        os.mkdir(os.path.join(spec_dir, 'widgets'))
+        extension_file = os.path.join(spec_dir, 'widgets', 'more.yml')
+        with open(extension_file, 'w') as f:
+            f.write(
+                "- {url: /gadgets, method: get}\n"
+                "# Same as the first case of the main file\n"
+                "- url: /widgets\n"
+                "  method: get\n"
+                "  response body: []\n"
+                "# Same request as the second case, different response\n"
+                "- url: /widgets\n"
+                "  method: post\n"
+                "  request body: {name: sprocket}\n"
+                "  response status: 400\n"
+            )
+        main_file = os.path.join(spec_dir, 'widgets.yml')
+        
+        provider = case_provider(spec_dir, aug_dir)
+        key_of_case = provider.case_augmenter.key_of_case
+        expected = [
+            subject.DuplicateCases(
+                key_of_case({'url': '/widgets', 'method': 'get'}),
+                [subject.CaseLocation(main_file, 1), subject.CaseLocation(extension_file, 3)],
+                False,
+            ),
+            subject.DuplicateCases(
+                key_of_case({'url': '/widgets', 'method': 'post', 'request body': {'name': 'sprocket'}}),
+                [subject.CaseLocation(main_file, 4), subject.CaseLocation(extension_file, 7)],
+                True,
+            ),
+        ]
+        provider.duplicate_cases() |should| equal_to(expected)
+        
+        with patch.object(subject.logger, 'warning') as warning:
+            list(provider.cases())
+        [call[0][1] for call in warning.call_args_list] |should| equal_to(
+            [report.description() for report in expected]
+        )
+        with patch.object(subject.logger, 'warning') as warning:
+            list(provider.cases(shard=0, of=1))
+        warning.call_count |should| equal_to(2)
+        
+        provider.check_duplicate_cases = False
+        with patch.object(subject.logger, 'warning') as warning:
+            list(provider.cases())
+        warning.call_count |should| equal_to(0)
+        
+        subject.InterfaceCaseProvider(spec_dir, 'widgets').duplicate_cases(
+            key_of_case=subject.HTTPCaseAugmenter.key_of_case,
+        ) |should| equal_to(expected)
+
+def test_string_pool_shares_loaded_strings():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        pool = StringPool()
+        provider = subject.InterfaceCaseProvider(spec_dir, 'widgets', string_pool=pool)
+        first, second = list(provider.cases())
+        first['url'] |should| equal_to(second['url'])
+        first['url'] |should| be(second['url'])
+        [k for k in first if k == 'url'][0] |should| be([k for k in second if k == 'url'][0])
+        
+        unpooled = list(subject.InterfaceCaseProvider(spec_dir, 'widgets').cases())
+        unpooled |should| equal_to([first, second])
+        
+        len(pool) |should_not| equal_to(0)
+        pool.intern(''.join(['/wid', 'gets'])) |should| be(first['url'])
+        long_string = 'x' * (pool.max_length + 1)
+        pool.intern(long_string) |should| be(long_string)
+        pool.intern('x' * (pool.max_length + 1)) |should_not| be(long_string)
+
+def test_compact_file_scanning_matches_parsing():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        with open(os.path.join(aug_dir, 'widgets.update.yml'), 'a') as f:
+            f.write(
+                "- url: /gadgets\n"
+                "  method: put\n"
+                "  fixtures: [a, {b: [1, 2]}]\n"
+                "  setup:\n"
+                "  - step one\n"
+                "  - {step: two}\n"
+                "  note: \"caf\\xE9 \\u2603\"\n"
+                "  script: |\n"
+                "    multi\n"
+                "    line\n"
+            )
+        subject.HTTPCaseAugmenter(aug_dir, case_key_scheme=BLAKE2_JSON_KEY_SCHEME).update_compact_files()
+        compact_path = os.path.join(aug_dir, 'widgets.yml')
+        
+        with open(compact_path) as stream:
+            indexer = compact_file.CaseIndexer()
+            for event in yaml.parse(stream):
+                indexer.read(event)
+            parsed = indexer.case_keys
+        len(parsed) |should| equal_to(3)
+        compact_file.scanned_case_keys(compact_path) |should| equal_to(parsed)
+        
+        with open(compact_path) as f:
+            content = f.read()
+        for noncanonical in (
+            "{" + parsed[0][0] + ": {}}\n",
+            "---\n" + content,
+            content + "\"quoted=\": {}\n",
+            content + "abc=: {note: caf\u00e9}\n",
+            "- " + content,
+        ):
+            with open(compact_path, 'w') as f:
+                f.write(noncanonical)
+            compact_file.scanned_case_keys(compact_path) |should| be(None)
+        
+        with open(compact_path, 'w') as f:
+            f.write(content + "abc=: {note: caf\u00e9}\n")
+        compact_file.case_keys(compact_path) |should| equal_to(parsed + [('abc=', len(content))])
+        
+        with open(compact_path, 'w') as f:
+            f.write("")
+        compact_file.scanned_case_keys(compact_path) |should| equal_to([])
+
+def test_compact_file_mapped_once():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        provider = case_provider(spec_dir, aug_dir)
+        augmenter = provider.case_augmenter
+        with patch.object(compact_file.mmap, 'mmap', wraps=compact_file.mmap.mmap) as mapping:
+            first = list(provider.cases())
+            list(provider.cases()) |should| equal_to(first)
+        mapping.call_count |should| equal_to(1)
+        [test_case['fixtures'] for test_case in first] |should| equal_to([['empty_widget_table'], []])
+        
+        augmenter.close()
+        with patch.object(compact_file.mmap, 'mmap', wraps=compact_file.mmap.mmap) as mapping:
+            list(provider.cases()) |should| equal_to(first)
+        mapping.call_count |should| equal_to(1)
+        
+        # Offsets are byte offsets, so entries of non-ASCII files are read from the map too
+        compact_path = os.path.join(aug_dir, 'widgets.yml')
+        with open(compact_path, encoding='utf-8') as f:
+            content = f.read()
+        with open(compact_path, 'w', encoding='utf-8') as f:
+            f.write("# café\n" + content)
+        with subject.HTTPCaseAugmenter(aug_dir) as augmenter:
+            with patch.object(compact_file.TestCaseAugmenter, '_load_yaml', failing_load):
+                augmenter.augmented_test_case(
+                    {'url': '/widgets', 'method': 'post', 'request body': {'name': 'sprocket'}}
+                )['fixtures'] |should| equal_to([])
+
+def test_mapped_compact_file_rewritten_by_another_augmenter():
+    get_case = {'url': '/widgets', 'method': 'get'}
+    post_case = {'url': '/widgets', 'method': 'post', 'request body': {'name': 'sprocket'}}
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        compact_path = os.path.join(aug_dir, 'widgets.yml')
+        with subject.HTTPCaseAugmenter(aug_dir) as augmenter:
+            augmenter.augmented_test_case(get_case)['fixtures'] |should| equal_to(['empty_widget_table'])
+            
+            # Another augmenter replaces the file
+            with open(os.path.join(aug_dir, 'widgets.update.yml'), 'w') as f:
+                f.write("- {url: /widgets, method: get, fixtures: [widget_table_with_a_much_longer_name]}\n")
+            subject.HTTPCaseAugmenter(aug_dir).update_compact_files()
+            os.remove(os.path.join(aug_dir, 'widgets.update.yml'))
+            augmenter.augmented_test_case(get_case)['fixtures'] |should| equal_to(
+                ['widget_table_with_a_much_longer_name']
+            )
+            augmenter.augmented_test_case(post_case)['fixtures'] |should| equal_to([])
+            
+            # Another process rewrites the file in place, shrinking it
+            with open(compact_path) as f:
+                content = f.read()
+            with open(compact_path, 'w') as f:
+                f.write(content.replace('widget_table_with_a_much_longer_name', 'w'))
+            augmenter.augmented_test_case(get_case)['fixtures'] |should| equal_to(['w'])
+            augmenter.augmented_test_case(post_case)['fixtures'] |should| equal_to([])
+
+def test_compact_file_update_replaces_file():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        compact_path = os.path.join(aug_dir, 'widgets.yml')
+        os.chmod(compact_path, 0o640)
+        inode = os.stat(compact_path).st_ino
+        with open(os.path.join(aug_dir, 'widgets.update.yml'), 'w') as f:
+            f.write("- {url: /widgets, method: get, fixtures: [widget_table]}\n")
+        subject.HTTPCaseAugmenter(aug_dir).update_compact_files()
+        
+        stat = os.stat(compact_path)
+        stat.st_ino |should_not| equal_to(inode)
+        (stat.st_mode & 0o777) |should| equal_to(0o640)
+        sorted(os.listdir(aug_dir)) |should| equal_to(['widgets.update.yml', 'widgets.yml'])
+
+def test_batch_augmentation():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        with open(os.path.join(aug_dir, 'gadgets.update.yml'), 'w') as f:
+            f.write("- {url: /gadgets, method: get, fixtures: [gadget_table]}\n")
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            f.write("- {url: /gadgets, method: get}\n- {url: /nothing, method: get}\n")
+        provider = case_provider(spec_dir, aug_dir)
+        expected = list(provider.cases())
+        [test_case.get('fixtures') for test_case in expected] |should| equal_to(
+            [['empty_widget_table'], [], ['gadget_table'], None]
+        )
+        
+        augmenter = provider.case_augmenter
+        augmenter.augment_all(reversed(expected)) |should| equal_to(list(reversed(expected)))
+        
+        provider.batch_augmentation = True
+        opened = []
+        real_open = open
+        def tracking_open(path, *args, **kwargs):
+            opened.append(path)
+            return real_open(path, *args, **kwargs)
+        with patch('builtins.open', tracking_open):
+            list(provider.cases()) |should| equal_to(expected)
+        sorted(
+            os.path.basename(path) for path in opened
+            if os.path.dirname(path) == aug_dir
+        ) |should| equal_to(['gadgets.update.yml', 'widgets.update.yml'])
+        
+        # Also when the case keys are stored
+        store = disk_cache.CaseKeyStore(os.path.join(root, 'cache'))
+        for _ in range(2):
+            stored_keys_provider = subject.InterfaceCaseProvider(
+                spec_dir,
+                'widgets',
+                case_augmenter=augmenter,
+                case_key_store=store,
+            )
+            stored_keys_provider.batch_augmentation = True
+            list(stored_keys_provider.cases()) |should| equal_to(expected)
+
+class ParallelHashingAugmenter(subject.HTTPCaseAugmenter):
+    parallel_hashing_threshold = 1
+
+def test_parallel_case_hashing():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        expected = list(case_provider(spec_dir, aug_dir).cases())
+        for cache in (None, CaseKeyCache()):
+            augmenter = ParallelHashingAugmenter(aug_dir, case_key_cache=cache)
+            provider = subject.InterfaceCaseProvider(spec_dir, 'widgets', case_augmenter=augmenter)
+            with patch.object(subject, '_hash_many', wraps=subject._hash_many) as hash_many, \
+                    patch.object(cases_module, 'hash_many', wraps=cases_module.hash_many) as cached_hash_many:
+                list(provider.cases()) |should| equal_to(expected)
+                provider.duplicate_cases() |should| equal_to([])
+            if cache is None:
+                hash_many.call_count |should| equal_to(2)
+            else:
+                # Keys found in the cache are not hashed again
+                cached_hash_many.call_count |should| equal_to(1)
+                len(cache) |should| equal_to(len(expected))
+                cache.hits |should| equal_to(len(expected))
+        
+        augmenter = OneArgumentKeyAugmenter(aug_dir)
+        augmenter.parallel_hashing_threshold = 1
+        with patch.object(subject, '_hash_many', failing_load):
+            augmenter.case_keys(expected) |should| equal_to(
+                [augmenter.case_key(test_case) for test_case in expected]
+            )
+
+def test_batch_augmentation_parses_each_file_once():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        with open(os.path.join(aug_dir, 'gadgets.update.yml'), 'w') as f:
+            for i in range(4):
+                f.write("- url: /gadgets/{0}\n  method: get\n  fixtures: [gadget_{0}]\n".format(i))
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            for i in (3, 1, 2):
+                f.write("- {{url: /gadgets/{}, method: get}}\n".format(i))
+        augmenter = subject.HTTPCaseAugmenter(aug_dir)
+        test_cases = subject.InterfaceCaseProvider(spec_dir, 'widgets').cases()
+        test_cases = list(test_cases)[::-1]
+        expected = [augmenter.augmented_test_case(test_case) for test_case in test_cases]
+        [test_case['fixtures'] for test_case in expected] |should| equal_to(
+            [['gadget_2'], ['gadget_1'], ['gadget_3'], [], ['empty_widget_table']]
+        )
+        
+        with patch.object(compact_file, '_yaml_parse', wraps=compact_file._yaml_parse) as compact_parse, \
+                patch.object(update_file, '_yaml_parse', wraps=update_file._yaml_parse) as update_parse:
+            augmenter.augment_all(test_cases) |should| equal_to(expected)
+        compact_parse.call_count |should| equal_to(1)
+        update_parse.call_count |should| equal_to(1)
+
+def test_batch_augmentation_of_entries_below_their_item_lines():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = make_spec_tree(root)
+        with open(os.path.join(aug_dir, 'gadgets.update.yml'), 'w') as f:
+            for i in range(3):
+                f.write("-\n  url: /gadgets/{0}\n  method: get\n  fixtures: [gadget_{0}]\n".format(i))
+        with open(os.path.join(spec_dir, 'widgets.yml'), 'a') as f:
+            for i in (2, 0, 1):
+                f.write("- {{url: /gadgets/{}, method: get}}\n".format(i))
+        provider = case_provider(spec_dir, aug_dir)
+        expected = list(provider.cases())
+        [test_case['fixtures'] for test_case in expected[2:]] |should| equal_to(
+            [['gadget_2'], ['gadget_0'], ['gadget_1']]
+        )
+        
+        provider.batch_augmentation = True
+        list(provider.cases()) |should| equal_to(expected)
+        provider.case_augmenter.augment_all(reversed(expected)) |should| equal_to(list(reversed(expected)))
+
+def test_augmentation_cache():
+    with tempfile.TemporaryDirectory() as root:
+        spec_dir, aug_dir = committed_spec_tree(root)
+        cache = AugmentationCache(16)
+        augmenter = subject.HTTPCaseAugmenter(aug_dir, augmentation_cache=cache)
+        provider = subject.InterfaceCaseProvider(spec_dir, 'widgets', case_augmenter=augmenter)
+        expected = list(provider.cases())
+        expected[0]['fixtures'] |should| equal_to(['empty_widget_table'])
+        len(cache) |should| equal_to(2)
+        
+        with patch.object(compact_file, 'DataValueReader', failing_load):
+            list(provider.cases()) |should| equal_to(expected)
+            augmenter.augment_all(expected) |should| equal_to(expected)
+            augmented = augmenter.augmented_test_case({'url': '/widgets', 'method': 'get'})
+        augmented['fixtures'].append('corrupted')
+        augmenter.augmented_test_case(
+            {'url': '/widgets', 'method': 'get'}
+        )['fixtures'] |should| equal_to(['empty_widget_table'])
+        
+        # Rewriting the compact file removes its entries
+        with open(os.path.join(aug_dir, 'widgets.update.yml'), 'w') as f:
+            f.write("- {url: /widgets, method: get, fixtures: [full_widget_table]}\n")
+        updating_augmenter = subject.HTTPCaseAugmenter(aug_dir, augmentation_cache=cache)
+        updating_augmenter.update_compact_files()
+        len(cache) |should| equal_to(0)
+
+def test_extend_updates_with_current_augmentation():
+    for scheme in (JSON_ASN1_KEY_SCHEME, BLAKE2_JSON_KEY_SCHEME):
+        with tempfile.TemporaryDirectory() as root:
+            spec_dir, aug_dir = committed_spec_tree(root, case_key_scheme=scheme)
+            extender = subject.HTTPCaseAugmenter(aug_dir).extend_updates('widgets')
+            extender.with_current_augmentation(StringIO("- {url: /widgets, method: get}\n"))
+            with open(extender.file_name) as f:
+                yaml.safe_load(f) |should| equal_to(
+                    [{'url': '/widgets', 'method': 'get', 'response body': [], 'fixtures': ['empty_widget_table']}]
+                )
@@ -1,7 +1,10 @@
 from intercom_test import http_best_matches as subject
+from intercom_test.cases import CaseKeyCache
+from intercom_test.utils import StringPool
 from base64 import b64encode
 from io import StringIO
 import json
+from unittest.mock import patch
 from should_dsl import should, should_not
 
 JSON_STR = """[{
@@ -625,3 +628,66 @@ def test_json_exchange_differentiate_on_addnl_field():
     result |should_not| contain('response status')
     result |should| contain(JsonDescStrings.ADDNL_FIELDS_SETS)
     result[JsonDescStrings.ADDNL_FIELDS_SETS] |should| include_all_of({'story': case['story']} for case in cases)
+
+def test_case_key_cache():
+    cache = CaseKeyCache()
+    cases = [
+        make_case('get', '/foo'),
+        make_case('post', '/foo', new_json_data()),
+    ]
+    db = subject.Database(cases, case_key_cache=cache)
+    db.get_case(make_case('post', '/foo', new_json_data())) |should| equal_to(cases[1])
+    db.get_case(make_case('get', '/foo')) |should| equal_to(cases[0])
+    cache.hits |should| equal_to(2)
+
+def test_parallel_hashing():
+    cases = [make_case('get', '/item/{}'.format(i)) for i in range(10)]
+    db = subject.Database(cases, parallel_hashing_threshold=5)
+    db.get_case(make_case('get', '/item/7')) |should| equal_to(cases[7])
+    
+    cache = CaseKeyCache()
+    db = subject.Database(cases, case_key_cache=cache, parallel_hashing_threshold=5)
+    len(cache) |should| equal_to(len(cases))
+    db.get_case(make_case('get', '/item/7')) |should| equal_to(cases[7])
+    cache.hits |should| equal_to(1)
+
+def test_subtree_memo_is_opt_in():
+    cases = [make_case('post', '/item/{}'.format(i), new_json_data()) for i in range(3)]
+    def failing_memo(*args, **kwargs):
+        raise AssertionError("subtrees should not have been memoized")
+    with patch.object(subject, 'SubtreeMemo', failing_memo):
+        subject.Database(cases)
+    
+    class MemoizingDatabase(subject.Database):
+        memoize_shared_subtrees = True
+    db = MemoizingDatabase(cases)
+    db.get_case(make_case('post', '/item/1', new_json_data())) |should| equal_to(cases[1])
+
+def test_apply_changes():
+    from intercom_test.framework import CaseChange
+    case = {'method': 'get', 'url': '/foo', 'response body': 'one'}
+    duplicate = dict(case, **{'response body': 'two'})
+    db = subject.Database([])
+    db.apply_changes([CaseChange('added', None, None, case)])
+    db.get_case({'method': 'get', 'url': '/foo'}) |should| be(case)
+    db.case_key(case) |should| equal_to(db.case_key({'method': 'get', 'url': '/foo'}))
+    
+    db.apply_changes([CaseChange('added', None, None, duplicate)])
+    db.apply_changes([CaseChange('removed', None, duplicate, None)])
+    db.get_case({'method': 'get', 'url': '/foo'}) |should| be(case)
+    
+    db.apply_changes([CaseChange('removed', None, case, None)])
+    db.get_case({'method': 'get', 'url': '/foo'}) |should| be(None)
+    db.best_matches({'method': 'get', 'url': '/foo'}) |should_not| be(None)
+
+def test_string_pool():
+    cases = [
+        json.loads('{"method": "get", "url": "/foo", "response body": {"id": 1}}'),
+        json.loads('{"method": "get", "url": "/foo", "request body": [{"id": 1}], "response body": null}'),
+    ]
+    pool = StringPool()
+    db = subject.Database(cases, string_pool=pool)
+    cases[0]['url'] |should| be(cases[1]['url'])
+    cases[1]['request body'][0] |should| equal_to(cases[0]['response body'])
+    [k for k in cases[1]['request body'][0]][0] |should| be([k for k in cases[0]['response body']][0])
+    db.get_case({'method': 'get', 'url': '/foo', 'request body': [{'id': 1}]}) |should| be(cases[1])
@@ -0,0 +1,56 @@
+import intercom_test as subject
+import os
+import subprocess
+import sys
+from should_dsl import should, should_not
+
+# Modules that importing the package must not import
+DEFERRED_MODULES = ('intercom_test.framework', 'yaml', 'pyasn1', 'Levenshtein')
+
+# Modules that loading test cases and matching requests must not import
+# (until pyasn1 encoding is used or a near-miss request is reported)
+OPTIONAL_MODULES = ('pyasn1', 'Levenshtein')
+
+def run_python(*args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(subject.__file__))]
+        + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else [])
+    )
+    return subprocess.run(
+        [sys.executable] + list(args),
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+def modules_loaded_by(code):
+    return run_python(
+        '-c', code + '\nimport sys; print("\\n".join(sys.modules))'
+    ).stdout.split()
+
+################################# TESTS #################################
+
+def test_package_import_defers_dependencies():
+    loaded = modules_loaded_by('import intercom_test')
+    for module_name in DEFERRED_MODULES:
+        loaded |should_not| contain(module_name)
+
+def test_framework_import_defers_optional_dependencies():
+    loaded = modules_loaded_by(
+        'import intercom_test.framework, intercom_test.http_best_matches'
+    )
+    for module_name in OPTIONAL_MODULES:
+        loaded |should_not| contain(module_name)
+
+def test_lazy_attributes():
+    from intercom_test import framework
+    from intercom_test.json_asn1 import types
+    subject.InterfaceCaseProvider |should| be(framework.InterfaceCaseProvider)
+    subject.JSON_ASN1_SOURCE |should| be(types.ASN1_SOURCE)
+    dir(subject) |should| contain('HTTPCaseAugmenter')
+    (getattr, subject, 'no_such_name') |should| throw(AttributeError)
+    types.JSONValue.__name__ |should| equal_to('JSONValue')
+    (getattr, types, 'NoSuchType') |should| throw(AttributeError)
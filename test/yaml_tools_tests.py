@@ -0,0 +1,248 @@
+from intercom_test import yaml_tools as subject
+from intercom_test.json_asn1.convert import SubtreeMemo, asn1_der
+from intercom_test.augmentation import compact_file, update_file
+from intercom_test.exceptions import DataParseError
+from io import StringIO
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import yaml
+from should_dsl import should, should_not
+
+CASES_YAML = """\
+- url: /widgets
+  method: get
+  request body: null
+- url: /widgets/12
+  method: PUT
+  request body: {name: sprocket, count: 3, price: 1.25, active: yes, tags: [a, b]}
+- url: /numbers
+  method: post
+  request body: [0x1F, 0o17, 1_000, -.inf, 6.02e23, ~, '12', "true"]
+- url: /anchored
+  method: post
+  request body:
+    base: &base {a: 1, b: [x, y]}
+    other: *base
+- url: /merged
+  method: post
+  request body:
+    <<: {a: 1, b: 2}
+    c: 3
+- url: /tagged
+  method: post
+  request body: !!str 42
+- url: /dates
+  method: get
+  request body: {1: one, 2.5: two, null: three, false: four}
+- url: /duplicate-keys
+  method: get
+  request body: {a: 1, a: 2}
+"""
+
+COMPACT_YAML = """\
+# Augmentation data, with some non-ASCII content: café
+abc123=:
+  description: "caf\u00e9 \u2603"
+  fixtures: [widgets, gadgets]
+déf456=:
+  note: |
+    multi-line
+    ☃ text
+  anchored: &x {a: 1}
+  aliased: *x
+ghi789=: {flow: mapping}
+"""
+
+EVENT_ATTRIBUTES = ('anchor', 'tag', 'implicit', 'value', 'style', 'flow_style', 'explicit')
+
+def requires_libyaml():
+    if not getattr(yaml, '__with_libyaml__', False):
+        raise unittest.SkipTest("PyYAML was built without libyaml")
+
+def event_description(event):
+    return (type(event).__name__,) + tuple(
+        getattr(event, attr, None) for attr in EVENT_ATTRIBUTES
+    ) + tuple(
+        (mark.index, mark.line, mark.column)
+        for mark in (event.start_mark, event.end_mark)
+    )
+
+def with_and_without_libyaml(fn):
+    results = []
+    for use_libyaml in (True, False):
+        with patch.object(subject, 'use_libyaml', use_libyaml):
+            results.append(fn())
+    return results
+
+def content_events_of_items():
+    events = list(yaml.parse(StringIO(CASES_YAML)))
+    # Strip stream, document and top-level sequence events
+    events = events[3:-3]
+    items = []
+    depth = 0
+    for event in events:
+        if depth == 0:
+            items.append([])
+        items[-1].append(event)
+        if isinstance(event, yaml.CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+    return items
+
+################################# TESTS #################################
+
+def test_der_from_event_stream_matches_constructed_value():
+    for item_events in content_events_of_items():
+        expected = asn1_der(subject.value_from_event_stream(item_events))
+        subject.der_from_event_stream(item_events) |should| equal_to(expected)
+
+def test_der_from_event_stream_key_filter():
+    key_fields = frozenset(('url', 'method'))
+    for item_events in content_events_of_items():
+        value = subject.value_from_event_stream(item_events)
+        expected = asn1_der(dict(
+            (k, v) for k, v in value.items()
+            if k in key_fields
+        ))
+        subject.der_from_event_stream(
+            item_events,
+            key_filter=key_fields.__contains__,
+        ) |should| equal_to(expected)
+
+def test_der_from_event_stream_reuses_aliased_encodings():
+    memo = SubtreeMemo()
+    anchored_events = content_events_of_items()[3]
+    expected = asn1_der(subject.value_from_event_stream(anchored_events))
+    subject.der_from_event_stream(
+        anchored_events,
+        subtree_memo=memo,
+    ) |should| equal_to(expected)
+    memo.hits |should| equal_to(1)
+
+def test_libyaml_parse_events_match():
+    requires_libyaml()
+    for doc in (CASES_YAML, COMPACT_YAML):
+        c_events, py_events = with_and_without_libyaml(lambda: [
+            event_description(e) for e in subject.parse(StringIO(doc))
+        ])
+        c_events |should| equal_to(py_events)
+
+def test_libyaml_loading_matches():
+    requires_libyaml()
+    for safe in (True, False):
+        c_loaded, py_loaded = with_and_without_libyaml(lambda: list(
+            subject.get_load_all_fn(safe=safe)(StringIO(CASES_YAML + "---\n" + COMPACT_YAML))
+        ))
+        c_loaded |should| equal_to(py_loaded)
+
+def test_libyaml_jump_indexes_match():
+    requires_libyaml()
+    with tempfile.TemporaryDirectory() as root:
+        compact_path = os.path.join(root, 'data.yml')
+        with open(compact_path, 'w', encoding='utf-8') as f:
+            f.write(COMPACT_YAML)
+        update_path = os.path.join(root, 'data.update.yml')
+        with open(update_path, 'w', encoding='utf-8') as f:
+            f.write(CASES_YAML)
+        
+        c_keys, py_keys = with_and_without_libyaml(
+            lambda: compact_file.case_keys(compact_path)
+        )
+        c_keys |should| equal_to(py_keys)
+        
+        c_index, py_index = with_and_without_libyaml(lambda: sorted(
+            (case_key, augmenter.offset)
+            for case_key, augmenter in update_file.index(
+                [update_path],
+                ('url', 'method'),
+            ).items()
+        ))
+        c_index |should| equal_to(py_index)
+
+def test_document_chunks():
+    text = "- a\n---\n- b\n--- # comment\n- c\n...\n---\n- '---'\n"
+    chunks = subject.document_chunks(text, 4)
+    "".join(chunks) |should| equal_to(text)
+    len(chunks) |should| equal_to(4)
+    [
+        list(yaml.safe_load_all(chunk)) for chunk in chunks
+    ] |should| equal_to([[['a']], [['b']], [['c']], [['---']]])
+    subject.document_chunks(text, 1000) |should| equal_to([text])
+    subject.document_chunks("%YAML 1.1\n" + text, 5) |should| equal_to(["%YAML 1.1\n" + text])
+
+def test_sequence_item_events():
+    items = list(subject.sequence_item_events(subject.parse(StringIO(CASES_YAML + "---\n- {url: /more}\n"))))
+    [
+        subject.value_from_event_stream(item_events) for item_events in items
+    ] |should| equal_to(yaml.safe_load(CASES_YAML) + [{'url': '/more'}])
+    [subject.is_self_contained(item_events) for item_events in items[3:5]] |should| equal_to([True, True])
+    
+    aliasing = list(subject.sequence_item_events(subject.parse(StringIO("- &a {x: 1}\n- {y: *a}\n"))))
+    [subject.is_self_contained(item_events) for item_events in aliasing] |should| equal_to([True, False])
+    
+    (lambda: list(subject.sequence_item_events(subject.parse(StringIO("{a: 1}\n"))))) |should| throw(DataParseError)
+    
+    styles = [
+        flow_style
+        for _, flow_style in subject.sequence_items(subject.parse(StringIO("- {x: 1}\n---\n[{x: 2}]\n")))
+    ]
+    styles |should| equal_to([False, True])
+
+def test_mapping_scalars():
+    keys = frozenset(('url', 'method', 'request body'))
+    items = content_events_of_items()
+    subject.mapping_scalars(items[0], keys) |should| equal_to(
+        {'url': '/widgets', 'method': 'get', 'request body': None}
+    )
+    # Collections as values for keys of interest can't be determined
+    subject.mapping_scalars(items[1], keys) |should| be(None)
+    subject.mapping_scalars(items[1], frozenset(('method', 'missing'))) |should| equal_to({'method': 'PUT'})
+    subject.mapping_scalars(items[5], keys) |should| equal_to(
+        {'url': '/tagged', 'method': 'post', 'request body': '42'}
+    )
+    
+    subject.mapping_scalars(
+        list(subject.parse(StringIO("{<<: {a: 1}, b: 2}")))[2:-2],
+        frozenset('b'),
+    ) |should| be(None)
+    subject.mapping_scalars(list(subject.content_events([1])), keys) |should| be(None)
+
+def test_mapping_entry_events():
+    keys = frozenset(('url', 'request body'))
+    items = content_events_of_items()
+    entries = subject.mapping_entry_events(items[3], keys)
+    dict(
+        (k, subject.value_from_event_stream(v)) for k, v in entries.items()
+    ) |should| equal_to(
+        {'url': '/anchored', 'request body': {'base': {'a': 1, 'b': ['x', 'y']}, 'other': {'a': 1, 'b': ['x', 'y']}}}
+    )
+    
+    def entries_of(text):
+        return subject.mapping_entry_events(list(subject.parse(StringIO(text)))[2:-2], keys)
+    entries_of("{<<: {url: /a}, b: 2}") |should| be(None)
+    entries_of("{x: &u /a, url: *u}") |should| be(None)
+    sorted(entries_of("{url: &u /a, x: *u}")) |should| equal_to(['url'])
+    subject.mapping_entry_events(list(subject.content_events([1])), keys) |should| be(None)
+
+def test_file_positions():
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, 'data.yml')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write("- café\r\n- ☃\n- x\r\n- y\n")
+        with open(path) as stream:
+            char_offsets = [
+                event.start_mark.index for event in subject.parse(stream)
+                if isinstance(event, yaml.ScalarEvent)
+            ]
+        with open(path, 'rb') as stream:
+            content = stream.read()
+        subject.file_positions(path, char_offsets + [None]) |should| equal_to([
+            content.index(b'caf'),
+            content.index('☃'.encode('utf-8')),
+            content.index(b'x'),
+            content.index(b'y'),
+            None,
+        ])